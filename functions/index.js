@@ -533,7 +533,8 @@ Text on Image:
             aiInfographicConcept: aiInfographicConcept,
             aiGeneratedImageUrl: "pending", // Set to "pending" status
             analysisTimestamp: admin.firestore.FieldValue.serverTimestamp(),
-            imageGenerationStatus: "pending" // Track image generation status
+            imageGenerationStatus: "pending", // Track image generation status
+            updatedAt: admin.firestore.FieldValue.serverTimestamp() // Watermark for the local monitor's query
         });
         console.log(`[analyzeStorySubmission] ✅ Writeup saved. Document ${storyId} is now viewable.`);
         
@@ -564,7 +565,8 @@ async function triggerImageGenerationForStory(storyId, aiInfographicConcept) {
     // Update status - local Python service will detect this and generate the image
     await db.collection('stories').doc(storyId).update({
       imageGenerationStatus: "pending",
-      imageGenerationStartedAt: admin.firestore.FieldValue.serverTimestamp()
+      imageGenerationStartedAt: admin.firestore.FieldValue.serverTimestamp(),
+      updatedAt: admin.firestore.FieldValue.serverTimestamp()
     });
     
     console.log(`[triggerImageGenerationForStory] ✅ Story ${storyId} marked for local image generation`);
@@ -572,7 +574,8 @@ async function triggerImageGenerationForStory(storyId, aiInfographicConcept) {
     console.error(`[triggerImageGenerationForStory] Error:`, error);
     await db.collection('stories').doc(storyId).update({
       imageGenerationStatus: "failed",
-      imageGenerationError: error.message
+      imageGenerationError: error.message,
+      updatedAt: admin.firestore.FieldValue.serverTimestamp()
     });
   }
 }
@@ -689,6 +692,8 @@ Return JSON with: {"title": "...", "keyMetrics": [{"label": "...", "value": "...
           aiInfographicConcept: aiInfographicConcept,
           aiGeneratedImageUrl: "Pending local generation",
           analysisTimestamp: admin.firestore.FieldValue.serverTimestamp(),
+          imageGenerationStatus: "pending", // Re-queue even if a previous render completed or failed
+          updatedAt: admin.firestore.FieldValue.serverTimestamp() // Watermark for the local monitor's query
         });
 
         console.log(`[triggerImageGeneration] Successfully updated document ${storyId} with concept. Local service will generate image.`);
@@ -712,6 +717,68 @@ Return JSON with: {"title": "...", "keyMetrics": [{"label": "...", "value": "...
   }
 );
 
+// Edit a story's infographic concept without discarding its image
+// A story that already has an image keeps its URL and "completed" status and gets conceptUpdatedAt, which the
+// local service's refresh query watches (USE_REFRESH_MODE) to re-render it with img2img from the old image.
+// A story without an image is simply queued for a normal render.
+exports.updateStoryConcept = onRequest(
+  {
+    region: 'us-central1',
+    timeoutSeconds: 60,
+  },
+  async (req, res) => {
+    cors(req, res, async () => {
+      if (req.method !== "POST") {
+        return res.status(405).json({ error: "Method Not Allowed. Use POST." });
+      }
+
+      try {
+        const { storyId, aiInfographicConcept } = req.body;
+        if (!storyId) {
+          return res.status(400).json({ error: "storyId is required in request body" });
+        }
+        if (!aiInfographicConcept || typeof aiInfographicConcept !== 'object' || !aiInfographicConcept.title) {
+          return res.status(400).json({ error: "aiInfographicConcept must be an object with a title" });
+        }
+
+        const docRef = db.collection('stories').doc(storyId);
+        const docSnap = await docRef.get();
+        if (!docSnap.exists) {
+          return res.status(404).json({ error: `Document ${storyId} not found` });
+        }
+
+        const imageUrl = docSnap.data().aiGeneratedImageUrl;
+        const hasImage = typeof imageUrl === 'string' && /^https?:\/\//.test(imageUrl);
+        const update = {
+          aiInfographicConcept: aiInfographicConcept,
+          updatedAt: admin.firestore.FieldValue.serverTimestamp()
+        };
+        if (hasImage) {
+          // Keep aiGeneratedImageUrl: the refresh render starts from it
+          update.conceptUpdatedAt = admin.firestore.FieldValue.serverTimestamp();
+        } else {
+          update.aiGeneratedImageUrl = "Pending local generation";
+          update.imageGenerationStatus = "pending";
+        }
+        await docRef.update(update);
+
+        console.log(`[updateStoryConcept] Updated concept for ${storyId} (${hasImage ? 'queued for refresh' : 'queued for generation'})`);
+        return res.status(200).json({
+          success: true,
+          storyId: storyId,
+          refresh: hasImage
+        });
+      } catch (error) {
+        console.error("[updateStoryConcept] Error:", error);
+        return res.status(500).json({
+          error: "Failed to update story concept",
+          message: error.message
+        });
+      }
+    });
+  }
+);
+
 exports.askChatbot = onRequest(
   { 
     region: 'us-central1',
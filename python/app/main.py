@@ -1,18 +1,289 @@
 # python/app/main.py (small test server)
-from fastapi import FastAPI, HTTPException, Response
+import os
+import sys
+import json
+import uuid
+import asyncio
+import threading
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from python.services.generate import generate_image_bytes
+from python.services.generate import (
+    GenerationCancelled,
+    coalescing_stats,
+    generate_candidate_bytes,
+    generate_image_bytes,
+    generate_image_bytes_shared,
+)
+from python.services.image_utils import (
+    bytes_to_data_uri_png,
+    iter_data_uri_png,
+    multipart_end,
+    multipart_part_head,
+)
+from python.services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_latest
+from python.services.previews import latents_to_preview_png
+from python.services.scheduler import get_scheduler
+from python.services.model_registry import get_registry
+from python.services.pipeline import MODEL_ID, get_pipeline, load_pipeline
+from python.services.profiling import get_profiler
+from python.services.samplers import PRESETS, SAMPLERS, model_supports_lcm, resolve_preset
+
+# Run the Firestore story monitor inside this process so both paths share one scheduler/pipeline.
+EMBED_STORY_MONITOR = os.environ.get("EMBED_STORY_MONITOR", "false").lower() in ("1", "true", "yes")
+MAX_CANDIDATES = int(os.environ.get("MAX_IMAGE_CANDIDATES", "4"))
+MAX_BATCH_PROMPTS = int(os.environ.get("MAX_BATCH_PROMPTS", "16"))
+# Jobs one batch keeps queued at a time, so single /generate requests still interleave with it.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "2"))
+# Model ids clients may request (comma separated); anything else would be a fresh Hugging Face download.
+ALLOWED_MODEL_IDS = {m.strip() for m in os.environ.get("ALLOWED_MODEL_IDS", MODEL_ID).split(",") if m.strip()}
+# When set, /admin/* requires a matching X-Admin-Token header.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
 
 app = FastAPI()
 
 class Req(BaseModel):
     prompt: str
     seed: int | None = None
+    model: str | None = None  # one of ALLOWED_MODEL_IDS; defaults to SD_MODEL_ID
+    candidates: int = 1  # >1: render N variants in one batch, return the best plus alternates as JSON
+    preset: str | None = None  # "draft", "standard" or "final"; sets sampler, steps and guidance
+    sampler: str | None = None  # e.g. "dpmpp_2m_karras", "euler_a", "unipc", "lcm"; overrides the preset's
+
+def _settings(preset: str | None, sampler: str | None, model: str | None) -> dict:
+    """Sampler, step count and guidance for a request (20 steps at 7.5 with the loaded sampler when unset)."""
+    if model is not None and model not in ALLOWED_MODEL_IDS:
+        raise HTTPException(status_code=422, detail=f"model must be one of {sorted(ALLOWED_MODEL_IDS)}")
+    if preset is not None and preset not in PRESETS:
+        raise HTTPException(status_code=422, detail=f"preset must be one of {sorted(PRESETS)}")
+    if sampler is not None and sampler not in SAMPLERS:
+        raise HTTPException(status_code=422, detail=f"sampler must be one of {sorted(SAMPLERS)}")
+    if sampler == "lcm" and not model_supports_lcm(model or get_registry().default_model_id):
+        raise HTTPException(status_code=422, detail="sampler 'lcm' needs an LCM-distilled model (see LCM_MODEL_IDS)")
+    settings = resolve_preset(preset, model or get_registry().default_model_id) if preset else \
+        {"sampler": None, "num_steps": 20, "guidance_scale": 7.5}
+    return {"sampler": sampler or settings["sampler"], "num_inference_steps": settings["num_steps"],
+            "guidance_scale": settings["guidance_scale"]}
 
 @app.post("/generate")
 async def gen(r: Req):
+    settings = _settings(r.preset, r.sampler, r.model)
     try:
-        png = generate_image_bytes(r.prompt, r.seed, num_inference_steps=20)
+        if r.candidates > 1:
+            ranked = await run_in_threadpool(generate_candidate_bytes, r.prompt, min(r.candidates, MAX_CANDIDATES),
+                                             r.seed, model_id=r.model, **settings)
+            best, alternates = ranked[0], ranked[1:]
+            return {
+                "image": bytes_to_data_uri_png(best["png"]),
+                "seed": best["seed"],
+                "score": best["score"],
+                "alternates": [
+                    {"image": bytes_to_data_uri_png(c["png"]), "seed": c["seed"], "score": c["score"]}
+                    for c in alternates
+                ],
+            }
+        png = await generate_image_bytes_shared(r.prompt, r.seed, model_id=r.model, **settings)
         return Response(content=png, media_type="image/png")
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
+
+class StreamReq(Req):
+    preview_every: int = 5  # send a latent preview every K steps (0 = progress only)
+
+@app.post("/generate/stream")
+async def gen_stream(r: StreamReq, request: Request):
+    """Server-sent events: `progress` each step, `preview` every K steps, then `done` or `error`."""
+    settings = _settings(r.preset, r.sampler, r.model)
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def emit(event, data=None):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    def on_step(step_index, total, latents):
+        if cancelled.is_set():
+            raise GenerationCancelled()
+        step = step_index + 1
+        emit("progress", {"step": step, "total": total})
+        if r.preview_every > 0 and latents is not None and step % r.preview_every == 0 and step < total:
+            emit("preview", {"step": step, "total": total, "image": bytes_to_data_uri_png(latents_to_preview_png(latents))})
+
+    def run():
+        try:
+            png = generate_image_bytes(r.prompt, r.seed, model_id=r.model, on_step=on_step, **settings)
+            emit("done", {"image": bytes_to_data_uri_png(png)})
+        except GenerationCancelled:
+            pass
+        except Exception as e:
+            emit("error", {"detail": str(e)})
+        finally:
+            emit(None)
+
+    threading.Thread(target=run, name="generate-stream", daemon=True).start()
+
+    async def stream():
+        try:
+            yield "event: queued\ndata: {}\n\n"
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            # Client went away (or we finished): stop denoising at the next step boundary.
+            cancelled.set()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class BatchItem(BaseModel):
+    prompt: str
+    seed: int | None = None
+
+class BatchReq(BaseModel):
+    items: list[BatchItem]
+    model: str | None = None
+    preset: str | None = None
+    sampler: str | None = None
+    format: str = "multipart"  # "multipart": binary PNG parts; "datauri": NDJSON lines with data-URI images
+
+@app.post("/generate/batch")
+async def gen_batch(r: BatchReq):
+    """Many prompts in one request; each image is streamed back as soon as it finishes (completion order).
+
+    multipart/mixed parts carry X-Batch-Index (position in `items`) and, when given, X-Seed; a failed item is an
+    application/json part with its error. The datauri format streams one JSON object per line instead.
+    """
+    if not 1 <= len(r.items) <= MAX_BATCH_PROMPTS:
+        raise HTTPException(status_code=422, detail=f"items must contain between 1 and {MAX_BATCH_PROMPTS} prompts")
+    if r.format not in ("multipart", "datauri"):
+        raise HTTPException(status_code=422, detail="format must be 'multipart' or 'datauri'")
+    settings = _settings(r.preset, r.sampler, r.model)
+    slots = asyncio.Semaphore(max(BATCH_CONCURRENCY, 1))
+
+    async def render(index: int, item: BatchItem):
+        async with slots:
+            try:
+                png = await generate_image_bytes_shared(item.prompt, item.seed, model_id=r.model, **settings)
+                return index, item, png, None
+            except Exception as e:
+                return index, item, None, str(e)
+
+    boundary = uuid.uuid4().hex
+
+    async def stream():
+        tasks = [asyncio.ensure_future(render(i, item)) for i, item in enumerate(r.items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                index, item, png, error = await finished
+                if r.format == "datauri":
+                    meta = {"index": index, "seed": item.seed}
+                    if png is None:
+                        yield json.dumps({**meta, "error": error}) + "\n"
+                        continue
+                    head, tail = json.dumps({**meta, "image": "__IMG__"}).split('"__IMG__"')
+                    yield head + '"'
+                    for chunk in iter_data_uri_png(png):
+                        yield chunk
+                    yield '"' + tail + "\n"
+                    continue
+                headers = {"X-Batch-Index": str(index)}
+                if item.seed is not None:
+                    headers["X-Seed"] = str(item.seed)
+                if png is None:
+                    body = json.dumps({"index": index, "error": error}).encode("utf-8")
+                    yield multipart_part_head(boundary, "application/json", len(body), headers) + body + b"\r\n"
+                    continue
+                yield multipart_part_head(boundary, "image/png", len(png), headers)
+                yield png
+                yield b"\r\n"
+            if r.format == "multipart":
+                yield multipart_end(boundary)
+        finally:
+            # Client went away: detach from renders not yet finished (shared runs with no waiters stop).
+            for task in tasks:
+                task.cancel()
+
+    if r.format == "datauri":
+        return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+    return StreamingResponse(stream(), media_type=f"multipart/mixed; boundary={boundary}",
+                             headers={"X-Accel-Buffering": "no"})
+
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    return get_scheduler().stats()
+
+@app.get("/generate/coalescing")
+def generate_coalescing_stats():
+    return coalescing_stats()
+
+@app.get("/presets")
+def presets():
+    return {"presets": PRESETS, "samplers": sorted(SAMPLERS)}
+
+@app.get("/models")
+def loaded_models():
+    return get_registry().stats()
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (includes the embedded story monitor's stages when enabled)."""
+    return Response(content=render_latest(), media_type=METRICS_CONTENT_TYPE)
+
+class ProfileReq(BaseModel):
+    generations: int = 1  # profile the next N generations the scheduler runs
+    sampling: bool = False  # also sample Python stacks (python_stacks.txt)
+
+def _require_admin(request: Request):
+    if ADMIN_TOKEN and request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="admin token required")
+
+@app.post("/admin/profile")
+def arm_profiler(r: ProfileReq, request: Request):
+    """Arm the torch profiler; captures land in PROFILE_DIR as they finish."""
+    _require_admin(request)
+    if not 1 <= r.generations <= 20:
+        raise HTTPException(status_code=422, detail="generations must be between 1 and 20")
+    return get_profiler().arm(r.generations, sampling=r.sampling)
+
+@app.get("/admin/profile")
+def profiler_status(request: Request):
+    _require_admin(request)
+    return get_profiler().status()
+
+def alias_service_modules():
+    # local_image_generator imports its siblings as top-level modules (`services.*`,
+    # `rag_image_retriever`); alias the already-loaded `python.services.*` modules so
+    # the monitor resolves the same scheduler singleton instead of a second copy.
+    import python.services
+    python_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if python_dir not in sys.path:
+        sys.path.insert(0, python_dir)
+    sys.modules.setdefault("services", python.services)
+    for name, module in list(sys.modules.items()):
+        if name.startswith("python.services."):
+            sys.modules.setdefault(name[len("python."):], module)
+
+def _configure_services():
+    # The registry and scheduler keep their first caller's loader and default model; claim them here so
+    # neither depends on whether the embedded monitor or a request happens to touch them first.
+    get_registry(load_pipeline, MODEL_ID)
+    get_scheduler(get_pipeline)
+
+def _start_embedded_monitor():
+    alias_service_modules()
+    import local_image_generator
+    threading.Thread(target=local_image_generator.monitor_firestore, name="story-monitor", daemon=True).start()
+
+app.add_event_handler("startup", _configure_services)
+if EMBED_STORY_MONITOR:
+    app.add_event_handler("startup", _start_embedded_monitor)
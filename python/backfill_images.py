@@ -0,0 +1,237 @@
+"""
+Image Backfill
+Pages through the whole stories collection with Firestore cursors and generates images for every
+story that has a concept but no image, using a bounded worker pool and a resumable cursor checkpoint
+--set-status is a one-off migration instead: it gives stories written before the monitor recorded
+completion the imageGenerationStatus their image URL implies, and an updatedAt where it is missing, so
+finished stories leave the monitor's "pending" query and unfinished ones match its watermark query
+
+Usage:
+    python backfill_images.py --workers 4 --rate 30
+    python backfill_images.py --dry-run
+    python backfill_images.py --reset   # ignore the checkpoint and start from the beginning
+    python backfill_images.py --set-status [--dry-run]
+"""
+import os
+import json
+import time
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import local_image_generator as generator
+from story_lease import has_valid_image
+
+logger = logging.getLogger("backfill")
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backfill_checkpoint.json")
+# Only the fields selection and process_story need; keeps page reads small
+STORY_FIELDS = [
+    "aiInfographicConcept", "aiGeneratedImageUrl", "nonShiftTitle", "storyTitle",
+    "imageLeaseOwner", "imageLeaseExpiresAt", "imageGenerationStatus", "updatedAt",
+]
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_checkpoint(path: str, state: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)  # atomic, so an interrupted write never corrupts the checkpoint
+
+
+class RateLimiter:
+    """Allows at most `per_minute` starts per minute, evenly spaced (0 = unlimited)"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def iter_pages(stories_ref, page_size: int, start_after_id: str = None):
+    """Yield lists of snapshots ordered by document id, resuming after start_after_id"""
+    cursor = stories_ref.document(start_after_id).get() if start_after_id else None
+    if cursor is not None and not cursor.exists:
+        logger.warning(f"Checkpoint document {start_after_id} no longer exists; restarting from the beginning")
+        cursor = None
+    while True:
+        query = stories_ref.select(STORY_FIELDS).order_by("__name__").limit(page_size)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        page = list(query.stream())
+        if not page:
+            return
+        yield page
+        cursor = page[-1]
+
+
+def implied_status(doc_data: dict):
+    """imageGenerationStatus a story's image URL implies (None: no concept yet, leave it alone)"""
+    if has_valid_image(doc_data):
+        return "completed"
+    if generator.story_needs_image(doc_data):
+        return "pending"
+    if doc_data.get("aiInfographicConcept"):
+        return "failed"  # concept, but the URL records an error
+    return None
+
+
+def run_set_status(args) -> dict:
+    """One-off migration: align imageGenerationStatus with the image URL and fill in missing updatedAt"""
+    totals = {"scanned": 0, "updated": 0}
+    stories_ref = generator.db.collection("stories")
+    for page in iter_pages(stories_ref, min(args.page_size, 500)):  # one batch per page; Firestore caps batches at 500
+        batch = generator.db.batch()
+        changed = 0
+        for snapshot in page:
+            doc_data = snapshot.to_dict() or {}
+            update = {}
+            status = implied_status(doc_data)
+            if status and doc_data.get("imageGenerationStatus") != status:
+                update["imageGenerationStatus"] = status
+            if status and doc_data.get("updatedAt") is None:
+                update["updatedAt"] = generator.firestore.SERVER_TIMESTAMP
+            if not update:
+                continue
+            changed += 1
+            if args.dry_run:
+                print(f"would set {snapshot.id}: {sorted(update)} (status {doc_data.get('imageGenerationStatus')} -> {status})")
+            else:
+                batch.update(snapshot.reference, update)
+        if changed and not args.dry_run:
+            batch.commit()
+        totals["scanned"] += len(page)
+        totals["updated"] += changed
+        logger.info(f"[Backfill] set-status: scanned={totals['scanned']} updated={totals['updated']}")
+    return totals
+
+
+def run_backfill(args) -> dict:
+    state = {} if args.reset else load_checkpoint(args.checkpoint)
+    totals = state.get("totals", {"scanned": 0, "selected": 0, "succeeded": 0, "failed": 0, "skipped": 0})
+    if state.get("cursor"):
+        logger.info(f"Resuming after story {state['cursor']} ({totals['scanned']} already scanned)")
+
+    limiter = RateLimiter(args.rate)
+    lock = threading.Lock()
+    started_at = time.monotonic()
+    last_report = started_at
+    done_this_run = 0
+    submitted_this_run = 0  # --limit counts this run's stories, not the checkpointed totals
+
+    def handle(doc_id: str, doc_data: dict):
+        nonlocal done_this_run
+        limiter.acquire()
+        t0 = time.monotonic()
+        result = generator.claim_and_process(doc_id, doc_data)
+        key = "skipped" if result is None else ("succeeded" if result else "failed")
+        with lock:
+            totals[key] += 1
+            done_this_run += 1
+        logger.info(f"[Backfill] {doc_id}: {key} in {time.monotonic() - t0:.1f}s")
+
+    def check_result(doc_id: str, future):
+        # handle() raising (rather than returning False) still counts as a failed story
+        nonlocal done_this_run
+        exc = future.exception()
+        if exc is not None:
+            with lock:
+                totals["failed"] += 1
+                done_this_run += 1
+            logger.error(f"[Backfill] {doc_id}: failed with {type(exc).__name__}: {exc}")
+
+    stories_ref = generator.db.collection("stories")
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="backfill") as executor:
+        for page in iter_pages(stories_ref, args.page_size, state.get("cursor")):
+            selected = []
+            for snapshot in page:
+                doc_data = snapshot.to_dict() or {}
+                if generator.story_needs_image(doc_data, retry_errors=args.retry_errors):
+                    selected.append((snapshot.id, doc_data))
+            totals["scanned"] += len(page)
+            totals["selected"] += len(selected)
+
+            page_complete = True
+            if args.dry_run:
+                for doc_id, doc_data in selected:
+                    title, _ = generator.extract_concept_fields(doc_data)
+                    print(f"would process {doc_id}: {title[:60]}")
+            else:
+                # Bounded in-flight work: never queue more than 2x workers ahead
+                pending = set()
+                for item in selected:
+                    if args.limit and submitted_this_run >= args.limit:
+                        page_complete = False
+                        break
+                    if len(pending) >= args.workers * 2:
+                        _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    future = executor.submit(handle, *item)
+                    future.add_done_callback(lambda f, doc_id=item[0]: check_result(doc_id, f))
+                    pending.add(future)
+                    submitted_this_run += 1
+                wait(pending)
+
+            # Checkpoint only after the whole page is finished, so a resume never skips a story
+            if not args.dry_run and page_complete:
+                state = {"cursor": page[-1].id, "totals": totals, "updatedAt": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                save_checkpoint(args.checkpoint, state)
+
+            now = time.monotonic()
+            if now - last_report >= args.report_every or args.dry_run:
+                elapsed = now - started_at
+                rate = done_this_run / elapsed * 3600 if elapsed else 0.0
+                logger.info(f"[Backfill] scanned={totals['scanned']} selected={totals['selected']} "
+                            f"ok={totals['succeeded']} failed={totals['failed']} skipped={totals['skipped']} "
+                            f"throughput={rate:.0f} stories/h")
+                last_report = now
+
+            if args.limit and submitted_this_run >= args.limit:
+                logger.info(f"[Backfill] Reached --limit {args.limit}")
+                break
+
+    elapsed = time.monotonic() - started_at
+    logger.info(f"[Backfill] Done in {elapsed:.0f}s: {totals}")
+    return totals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate images for historical stories that have a concept but no image")
+    parser.add_argument("--workers", type=int, default=max(generator.STORY_CONCURRENCY, 2), help="concurrent stories in flight")
+    parser.add_argument("--page-size", type=int, default=200, help="documents per Firestore page")
+    parser.add_argument("--rate", type=float, default=0, help="max stories started per minute (0 = unlimited)")
+    parser.add_argument("--limit", type=int, default=0, help="stop after processing this many stories in this run (0 = all)")
+    parser.add_argument("--retry-errors", action="store_true", help="also retry stories whose image URL records an error")
+    parser.add_argument("--dry-run", action="store_true", help="list stories that would be processed, change nothing")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="cursor checkpoint file")
+    parser.add_argument("--reset", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--report-every", type=float, default=60, help="seconds between throughput reports")
+    parser.add_argument("--set-status", action="store_true",
+                        help="migrate: set imageGenerationStatus/updatedAt on existing stories, generate nothing")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    cli_args = parse_args()
+    if cli_args.set_status:
+        run_set_status(cli_args)
+    else:
+        run_backfill(cli_args)
@@ -0,0 +1,121 @@
+"""
+Monitor Logging Overhead
+Time spent on the monitor thread logging one cycle's documents, before and after monitor_logging:
+  sync      - eager f-string INFO line per document, timestamp converted up front, written synchronously
+  async     - the same lines through enable_async_logging() (writes on a background thread)
+  sampled   - CycleLog records (lazy, sampled, capped) through the async queue, plus the cycle summary
+Output goes to a real file so the write cost is included. Prints a Markdown table of microseconds per document
+and lines written
+
+Usage:
+    python benchmarks/monitor_logging_overhead.py
+    python benchmarks/monitor_logging_overhead.py --docs 500 --cycles 40
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PYTHON_DIR = os.path.dirname(BENCH_DIR)
+if PYTHON_DIR not in sys.path:
+    sys.path.insert(0, PYTHON_DIR)
+
+import monitor_logging  # noqa: E402
+from monitor_logging import CycleLog, enable_async_logging, flush_async_logging  # noqa: E402
+
+
+def synthetic_docs(count: int):
+    now = datetime.now(timezone.utc)
+    return [(f"story-{i:06d}", {
+        "nonShiftTitle": f"Reducing flaring at platform {i} through a revised maintenance schedule",
+        "submittedAt": now,
+        "aiGeneratedImageUrl": None if i % 3 else f"https://storage.googleapis.com/bucket/images/story-{i:06d}.png",
+        "aiInfographicConcept": {"title": "t"},
+    }) for i in range(count)]
+
+
+def format_timestamp(ts) -> str:
+    return ts.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC") if ts else "unknown"
+
+
+def cycle_eager(logger, docs):
+    for doc_id, doc_data in docs:
+        submitted_str = format_timestamp(doc_data.get("submittedAt"))
+        title = doc_data.get("nonShiftTitle") or doc_data.get("storyTitle", "N/A")
+        logger.info(f"[Monitor Cycle] Doc {doc_id}: title='{title[:40]}', submitted={submitted_str}, "
+                    f"imageUrl='{str(doc_data.get('aiGeneratedImageUrl', 'NOT SET'))[:60]}', "
+                    f"hasConcept={bool(doc_data.get('aiInfographicConcept'))}")
+        logger.info(f"Found story needing image generation: {doc_id}")
+
+
+def cycle_sampled(logger, cycle_log, docs):
+    cycle_log.start()
+    for doc_id, doc_data in docs:
+        cycle_log.doc(
+            "seen", doc_id,
+            title=lambda d=doc_data: (d.get("nonShiftTitle") or d.get("storyTitle", "N/A"))[:40],
+            submitted=lambda d=doc_data: format_timestamp(d.get("submittedAt")),
+            imageUrl=lambda d=doc_data: str(d.get("aiGeneratedImageUrl", "NOT SET"))[:60],
+            hasConcept=bool(doc_data.get("aiInfographicConcept")),
+        )
+        cycle_log.doc("needs_image", doc_id, sample=False)
+    logger.info("[Monitor Cycle] %d docs; %s", len(docs), cycle_log.summary())
+
+
+def run_mode(mode: str, docs, cycles: int, path: str) -> dict:
+    logger = logging.getLogger(f"bench.monitor.{mode}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    file_handler = logging.FileHandler(path, mode="w", encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(file_handler)
+    if mode != "sync":
+        enable_async_logging(logger)
+    cycle_log = CycleLog(logger)
+    per_cycle = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        if mode == "sampled":
+            cycle_sampled(logger, cycle_log, docs)
+        else:
+            cycle_eager(logger, docs)
+        per_cycle.append(time.perf_counter() - started)
+    dropped = monitor_logging.dropped_records()
+    flush_async_logging()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    file_handler.close()
+    with open(path, "r", encoding="utf-8") as f:
+        lines = sum(1 for _ in f)
+    return {"mode": mode, "us_per_doc": statistics.median(per_cycle) / len(docs) * 1e6,
+            "lines": lines, "dropped": dropped}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Monitor-thread logging cost per document")
+    parser.add_argument("--docs", type=int, default=200, help="documents per cycle")
+    parser.add_argument("--cycles", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    docs = synthetic_docs(args.docs)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("sync", "async", "sampled"):
+            results.append(run_mode(mode, docs, args.cycles, os.path.join(tmp, f"{mode}.log")))
+
+    print(f"\n{args.docs} docs/cycle x {args.cycles} cycles, sample rate {monitor_logging.DOC_LOG_SAMPLE_RATE}, "
+          f"cap {monitor_logging.DOC_LOG_MAX_PER_CYCLE}/cycle\n")
+    print("| mode | us/doc (monitor thread) | lines written | dropped |")
+    print("|---|---:|---:|---:|")
+    for r in results:
+        print(f"| {r['mode']} | {r['us_per_doc']:.1f} | {r['lines']} | {r['dropped']} |")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Inference Pool Memory
+Host memory of the inference pool for each worker count: the parent's and every worker's RSS and PSS after each
+worker has rendered one image. Shared weights are counted in every process's RSS but split between them in PSS,
+so the PSS total is what the host actually pays; it should grow by roughly one worker's activations per
+extra worker, not by another copy of the weights. Prints a Markdown table (Linux only: reads /proc/<pid>/smaps_rollup)
+
+Usage:
+    python benchmarks/pool_memory.py
+    python benchmarks/pool_memory.py --workers 1 2 4 --steps 4 --size 384
+"""
+import os
+import sys
+import argparse
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PYTHON_DIR not in sys.path:
+    sys.path.insert(0, PYTHON_DIR)
+
+_MB = 1024 * 1024
+
+
+def smaps_rollup(pid: int) -> dict:
+    """{"rss": bytes, "pss": bytes} for one process"""
+    totals = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                totals[key.lower()] = int(value.split()[0]) * 1024
+    return totals
+
+
+def measure(pipeline_factory, workers: int, steps: int, size: int) -> dict:
+    from inference_pool import InferencePool
+
+    pool = InferencePool(pipeline_factory, num_workers=workers, max_jobs=0, max_rss_growth_mb=0)
+    try:
+        # One job per worker; jobs are taken from a shared queue, so send a few extra to reach all of them
+        futures = [pool.submit("Corporate infographic, flat design, teal and green", width=size, height=size,
+                               num_steps=steps, seed=i, path="bench") for i in range(workers * 2)]
+        for future in futures:
+            future.result(timeout=1800)
+        pids = [os.getpid()] + [w["pid"] for w in pool.worker_stats()["workers"]]
+        usage = [smaps_rollup(pid) for pid in pids]
+    finally:
+        pool.shutdown()
+    return {"workers": workers, "parent_rss": usage[0]["rss"], "worker_rss": max(u["rss"] for u in usage[1:]),
+            "total_rss": sum(u["rss"] for u in usage), "total_pss": sum(u["pss"] for u in usage)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inference pool RSS/PSS per worker count")
+    parser.add_argument("--model", default=os.environ.get("SD_MODEL_ID", "CompVis/stable-diffusion-v1-4"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args(argv)
+
+    import torch
+    from services.pipeline import load_pipeline
+
+    rows = [measure(lambda: load_pipeline(args.model, torch.float32, "cpu"), n, args.steps, args.size)
+            for n in args.workers]
+
+    print(f"\n{args.model}, {args.size}x{args.size}, {args.steps} steps, torch {torch.__version__}\n")
+    print("| workers | parent RSS MB | max worker RSS MB | total RSS MB | total PSS MB |")
+    print("|---:|---:|---:|---:|---:|")
+    for r in rows:
+        print(f"| {r['workers']} | {r['parent_rss'] / _MB:.0f} | {r['worker_rss'] / _MB:.0f} "
+              f"| {r['total_rss'] / _MB:.0f} | {r['total_pss'] / _MB:.0f} |")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Rate Limit Check
+Drives concurrent image requests through services.rate_limit against the stub backend server with a quota
+enforced (rolling-window count plus max in-flight, 429 + Retry-After when exceeded), and reports the
+throughput achieved against what the quota allows and how many requests were throttled. Run with
+--unlimited to see the same load without the limiter
+
+Passes (exit 0) when throughput is at least --min-efficiency of the quota and throttled responses stay
+under --max-throttled-share of all responses
+
+Usage:
+    python benchmarks/rate_limit_check.py
+    python benchmarks/rate_limit_check.py --per-minute 240 --server-concurrency 3 --workers 12 --duration 30
+    python benchmarks/rate_limit_check.py --unlimited
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PYTHON_DIR = os.path.dirname(BENCH_DIR)
+for path in (BENCH_DIR, PYTHON_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from standins import StubBackendServer, StubQuota  # noqa: E402
+from services.rate_limit import AdaptiveLimiter, RateLimited, call_with_limit  # noqa: E402
+
+
+def post(url: str) -> SimpleNamespace:
+    """urllib POST returning the status_code/headers shape the limiter reads from requests responses"""
+    request = urllib.request.Request(url, data=b"{}", headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            return SimpleNamespace(status_code=response.status, headers=response.headers)
+    except urllib.error.HTTPError as e:
+        return SimpleNamespace(status_code=e.code, headers=e.headers)
+
+
+def run_load(url: str, workers: int, duration: float, limiter=None) -> dict:
+    """`workers` threads send back to back for `duration` seconds"""
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+    outcome = {"ok": 0, "gave_up": 0}
+
+    def worker():
+        while time.monotonic() < deadline:
+            try:
+                if limiter is None:
+                    ok = post(url).status_code == 200
+                else:
+                    ok = call_with_limit(limiter, lambda: post(url), timeout=max(deadline - time.monotonic(), 0.01)).status_code == 200
+            except RateLimited:
+                ok = False
+            with lock:
+                outcome["ok" if ok else "gave_up"] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    outcome["elapsed"] = time.monotonic() - started
+    return outcome
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Throughput under a stub API quota, with and without the limiter")
+    parser.add_argument("--per-minute", type=float, default=120, help="quota enforced by the stub (and given to the limiter)")
+    parser.add_argument("--window", type=float, default=5.0,
+                        help="stub quota window in seconds (the quota is pro rata; 60 = real per-minute burst)")
+    parser.add_argument("--server-concurrency", type=int, default=3, help="max in-flight requests the stub accepts")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub response time in seconds")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent callers")
+    parser.add_argument("--max-concurrency", type=int, default=6, help="limiter's upper concurrency bound")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--unlimited", action="store_true", help="send without the limiter")
+    parser.add_argument("--min-efficiency", type=float, default=0.8)
+    parser.add_argument("--max-throttled-share", type=float, default=0.1)
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args(argv)
+
+    quota = StubQuota(args.per_minute, args.server_concurrency, args.window)
+    limiter = None if args.unlimited else AdaptiveLimiter(
+        "gemini", rate_per_minute=args.per_minute, max_concurrency=args.max_concurrency,
+        target_latency=max(args.latency * 4, 1.0))
+
+    with StubBackendServer(gemini_latency=args.latency, quotas={"gemini": quota}) as server:
+        outcome = run_load(f"{server.url}/v1beta/models/stub:generateContent", args.workers, args.duration, limiter)
+        counts = server.requests.snapshot()
+
+    served, throttled = counts.get("gemini", 0), counts.get("gemini.429", 0)
+    # Sustained best case: the quota rate, or the server's concurrency cap at this latency, whichever is lower
+    allowed_per_second = min(args.per_minute / 60.0, args.server_concurrency / args.latency)
+    achieved_per_second = served / outcome["elapsed"]
+    report = {
+        "mode": "unlimited" if args.unlimited else "limiter",
+        "served": served,
+        "throttled": throttled,
+        "throttled_share": round(throttled / max(served + throttled, 1), 3),
+        "gave_up": outcome["gave_up"],
+        "allowed_per_second": round(allowed_per_second, 3),
+        "achieved_per_second": round(achieved_per_second, 3),
+        "efficiency": round(achieved_per_second / allowed_per_second, 3),
+        "limiter": limiter.stats() if limiter else None,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if report["efficiency"] < args.min_efficiency:
+        failures.append(f"throughput {report['efficiency']:.0%} of quota < {args.min_efficiency:.0%}")
+    if report["throttled_share"] > args.max_throttled_share:
+        failures.append(f"{report['throttled_share']:.0%} of responses throttled > {args.max_throttled_share:.0%}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
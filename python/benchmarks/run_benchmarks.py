@@ -0,0 +1,349 @@
+"""
+Offline Benchmarks
+Replays synthetic story loads (derived from demo/production_data.csv) through process_story, retrieve_styles
+and POST /generate against in-memory Firestore/Storage, a local stub for the Gemini and Hugging Face APIs,
+and a fake (or tiny real) diffusion pipeline. Reports throughput, p50/p95/p99 latency, peak RSS and
+Firestore RPC counts; can save a baseline and exits non-zero when a run regresses past --threshold
+
+Usage:
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.2
+    python benchmarks/run_benchmarks.py --scenarios process_story --backends gemini --gemini-latency-ms 800
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PYTHON_DIR = os.path.dirname(BENCH_DIR)
+REPO_ROOT = os.path.dirname(PYTHON_DIR)
+for path in (PYTHON_DIR, REPO_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Keep the run hermetic: no trace files in the repo, no exporters, no background reaper or worker pool
+os.environ.setdefault("TRACE_FILE", os.path.join(tempfile.gettempdir(), "vera_bench_traces.jsonl"))
+os.environ.setdefault("USE_CONCEPT_REUSE", "false")
+os.environ.setdefault("MONITOR_METRICS_PORT", "0")
+os.environ.setdefault("MODEL_IDLE_TIMEOUT_SECONDS", "0")
+os.environ.setdefault("LOCAL_WORKER_POOL_SIZE", "0")
+
+from hires_generation import PeakRSS
+from story_lease import StoryLeaseManager
+from standins import (
+    CountingLeaseStore, FakeFirestore, FakePipeline, FakeStorage, RpcCounter, StubBackendServer,
+    offline_clients, tiny_pipeline_loader,
+)
+
+logger = logging.getLogger("benchmarks")
+
+DEFAULT_CSV = os.path.join(REPO_ROOT, "demo", "production_data.csv")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# Metric -> True when higher is worse. Counts are deterministic, so any increase is a regression.
+COMPARED_METRICS = {
+    "p50_ms": True, "p95_ms": True, "p99_ms": True, "peak_rss_mb": True, "throughput_per_s": False,
+}
+COUNT_METRICS = ("firestore_rpcs_per_item", "firestore_reads_per_item")
+MIN_LATENCY_DELTA_MS = 5.0  # ignore jitter on sub-millisecond stages
+
+
+def synthetic_stories(csv_path: str, count: int, seed: int = 7) -> List[Dict]:
+    """Story documents with infographic concepts built from production rows"""
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    rng = random.Random(seed)
+    stories = []
+    for i in range(count):
+        row = rows[i % len(rows)]
+        title = f"Production update {row['date']} #{i}"
+        metrics = [
+            {"label": "Oil", "value": f"{int(row['oil_bopd']) + rng.randint(-150, 150)} bopd"},
+            {"label": "Gas", "value": f"{row['gas_mmscf']} MMscf/d"},
+            {"label": "Downtime", "value": f"{row['downtime_hours']} h"},
+            {"label": "Water cut", "value": f"{row['water_cut_pct']}%"},
+        ]
+        stories.append({
+            "storyTitle": title,
+            "nonShiftTitle": title,
+            "aiInfographicConcept": {"title": title, "keyMetrics": metrics},
+            "aiGeneratedImageUrl": "pending",
+            "imageGenerationStatus": "pending",
+        })
+    return stories
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(latencies: List[float], failures: int, wall_seconds: float, peak_rss_bytes: int,
+              rpcs: Dict[str, int]) -> Dict:
+    values = sorted(latencies)
+    items = max(len(values) + failures, 1)
+    firestore_rpcs = sum(v for k, v in rpcs.items() if k.startswith("firestore.") and k != "firestore.docs_read")
+    return {
+        "count": len(values),
+        "failures": failures,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_s": round(len(values) / wall_seconds, 3) if wall_seconds else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        "peak_rss_mb": round(peak_rss_bytes / (1024 * 1024), 1),
+        "firestore_rpcs_per_item": round(firestore_rpcs / items, 3),
+        "firestore_reads_per_item": round(rpcs.get("firestore.docs_read", 0) / items, 3),
+        "rpcs": rpcs,
+    }
+
+
+def timed_run(fn, items, concurrency: int, rpcs: RpcCounter) -> Dict:
+    """Run fn(item) over items with `concurrency` threads; fn returns False for a failed item"""
+    latencies: List[float] = []
+    failures = 0
+    lock = threading.Lock()
+
+    def one(item):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            ok = fn(item) is not False
+        except Exception as e:
+            logger.warning(f"[Bench] item failed: {e}")
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                failures += 1
+
+    rpcs.reset()
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as executor:
+                list(executor.map(one, items))
+        else:
+            for item in items:
+                one(item)
+        wall = time.perf_counter() - started
+    return summarize(latencies, failures, wall, rss.peak_bytes, rpcs.snapshot())
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.rpcs = RpcCounter()
+        self.db = FakeFirestore(self.rpcs)
+        self.storage = FakeStorage(self.rpcs, upload_latency=args.upload_latency_ms / 1000)
+        self.stub = StubBackendServer(args.gemini_latency_ms / 1000, args.hf_latency_ms / 1000)
+        self.app_module = None
+        self.generator = None
+
+    def load(self, want_api: bool):
+        if want_api:
+            try:
+                import python.app.main as app_module
+                app_module.alias_service_modules()
+                self.app_module = app_module
+            except ImportError as e:
+                logger.warning(f"[Bench] FastAPI app unavailable ({e}); skipping the generate scenario")
+        # First caller's loader wins, so register the benchmark pipeline before anything loads a model
+        from services.model_registry import get_registry
+        if self.args.pipeline == "tiny":
+            loader = tiny_pipeline_loader()
+        else:
+            fake = FakePipeline(self.args.step_ms / 1000, self.args.decode_ms / 1000)
+            loader = lambda model_id, torch_dtype, device: fake
+        with offline_clients(self.db, self.storage):
+            import local_image_generator as generator
+        get_registry(loader, generator.MODEL_ID)
+        self.generator = generator
+
+    def configure_backend(self, backend: str):
+        g = self.generator
+        g.USE_GEMINI_3 = backend == "gemini"
+        g.GEMINI_API_KEY = "bench-key" if backend == "gemini" else None
+        g.GEMINI_API_BASE = self.stub.url
+        g.HF_TOKEN = "bench-token"
+        g.HF_API_BASE = self.stub.url
+        g._use_api_fallback = backend == "hf"
+        g.prompt_cache.clear()  # each backend run starts cold; repeats within a run still hit
+
+    def bench_process_story(self, backend: str) -> Dict:
+        self.configure_backend(backend)
+        stories_ref = self.db.collection("stories")
+        stories = synthetic_stories(self.args.csv, self.args.stories)
+        items = []
+        for i, story in enumerate(stories):
+            doc_id = f"{backend}-{i:05d}"
+            stories_ref.documents[doc_id] = dict(story)
+            items.append((doc_id, dict(story)))
+        if self.generator.USE_STORY_LEASES:
+            self.generator.lease_manager = StoryLeaseManager(CountingLeaseStore(stories_ref), owner_id="bench")
+        return timed_run(lambda item: self.generator.claim_and_process(*item), items, self.args.concurrency, self.rpcs)
+
+    def bench_retrieve_styles(self) -> Optional[Dict]:
+        retriever = self.generator.style_retriever
+        if retriever is None:
+            logger.warning("[Bench] RAG retriever unavailable; skipping retrieve_styles")
+            return None
+        kb_ref = self.db.collection("knowledgeBase")
+        if not kb_ref.documents:
+            for i in range(30):
+                content = f"Dashboard of production KPIs, chart {i}, teal palette"
+                doc = {"title": f"KB example {i}", "content": content, "imageUrl": f"https://example.invalid/{i}.png",
+                       "tags": ["production", "dashboard"], "category": "operations", "createdAt": i}
+                if retriever.semantic_model is not None:
+                    doc["embedding"] = [float(v) for v in retriever.semantic_model.encode(content, normalize_embeddings=True)]
+                kb_ref.documents[f"kb{i:03d}"] = doc
+        stories = synthetic_stories(self.args.csv, self.args.queries)
+
+        def query(story):
+            title, metrics = self.generator.extract_concept_fields(story)
+            return retriever.retrieve_styles(title, metrics, top_k=2) is not None
+        return timed_run(query, stories, 1, self.rpcs)
+
+    def bench_generate(self) -> Optional[Dict]:
+        if self.app_module is None:
+            return None
+        try:
+            from fastapi.testclient import TestClient
+        except ImportError as e:
+            logger.warning(f"[Bench] fastapi.testclient unavailable ({e}); skipping generate")
+            return None
+        client = TestClient(self.app_module.app)
+        rng = random.Random(11)
+        prompts = [f"Corporate infographic, production dashboard {i}" for i in range(self.args.requests)]
+        # A share of requests repeat an earlier prompt+seed to exercise single-flight coalescing
+        bodies = []
+        for i, prompt in enumerate(prompts):
+            if bodies and rng.random() < self.args.duplicate_ratio:
+                bodies.append(dict(rng.choice(bodies)))
+            else:
+                bodies.append({"prompt": prompt, "seed": i})
+
+        def request(body):
+            response = client.post("/generate", json=body)
+            return response.status_code == 200
+        return timed_run(request, bodies, self.args.concurrency, self.rpcs)
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or current is None:
+            continue
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if higher_is_worse else change < -threshold
+            if worse and metric.endswith("_ms") and abs(new - old) < MIN_LATENCY_DELTA_MS:
+                worse = False
+            if worse:
+                regressions.append(f"{name}.{metric}: {old} -> {new} ({change:+.0%})")
+        for metric in COUNT_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if old is not None and new is not None and new > old:
+                regressions.append(f"{name}.{metric}: {old} -> {new}")
+    return regressions
+
+
+def print_table(results: Dict):
+    print(f"{'scenario':<28}{'n':>5}{'fail':>6}{'thr/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'RSS MB':>9}{'fs rpc/it':>11}{'fs rd/it':>10}")
+    for name, r in results.items():
+        if r is None:
+            print(f"{name:<28}  skipped")
+            continue
+        print(f"{name:<28}{r['count']:>5}{r['failures']:>6}{r['throughput_per_s']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['peak_rss_mb']:>9}{r['firestore_rpcs_per_item']:>11}{r['firestore_reads_per_item']:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the image generation services")
+    parser.add_argument("--scenarios", default="process_story,retrieve_styles,generate")
+    parser.add_argument("--backends", default="local,gemini,hf", help="process_story backends: local, gemini, hf")
+    parser.add_argument("--pipeline", choices=["fake", "tiny"], default="fake", help="fake sleeps per step; tiny is a real tiny diffusers model")
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="production rows used to synthesize stories")
+    parser.add_argument("--stories", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50, help="retrieve_styles calls")
+    parser.add_argument("--requests", type=int, default=40, help="/generate requests")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.25, help="share of /generate requests repeating an earlier one")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--step-ms", type=float, default=5.0, help="fake pipeline time per denoising step")
+    parser.add_argument("--decode-ms", type=float, default=10.0, help="fake pipeline VAE decode time per image")
+    parser.add_argument("--gemini-latency-ms", type=float, default=200.0)
+    parser.add_argument("--hf-latency-ms", type=float, default=300.0)
+    parser.add_argument("--upload-latency-ms", type=float, default=20.0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="save results as the baseline")
+    parser.add_argument("--baseline", help="compare against this baseline and exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.20, help="allowed relative regression (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    harness = Harness(args)
+    results: Dict[str, Optional[Dict]] = {}
+    with harness.stub:
+        harness.load(want_api="generate" in scenarios)
+        if "process_story" in scenarios:
+            for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+                results[f"process_story[{backend}]"] = harness.bench_process_story(backend)
+        if "retrieve_styles" in scenarios:
+            results["retrieve_styles"] = harness.bench_retrieve_styles()
+        if "generate" in scenarios:
+            results["generate"] = harness.bench_generate()
+
+    print_table(results)
+    report = {
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "save_baseline", "baseline")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Warning: baseline was recorded with a different configuration")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
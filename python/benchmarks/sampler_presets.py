@@ -0,0 +1,97 @@
+"""
+Sampler Preset Benchmark
+Seconds per image for each quality preset (and optionally each sampler) on one loaded pipeline; samplers are
+swapped in place, so the weights load once. Prints a Markdown table for the README / PR description
+
+UNet evaluations per image = steps x 2 with classifier-free guidance (guidance_scale > 1), steps x 1 without:
+
+    preset     sampler                steps  guidance  UNet evals
+    draft      dpmpp_2m_karras          12      6.5        24
+    draft*     lcm                       4      1.0         4     (* LCM-distilled model or --lcm-lora)
+    standard   dpmpp_2m_karras          20      7.5        40
+    final      dpmpp_2m_sde_karras      32      7.5        64
+
+Usage:
+    python benchmarks/sampler_presets.py --images 3
+    python benchmarks/sampler_presets.py --samplers --size 448
+    python benchmarks/sampler_presets.py --lcm-lora latent-consistency/lcm-lora-sdv1-5 --model runwayml/stable-diffusion-v1-5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PYTHON_DIR not in sys.path:
+    sys.path.insert(0, PYTHON_DIR)
+
+
+def unet_evals(num_steps: int, guidance_scale: float) -> int:
+    return num_steps * (2 if guidance_scale > 1 else 1)
+
+
+def time_render(pipe, prompt: str, num_steps: int, guidance_scale: float, size: int, seed: int) -> float:
+    import torch
+    start = time.perf_counter()
+    with torch.no_grad():
+        pipe(prompt, num_inference_steps=num_steps, guidance_scale=guidance_scale, width=size, height=size,
+             generator=torch.Generator(device="cpu").manual_seed(seed))
+    return time.perf_counter() - start
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Seconds per image for each sampler preset")
+    parser.add_argument("--model", default=os.environ.get("SD_MODEL_ID", "CompVis/stable-diffusion-v1-4"))
+    parser.add_argument("--images", type=int, default=2, help="timed images per row (after one warm-up)")
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--samplers", action="store_true", help="also time every sampler at the standard preset's steps")
+    parser.add_argument("--lcm-lora", help="fuse this LCM-LoRA so the draft preset uses its few-step variant")
+    parser.add_argument("--json", help="also write the rows here")
+    args = parser.parse_args(argv)
+
+    import torch
+    from services import samplers
+    from services.pipeline import load_pipeline
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    pipe = load_pipeline(args.model, torch.float16 if device == "cuda" else torch.float32, device)
+    if args.lcm_lora:
+        pipe.load_lora_weights(args.lcm_lora)
+        pipe.fuse_lora()
+        samplers.LCM_MODEL_IDS.add(args.model)
+
+    prompt = "Corporate infographic for PETRONAS Upstream. Vertical layout. TEAL and GREEN colors. Flat design."
+    rows = [(name, samplers.resolve_preset(name, args.model)) for name in samplers.PRESETS]
+    if args.samplers:
+        standard = samplers.PRESETS["standard"]
+        rows += [(f"sampler:{name}", {"sampler": name, "num_steps": standard["num_steps"],
+                                      "guidance_scale": standard["guidance_scale"]})
+                 for name in samplers.SAMPLERS if name != "lcm" or args.lcm_lora]
+
+    results = []
+    for label, settings in rows:
+        with samplers.use_sampler(pipe, settings["sampler"]):
+            time_render(pipe, prompt, 2, settings["guidance_scale"], args.size, 0)  # warm-up (allocator, sampler tables)
+            timings = [time_render(pipe, prompt, settings["num_steps"], settings["guidance_scale"], args.size, seed)
+                       for seed in range(args.images)]
+        per_image = statistics.median(timings)
+        results.append({"preset": label, **settings, "unet_evals": unet_evals(settings["num_steps"], settings["guidance_scale"]),
+                        "seconds_per_image": round(per_image, 2), "seconds_per_step": round(per_image / settings["num_steps"], 3)})
+        print(f"{label}: {per_image:.2f}s/image", file=sys.stderr)
+
+    print(f"\n{args.model}, {args.size}x{args.size}, {device}, torch {torch.__version__}, {torch.get_num_threads()} threads\n")
+    print("| preset | sampler | steps | guidance | UNet evals | s/image | s/step |")
+    print("|---|---|---:|---:|---:|---:|---:|")
+    for r in results:
+        print(f"| {r['preset']} | {r['sampler']} | {r['num_steps']} | {r['guidance_scale']} | {r['unet_evals']} "
+              f"| {r['seconds_per_image']} | {r['seconds_per_step']} |")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
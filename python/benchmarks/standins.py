@@ -0,0 +1,420 @@
+"""
+Benchmark Stand-ins
+In-memory Firestore and Cloud Storage, a stub HTTP server for the Gemini and Hugging Face image APIs,
+and a fake diffusion pipeline, so the image pipeline can be benchmarked offline and deterministically
+"""
+import io
+import json
+import time
+import base64
+import random
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from PIL import Image
+
+from story_lease import InMemoryLeaseStore
+
+
+class RpcCounter:
+    """Thread-safe RPC tally shared by the Firestore and Storage stand-ins"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+def _resolve(value):
+    # firestore.SERVER_TIMESTAMP (a transforms.Sentinel) becomes a concrete timestamp on write
+    if type(value).__name__ == "Sentinel":
+        return datetime.now(timezone.utc)
+    return value
+
+
+def _resolve_all(updates: Optional[Dict]) -> Optional[Dict]:
+    return {k: _resolve(v) for k, v in updates.items()} if updates else updates
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict], fields: Optional[List[str]] = None):
+        self.id = doc_id
+        self.exists = data is not None
+        if data is not None and fields:
+            data = {k: v for k, v in data.items() if k in fields}
+        self._data = dict(data) if data is not None else None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, collection: "FakeCollection", doc_id: str):
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self):
+        self.collection.rpcs.add("firestore.get")
+        with self.collection.lock:
+            return FakeSnapshot(self.id, self.collection.documents.get(self.id))
+
+    def set(self, data: Dict, merge: bool = False):
+        self.collection.rpcs.add("firestore.write")
+        resolved = _resolve_all(data)
+        with self.collection.lock:
+            if merge and self.id in self.collection.documents:
+                self.collection.documents[self.id].update(resolved)
+            else:
+                self.collection.documents[self.id] = resolved
+
+    def update(self, data: Dict):
+        self.collection.rpcs.add("firestore.write")
+        with self.collection.lock:
+            if self.id not in self.collection.documents:
+                raise KeyError(f"No document to update: {self.id}")
+            self.collection.documents[self.id].update(_resolve_all(data))
+
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    "in": lambda a, b: a in b,
+}
+
+
+class FakeQuery:
+    """Covers the query surface the generator, retriever and backfill use"""
+
+    def __init__(self, collection: "FakeCollection", filters=(), orders=(), limit_count=None, fields=None, after=None):
+        self.collection = collection
+        self.filters = list(filters)
+        self.orders = list(orders)
+        self.limit_count = limit_count
+        self.fields = fields
+        self.after = after
+
+    def _copy(self, **changes):
+        state = dict(filters=self.filters, orders=self.orders, limit_count=self.limit_count,
+                     fields=self.fields, after=self.after)
+        state.update(changes)
+        return FakeQuery(self.collection, **state)
+
+    def where(self, field: str, op: str, value: Any):
+        return self._copy(filters=self.filters + [(field, op, value)])
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        return self._copy(orders=self.orders + [(field, direction)])
+
+    def limit(self, count: int):
+        return self._copy(limit_count=count)
+
+    def select(self, fields: List[str]):
+        return self._copy(fields=list(fields))
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot.id)
+
+    def stream(self):
+        with self.collection.lock:
+            items = [(doc_id, dict(data)) for doc_id, data in self.collection.documents.items()]
+        items = [(i, d) for i, d in items if all(_OPS[op](d.get(f), v) for f, op, v in self.filters)]
+        for field, direction in reversed(self.orders):
+            key = (lambda item: item[0]) if field == "__name__" else (lambda item, f=field: (item[1].get(f) is None, item[1].get(f)))
+            items.sort(key=key, reverse=str(direction).upper().startswith("DESC"))
+        if self.after is not None:
+            ids = [doc_id for doc_id, _ in items]
+            items = items[ids.index(self.after) + 1:] if self.after in ids else items
+        if self.limit_count is not None:
+            items = items[:self.limit_count]
+        # Billing model: one read per returned document, minimum one per query
+        self.collection.rpcs.add("firestore.query")
+        self.collection.rpcs.add("firestore.docs_read", max(len(items), 1))
+        return iter([FakeSnapshot(doc_id, data, self.fields) for doc_id, data in items])
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, name: str, rpcs: RpcCounter):
+        self.name = name
+        self.rpcs = rpcs
+        self.documents: Dict[str, Dict] = {}
+        self.lock = threading.RLock()
+        super().__init__(self)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocument:
+        return FakeDocument(self, doc_id or f"auto{random.getrandbits(48):012x}")
+
+    def add(self, data: Dict):
+        doc = self.document()
+        doc.set(data)
+        return None, doc
+
+
+class FakeFirestore:
+    """In-memory firestore.Client stand-in with RPC counting"""
+
+    def __init__(self, rpcs: Optional[RpcCounter] = None):
+        self.rpcs = rpcs or RpcCounter()
+        self._collections: Dict[str, FakeCollection] = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name: str) -> FakeCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name, self.rpcs)
+            return self._collections[name]
+
+
+class CountingLeaseStore(InMemoryLeaseStore):
+    """Lease transactions against a FakeFirestore collection's documents (one RPC per transaction)"""
+
+    def __init__(self, collection: FakeCollection):
+        super().__init__()
+        self.documents = collection.documents  # share, so lease fields land on the same stories
+        self._lock = collection.lock
+        self.rpcs = collection.rpcs
+
+    def run_transaction(self, doc_id, body):
+        self.rpcs.add("firestore.transaction")
+        return super().run_transaction(doc_id, lambda current: _resolve_all(body(current)))
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_file(self, file_obj, content_type: Optional[str] = None):
+        data = file_obj.read()
+        if self.bucket.latency:
+            time.sleep(self.bucket.latency)
+        self.bucket.rpcs.add("storage.upload")
+        self.bucket.rpcs.add("storage.bytes", len(data))
+        with self.bucket.lock:
+            self.bucket.objects[self.name] = len(data)
+
+    def make_public(self):
+        self.bucket.rpcs.add("storage.acl")
+
+
+class FakeBucket:
+    def __init__(self, name: str, rpcs: RpcCounter, latency: float):
+        self.name = name
+        self.rpcs = rpcs
+        self.latency = latency
+        self.objects: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+
+class FakeStorage:
+    """storage.Client stand-in; keeps object sizes only"""
+
+    def __init__(self, rpcs: Optional[RpcCounter] = None, upload_latency: float = 0.0):
+        self.rpcs = rpcs or RpcCounter()
+        self.upload_latency = upload_latency
+        self._buckets: Dict[str, FakeBucket] = {}
+
+    def bucket(self, name: str) -> FakeBucket:
+        if name not in self._buckets:
+            self._buckets[name] = FakeBucket(name, self.rpcs, self.upload_latency)
+        return self._buckets[name]
+
+
+def png_bytes(width: int = 64, height: int = 64, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class StubQuota:
+    """Server-side quota like the real APIs: `per_minute` requests (pro rata per rolling `window` seconds) and
+    `max_concurrent` in flight; anything over gets 429 with a Retry-After until the oldest request ages out"""
+
+    def __init__(self, per_minute: float, max_concurrent: Optional[int] = None, window: float = 60.0):
+        self.per_window = max(per_minute * window / 60.0, 1.0)
+        self.window = window
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._admitted: List[float] = []
+        self._in_flight = 0
+
+    def try_admit(self) -> Optional[int]:
+        """None if admitted (call release() afterwards), else the Retry-After to send"""
+        with self._lock:
+            now = time.monotonic()
+            self._admitted = [t for t in self._admitted if now - t < self.window]
+            if self.max_concurrent is not None and self._in_flight >= self.max_concurrent:
+                return 1
+            if len(self._admitted) >= self.per_window:
+                return max(int(self.window - (now - self._admitted[0])) + 1, 1)
+            self._admitted.append(now)
+            self._in_flight += 1
+            return None
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+class StubBackendServer:
+    """Local HTTP server answering Gemini generateContent and HF Inference API image requests
+
+    quotas={"gemini": StubQuota(...), "hf": ...} makes it enforce limits; rejected calls count as "<backend>.429".
+    """
+
+    def __init__(self, gemini_latency: float = 0.0, hf_latency: float = 0.0, image_size=(256, 448),
+                 quotas: Optional[Dict[str, StubQuota]] = None):
+        self.gemini_latency = gemini_latency
+        self.hf_latency = hf_latency
+        self.quotas = quotas or {}
+        self.requests = RpcCounter()
+        self._png = png_bytes(*image_size)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-backends", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path.endswith(":generateContent"):
+                    backend = "gemini"
+                elif self.path.startswith("/models/"):
+                    backend = "hf"
+                else:
+                    self.send_error(404)
+                    return
+                quota = stub.quotas.get(backend)
+                retry_after = quota.try_admit() if quota else None
+                if retry_after is not None:
+                    stub.requests.add(f"{backend}.429")
+                    body = json.dumps({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}).encode("utf-8")
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(retry_after))
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                stub.requests.add(backend)
+                try:
+                    if backend == "gemini":
+                        time.sleep(stub.gemini_latency)
+                        body = json.dumps({"candidates": [{"content": {"parts": [
+                            {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(stub._png).decode("ascii")}}
+                        ]}}]}).encode("utf-8")
+                        content_type = "application/json"
+                    else:
+                        time.sleep(stub.hf_latency)
+                        body, content_type = stub._png, "image/png"
+                finally:
+                    if quota:
+                        quota.release()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+
+class FakePipeline:
+    """Sleeps per denoising step and returns flat images; honours callback_on_step_end like diffusers"""
+
+    def __init__(self, step_seconds: float = 0.005, decode_seconds: float = 0.01):
+        self.step_seconds = step_seconds
+        self.decode_seconds = decode_seconds
+        self.components: Dict[str, Any] = {}
+        self.dtype = "float32"
+
+    def __call__(self, prompt, num_inference_steps: int = 25, width: int = 512, height: int = 512,
+                 num_images_per_prompt: int = 1, generator=None, callback_on_step_end=None, **kwargs):
+        for step in range(int(num_inference_steps)):
+            time.sleep(self.step_seconds)
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, 1000 - step, {"latents": None})
+        time.sleep(self.decode_seconds * num_images_per_prompt)
+        rng = random.Random(hash(prompt))
+        images = [Image.new("RGB", (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+                  for _ in range(num_images_per_prompt)]
+        return SimpleNamespace(images=images)
+
+    # Memory knobs the generator and hi-res mode toggle
+    def enable_attention_slicing(self, *args):
+        pass
+
+    def disable_attention_slicing(self):
+        pass
+
+    def enable_vae_tiling(self):
+        pass
+
+    def disable_vae_tiling(self):
+        pass
+
+    def enable_vae_slicing(self):
+        pass
+
+    def disable_vae_slicing(self):
+        pass
+
+
+def tiny_pipeline_loader(model_id: str = "hf-internal-testing/tiny-stable-diffusion-pipe"):
+    """Loader for a real but tiny diffusers pipeline (downloads once; exercises the actual call path)"""
+    def _load(_model_id, torch_dtype, device):
+        from diffusers import StableDiffusionPipeline
+        return StableDiffusionPipeline.from_pretrained(model_id, torch_dtype=torch_dtype, safety_checker=None).to(device)
+    return _load
+
+
+@contextmanager
+def offline_clients(db: FakeFirestore, storage_client: FakeStorage):
+    """Make local_image_generator's import-time Firebase/GCP setup return the stand-ins"""
+    with mock.patch("firebase_admin.initialize_app"), \
+            mock.patch("google.auth.default", return_value=(None, "bench")), \
+            mock.patch("google.cloud.firestore.Client", return_value=db), \
+            mock.patch("google.cloud.storage.Client", return_value=storage_client):
+        yield
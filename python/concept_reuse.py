@@ -0,0 +1,84 @@
+"""
+Concept Reuse Index
+Finds previously generated images whose infographic concept is a near-duplicate of a new story
+Uses the RAG retriever's sentence-transformer to embed concept text; the index persists to a local JSONL file
+"""
+import os
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "concept_index.jsonl")
+
+
+class ConceptReuseIndex:
+    """Nearest-neighbour lookup of concept embeddings -> generated image URL"""
+
+    def __init__(self, semantic_model, index_path: str = DEFAULT_INDEX_PATH, threshold: float = 0.92):
+        if semantic_model is None or np is None:
+            raise ValueError("Concept reuse needs the retriever's sentence-transformer and numpy")
+        self.semantic_model = semantic_model
+        self.index_path = index_path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: List[Dict] = []
+        self._matrix = None  # (n, dim) float32, rows L2-normalized
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        rows = []
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                rows.append(entry.pop("embedding"))
+                self._entries.append(entry)
+        if rows:
+            self._matrix = np.asarray(rows, dtype=np.float32)
+        logger.info(f"Loaded {len(self._entries)} concept embeddings from {self.index_path}")
+
+    def embed(self, concept_text: str):
+        return np.asarray(self.semantic_model.encode(concept_text, normalize_embeddings=True), dtype=np.float32)
+
+    def find_match(self, query, exclude_story_id: Optional[str] = None) -> Optional[Dict]:
+        """Best previous image at or above the threshold for an embed() vector: {storyId, imageUrl, similarity}"""
+        with self._lock:
+            if self._matrix is None or not self._entries:
+                return None
+            scores = self._matrix @ query
+            for idx in np.argsort(-scores):
+                similarity = float(scores[idx])
+                if similarity < self.threshold:
+                    return None
+                entry = self._entries[idx]
+                if entry["storyId"] != exclude_story_id:
+                    return {**entry, "similarity": round(similarity, 4)}
+        return None
+
+    def add(self, story_id: str, concept_text: str, image_url: str, vector=None):
+        vector = vector if vector is not None else self.embed(concept_text)
+        entry = {"storyId": story_id, "imageUrl": image_url, "text": concept_text[:300]}
+        with self._lock:
+            self._entries.append(entry)
+            row = vector.reshape(1, -1)
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({**entry, "embedding": [round(float(v), 6) for v in vector]}) + "\n")
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,171 @@
+"""
+Embedding Store
+Compact on-disk embedding matrices for the style and knowledge-base retrievers: rows are L2-normalized and kept
+as float16, or int8 with one float32 scale per row, in a .npy file opened with mmap so every process on the host
+shares the same pages. A small JSON table maps row -> id/metadata and points at the current matrix file
+
+Usage:
+    store = EmbeddingStore("kb")
+    store.write([("doc1", vector, {"title": "..."}), ...])
+    for row, score in store.top_k(query_vector, 3):
+        print(store.ids[row], score)
+
+Memory per 384-dim vector: Python float list ~12.3 KB, float32 1.5 KB, float16 768 B, int8 388 B (with scale)
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+EMBEDDING_STORE_DIR = os.environ.get("EMBEDDING_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embeddings"))
+EMBEDDING_STORE_DTYPE = os.environ.get("EMBEDDING_STORE_DTYPE", "float16").lower()  # float16 or int8
+SCORE_CHUNK_ROWS = 8192  # rows upcast per matmul; bounds the float32 scratch for big KBs
+
+
+def quantize(matrix, dtype: str = EMBEDDING_STORE_DTYPE) -> Tuple[Any, Optional[Any]]:
+    """L2-normalize rows and pack them; returns (packed matrix, per-row scales or None)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    matrix = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8)
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        packed = np.round(matrix / scales[:, None]).astype(np.int8)
+        return packed, scales.astype(np.float32)
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+
+class EmbeddingStore:
+    """One memory-mapped embedding matrix plus its id/metadata table; write() swaps in a new version atomically"""
+
+    def __init__(self, name: str, directory: str = EMBEDDING_STORE_DIR, dtype: str = EMBEDDING_STORE_DTYPE):
+        if np is None:
+            raise ValueError("Embedding store needs numpy")
+        self.name = name
+        self.directory = directory
+        self.dtype = dtype
+        self.table_path = os.path.join(directory, f"{name}.json")
+        self._lock = threading.Lock()
+        self._table_mtime = None
+        self.ids: List[str] = []
+        self.metadata: List[Dict] = []
+        self.matrix = None  # (n, dim) float16/int8, read-only memmap
+        self.scales = None  # (n,) float32 for int8 rows
+        self._index: Dict[str, int] = {}
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def refresh(self) -> bool:
+        """Re-open the matrix if another process (or write()) published a new version"""
+        try:
+            mtime = os.stat(self.table_path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._table_mtime:
+            return False
+        try:
+            with open(self.table_path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+            matrix = np.load(os.path.join(self.directory, table["vectors"]), mmap_mode="r")
+            scales = np.load(os.path.join(self.directory, table["scales"])) if table.get("scales") else None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"[Embeddings] Could not open store {self.name}: {e}")
+            return False
+        with self._lock:
+            self.ids = table["ids"]
+            self.metadata = table.get("metadata") or [{} for _ in self.ids]
+            self.matrix, self.scales = matrix, scales
+            self._index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+            self._table_mtime = mtime
+        logger.info(f"[Embeddings] Mapped {len(self.ids)} {table.get('dtype')} vectors for {self.name}")
+        return True
+
+    def row(self, doc_id: str) -> Optional[int]:
+        return self._index.get(doc_id)
+
+    def vector(self, row: int):
+        """One row dequantized to float32 (unit length up to quantization error)"""
+        vec = np.asarray(self.matrix[row], dtype=np.float32)
+        return vec * self.scales[row] if self.scales is not None else vec
+
+    def write(self, entries: Iterable[Tuple[str, Any, Dict]]):
+        """Publish (id, vector, metadata) rows as a new version; readers switch on their next refresh()"""
+        entries = list(entries)
+        os.makedirs(self.directory, exist_ok=True)
+        version_ns = time.time_ns()
+        version = f"{self.name}.{version_ns}"
+        table = {"dtype": self.dtype, "ids": [e[0] for e in entries], "metadata": [e[2] or {} for e in entries],
+                 "vectors": f"{version}.vectors.npy", "scales": None}
+        if entries:
+            packed, scales = quantize(np.stack([np.asarray(e[1], dtype=np.float32) for e in entries]), self.dtype)
+        else:
+            packed, scales = np.zeros((0, 0), dtype=np.float16), None
+        np.save(os.path.join(self.directory, table["vectors"]), packed)
+        if scales is not None:
+            table["scales"] = f"{version}.scales.npy"
+            np.save(os.path.join(self.directory, table["scales"]), scales)
+        # New files first, then the table: a reader sees the old version or the new one, never a mix
+        tmp_path = self.table_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(table, f)
+        os.replace(tmp_path, self.table_path)
+        self.refresh()
+        self._remove_stale(version_ns, keep={table["vectors"], table["scales"]})
+
+    def _remove_stale(self, version_ns: int, keep):
+        """Delete matrix files older than the version just written, unless the current table points at them"""
+        # Newer files may belong to a concurrent write() that has not published its table yet
+        try:
+            with open(self.table_path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+            keep = set(keep) | {table.get("vectors"), table.get("scales")}
+        except (OSError, ValueError):
+            pass
+        prefix = f"{self.name}."
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith(prefix) and filename.endswith(".npy")) or filename in keep:
+                continue
+            stamp = filename[len(prefix):].split(".", 1)[0]
+            if not stamp.isdigit() or int(stamp) >= version_ns:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass  # still mapped elsewhere (Windows); removed on a later write
+
+    def scores(self, query, rows: Optional[List[int]] = None):
+        """Cosine similarity of a unit query against stored rows, computed on the packed matrix in chunks"""
+        with self._lock:
+            matrix, scales = self.matrix, self.scales
+        if matrix is None or len(matrix) == 0:
+            return np.zeros(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-8)
+        if rows is not None:
+            matrix = matrix[rows]
+            scales = scales[rows] if scales is not None else None
+        out = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(matrix[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            out[start:start + len(chunk)] = chunk @ query
+        return out * scales if scales is not None else out
+
+    def top_k(self, query, k: int) -> List[Tuple[int, float]]:
+        scores = self.scores(query)
+        if len(scores) == 0:
+            return []
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        return [(int(i), float(scores[i])) for i in best[np.argsort(-scores[best])]]
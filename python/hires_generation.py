@@ -0,0 +1,291 @@
+"""
+High-Resolution Local Generation
+Low-memory mode for portrait renders (e.g. 768x1344) on CPU hosts: tiled + sliced VAE decode, chunked
+(sliced) attention sized to a memory budget, and an optional generate-then-upscale stage that renders at a
+base resolution and refines a Lanczos upscale with img2img on the same weights (no second model load)
+
+Peak memory is dominated by the UNet's first self-attention: (W/8 * H/8)^2 scores per head, for 8 heads
+(SD 1.x) x 2 (classifier-free guidance). Score-matrix size in fp32 (estimate_attention_mb):
+
+    resolution   unsliced   slice=4 (auto)   slice=1 (max)
+    512x512       1024 MB        256 MB           64 MB
+    512x896       3136 MB        784 MB          196 MB
+    768x1344     15876 MB       3969 MB          992 MB
+
+The VAE decoder at 768x1344 keeps several 128-channel full-resolution activations alive (~0.5 GB each);
+tiling caps that at one 512px tile.
+
+Measured peak RSS and wall time per resolution: NOT YET RECORDED. The development machine (1 vCPU, 5 GB RAM,
+no access to the model hub) cannot load SD v1-4, so the table below still needs a run on a generator host.
+The benchmark runs each resolution in a fresh process, with low-memory mode on and then off (plain pipeline
+call at full size), and prints the rows to paste here:
+
+    python hires_generation.py --benchmark --resolutions 512x512 512x896 768x1344 --steps 20 --low-memory both
+    python hires_generation.py --benchmark --resolutions 768x1344 --upscale always
+
+    resolution   low-memory   peak RSS (MB)   render (s)
+    (pending measurement)
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HIRES_MEMORY_BUDGET_MB = float(os.environ.get("HIRES_MEMORY_BUDGET_MB", "8192"))  # Whole-process budget for a hi-res render
+HIRES_UPSCALE = os.environ.get("HIRES_UPSCALE", "auto").lower()  # "auto" (only when direct won't fit), "always" or "never"
+VAE_DECODE_MB = 1024  # Headroom for tiled VAE decode, text encoder activations and allocator slack
+
+# Portrait target close to Gemini's 9:16 output; base_* is the first stage of generate-then-upscale
+HIRES_PROFILE = {
+    "width": 768, "height": 1344, "base_width": 512, "base_height": 896,
+    "num_steps": 25, "guidance_scale": 7.0, "refine_steps": 20, "refine_strength": 0.35,
+}
+
+# Candidate attention slice sizes, fastest first (None = unsliced)
+_SLICE_SIZES = (None, 8, 4, 2, 1)
+
+
+def estimate_attention_mb(width: int, height: int, heads: int = 8, batch: int = 2,
+                          slice_size: Optional[int] = None, bytes_per_value: int = 4) -> float:
+    """Size of the first self-attention score matrix for one chunk of `slice_size` heads (None = all)"""
+    tokens = (width // 8) * (height // 8)
+    chunk = heads * batch if slice_size is None else min(slice_size, heads * batch)
+    return tokens * tokens * bytes_per_value * chunk / (1024 * 1024)
+
+
+def plan_render(width: int, height: int, weights_mb: float, budget_mb: float = HIRES_MEMORY_BUDGET_MB,
+                upscale: str = HIRES_UPSCALE, profile: Dict = HIRES_PROFILE) -> Dict:
+    """Pick the render resolution and attention slice sizes that fit the budget"""
+    headroom = budget_mb - weights_mb - VAE_DECODE_MB
+
+    def fitting_slice(w: int, h: int):
+        for slice_size in _SLICE_SIZES:
+            if estimate_attention_mb(w, h, slice_size=slice_size) <= headroom:
+                return slice_size, True
+        return 1, False
+
+    slice_size, fits = fitting_slice(width, height)
+    if upscale == "never" or (upscale == "auto" and fits):
+        if not fits:
+            logger.warning(f"[HiRes] {width}x{height} exceeds the {budget_mb:.0f} MB budget even with slice=1; rendering anyway")
+        return {"width": width, "height": height, "slice_size": slice_size, "upscale": False}
+
+    # The img2img refine attends at the target size too; when even slice=1 won't fit, ship the plain upscale
+    base_w, base_h = profile["base_width"], profile["base_height"]
+    base_slice, base_fits = fitting_slice(base_w, base_h)
+    if not base_fits:
+        logger.warning(f"[HiRes] Base {base_w}x{base_h} exceeds the {budget_mb:.0f} MB budget even with slice=1")
+    return {"width": base_w, "height": base_h, "slice_size": base_slice, "upscale": True,
+            "refine": fits, "refine_slice": slice_size}
+
+
+@contextmanager
+def low_memory_mode(pipe, slice_size: Optional[int]):
+    """Tiled/sliced VAE and chunked attention for the duration of one render, then restore the defaults"""
+    pipe.enable_vae_tiling()
+    pipe.enable_vae_slicing()
+    if slice_size is None:
+        pipe.disable_attention_slicing()
+    else:
+        pipe.enable_attention_slicing(slice_size)
+    try:
+        yield pipe
+    finally:
+        pipe.disable_vae_tiling()
+        pipe.disable_vae_slicing()
+        if getattr(pipe, "_vera_compiled", None):
+            pipe.disable_attention_slicing()  # compiled pipelines keep fused SDPA attention
+        else:
+            pipe.enable_attention_slicing()  # load_pipeline's default ("auto")
+        gc.collect()
+
+
+def render_hires(pipe, prompt: str, negative_prompt: Optional[str] = None, width: int = HIRES_PROFILE["width"],
+                 height: int = HIRES_PROFILE["height"], num_steps: int = HIRES_PROFILE["num_steps"],
+                 guidance_scale: float = HIRES_PROFILE["guidance_scale"], generator=None,
+                 budget_mb: float = HIRES_MEMORY_BUDGET_MB, upscale: str = HIRES_UPSCALE,
+                 step_callback: Optional[Callable] = None) -> Image.Image:
+    """Render one large image within budget_mb, directly or via base render + upscale + img2img refine"""
+    import torch
+    from services.model_registry import pipeline_memory_bytes
+
+    weights_mb = pipeline_memory_bytes(pipe) / (1024 * 1024)
+    plan = plan_render(width, height, weights_mb, budget_mb, upscale)
+    logger.info(f"[HiRes] Target {width}x{height}: rendering {plan['width']}x{plan['height']} "
+                f"(attention slice={plan['slice_size']}, upscale={plan['upscale']}, weights={weights_mb:.0f} MB)")
+
+    with low_memory_mode(pipe, plan["slice_size"]), torch.no_grad():
+        image = pipe(
+            prompt,
+            negative_prompt=negative_prompt,
+            width=plan["width"],
+            height=plan["height"],
+            num_inference_steps=num_steps,
+            guidance_scale=guidance_scale,
+            generator=generator,
+            callback_on_step_end=step_callback,
+        ).images[0]
+        if not plan["upscale"]:
+            return image
+
+        upscaled = image.resize((width, height), Image.LANCZOS)
+        del image
+        gc.collect()
+        if not plan["refine"]:
+            logger.info(f"[HiRes] Refine pass would exceed the budget; returning the Lanczos upscale")
+            return upscaled
+        if plan["refine_slice"] is None:
+            pipe.disable_attention_slicing()
+        else:
+            pipe.enable_attention_slicing(plan["refine_slice"])
+        refine_callback = None
+        if step_callback is not None:
+            # Continue the base pass's step count so progress and preemption see one job
+            def refine_callback(p, step_index, timestep, callback_kwargs):
+                return step_callback(p, num_steps + step_index, timestep, callback_kwargs)
+        return img2img_pipeline(pipe)(
+            prompt,
+            image=upscaled,
+            negative_prompt=negative_prompt,
+            strength=HIRES_PROFILE["refine_strength"],
+            num_inference_steps=HIRES_PROFILE["refine_steps"],
+            guidance_scale=guidance_scale,
+            generator=generator,
+            callback_on_step_end=refine_callback,
+        ).images[0]
+
+
+def img2img_pipeline(pipe):
+    """Img2img view over the same modules (shares weights and their tiling/slicing state)"""
+    from diffusers import StableDiffusionImg2ImgPipeline
+    return StableDiffusionImg2ImgPipeline(**pipe.components)
+
+
+class PeakRSS:
+    """Samples this process's RSS in the background; uses psutil if present, else getrusage's maxrss"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+
+    def __enter__(self):
+        if self._process is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            import resource  # Unix only; ru_maxrss is in KB on Linux
+            self.peak_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return False
+
+
+def measure(width: int, height: int, steps: int, upscale: str, low_memory: bool = True) -> Dict:
+    """Load the pipeline and time one hi-res render in this process; returns peak RSS and wall time"""
+    import torch
+    from services.model_registry import default_device, default_dtype
+    from services.pipeline import load_pipeline
+
+    model_id = os.environ.get("SD_MODEL_ID", "CompVis/stable-diffusion-v1-4")
+    device = default_device()
+    with PeakRSS() as rss:
+        load_start = time.perf_counter()
+        pipe = load_pipeline(model_id, default_dtype(device), device)
+        load_seconds = time.perf_counter() - load_start
+        render_start = time.perf_counter()
+        prompt, generator = "Corporate infographic, teal and white, flat design", torch.Generator(device="cpu").manual_seed(0)
+        if low_memory:
+            render_hires(pipe, prompt, width=width, height=height, num_steps=steps, generator=generator, upscale=upscale)
+        else:
+            with torch.no_grad():  # baseline: one full-size pass, no tiling, slicing or upscale stage
+                pipe(prompt, width=width, height=height, num_inference_steps=steps, generator=generator)
+        render_seconds = time.perf_counter() - render_start
+    return {
+        "resolution": f"{width}x{height}",
+        "low_memory": low_memory,
+        "upscale": upscale if low_memory else "never",
+        "steps": steps,
+        "peak_rss_mb": round(rss.peak_bytes / (1024 * 1024)),
+        "load_seconds": round(load_seconds, 1),
+        "render_seconds": round(render_seconds, 1),
+        "budget_mb": HIRES_MEMORY_BUDGET_MB,
+    }
+
+
+def benchmark(resolutions, steps: int, upscale: str, low_memory: str = "on"):
+    """Measure each resolution in a fresh interpreter so peak RSS is not carried over between runs"""
+    modes = {"on": ["on"], "off": ["off"], "both": ["on", "off"]}[low_memory]
+    rows = []
+    for resolution in resolutions:
+        for mode in modes:
+            cmd = [sys.executable, os.path.abspath(__file__), "--measure", resolution, "--steps", str(steps),
+                   "--upscale", upscale, "--low-memory", mode]
+            logger.info(f"[HiRes] Benchmarking {resolution} (low-memory {mode}): {' '.join(cmd)}")
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                # An OOM kill here is itself the result for the unsliced baseline
+                logger.error(f"[HiRes] {resolution} failed: {result.stderr.strip()[-500:]}")
+                rows.append({"resolution": resolution, "low_memory": mode == "on", "upscale": upscale, "steps": steps,
+                             "error": result.returncode})
+                continue
+            rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    print("| resolution | low-memory | upscale | steps | peak RSS (MB) | load (s) | render (s) |")
+    print("|---|---|---|---|---|---|---|")
+    for row in rows:
+        mode = "on" if row["low_memory"] else "off"
+        if "error" in row:
+            print(f"| {row['resolution']} | {mode} | {row['upscale']} | {row['steps']} | failed ({row['error']}) | | |")
+        else:
+            print(f"| {row['resolution']} | {mode} | {row['upscale']} | {row['steps']} | {row['peak_rss_mb']} "
+                  f"| {row['load_seconds']} | {row['render_seconds']} |")
+    return rows
+
+
+def _parse_resolution(text: str):
+    width, height = (int(v) for v in text.lower().split("x"))
+    return width, height
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    parser = argparse.ArgumentParser(description="Low-memory hi-res render benchmark (peak RSS and wall time per resolution)")
+    parser.add_argument("--benchmark", action="store_true", help="measure every --resolutions entry in its own process")
+    parser.add_argument("--measure", help="internal: measure one WxH in this process and print a JSON line")
+    parser.add_argument("--resolutions", nargs="+", default=["512x512", "512x896", "768x1344"])
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--upscale", choices=["auto", "always", "never"], default=HIRES_UPSCALE)
+    parser.add_argument("--low-memory", choices=["on", "off", "both"], default="on",
+                        help="off/both: also time a plain full-size pipeline call for comparison")
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(*_parse_resolution(args.measure), args.steps, args.upscale, args.low_memory != "off")))
+    else:
+        benchmark(args.resolutions, args.steps, args.upscale, args.low_memory)
@@ -0,0 +1,335 @@
+"""
+Local Inference Worker Pool
+Runs N Stable Diffusion inference processes that share one set of read-only model weights
+The pipeline is loaded once in the parent, its modules are moved to shared memory, and the
+workers receive storage handles instead of copies, so RAM does not grow N times
+Workers start from a forkserver (or spawn) context, never a plain fork of the multi-threaded parent,
+so they do not inherit its locks, threads or logging handlers; each sets up its own stderr logging
+Workers are supervised: each reports its RSS after every job, retires between jobs once it has run
+WORKER_MAX_JOBS jobs or grown WORKER_MAX_RSS_GROWTH_MB past its post-warm-up size, and is replaced
+by a fresh process; jobs still queued are picked up by the other workers or the replacement. The parent
+hands each idle worker one job through that worker's own inbox and remembers which one, so a worker that
+dies (e.g. OOM-killed) fails only that job, or re-queues it if it never read it, and is restarted
+Workers run plain text-to-image jobs only: hi-res (USE_HIRES_MODE) and img2img refresh (USE_REFRESH_MODE)
+renders need the scheduler's in-process pipeline, so both are turned off (with a warning) when the pool is on
+"""
+import gc
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import torch
+import torch.multiprocessing as mp
+
+from services.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get("LOCAL_WORKER_POOL_SIZE", "0"))  # 0 disables the pool (1 = inference in one supervised child; turns off hi-res and refresh modes)
+THREADS_PER_WORKER = int(os.environ.get("LOCAL_WORKER_THREADS", "0"))  # 0 = cores / workers
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", "200"))  # Recycle a worker after this many jobs (0 = never)
+WORKER_MAX_RSS_GROWTH_MB = float(os.environ.get("WORKER_MAX_RSS_GROWTH_MB", "1024"))  # Recycle once RSS grows this far past the first job (0 = off)
+WORKER_MAX_RSS_MB = float(os.environ.get("WORKER_MAX_RSS_MB", "0"))  # Recycle above this absolute RSS, shared weights included (0 = off)
+POOL_JOB_TIMEOUT = float(os.environ.get("LOCAL_WORKER_JOB_TIMEOUT", "900"))  # Seconds a caller waits for a pool render (0 = forever)
+
+_SHARED_MODULES = ("unet", "vae", "text_encoder", "safety_checker")  # for pipelines without .components
+_STOP = None
+_CHECK_INTERVAL = 5.0  # seconds between liveness checks of the workers
+_MB = 1024 * 1024
+
+WORKER_JOB_RSS = histogram("vera_worker_job_rss_delta_bytes", "Worker RSS change across one inference job.", ["path"],
+                           buckets=(-64 * _MB, 0, 16 * _MB, 64 * _MB, 256 * _MB, 1024 * _MB))
+WORKER_RECYCLES = counter("vera_worker_recycles_total", "Inference workers replaced, by reason.", ["reason"])
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process: psutil, else /proc, else peak RSS from getrusage"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource  # Unix only; ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def share_pipeline_weights(pipe):
+    """Move every model in the pipeline into shared memory so worker processes map the same pages"""
+    # Anything left out (e.g. SD v1's ~1.2 GB safety checker) would be pickled into each worker as a private copy
+    components = getattr(pipe, "components", None) or {name: getattr(pipe, name, None) for name in _SHARED_MODULES}
+    shared_bytes = 0
+    for name, module in components.items():
+        if isinstance(module, torch.nn.Module):
+            module.eval()
+            module.share_memory()
+            shared_bytes += sum(t.numel() * t.element_size() for t in (*module.parameters(), *module.buffers()))
+    logger.info(f"[Pool] Shared {shared_bytes / _MB:.0f} MB of weights across workers")
+    return pipe
+
+
+def _retire_reason(jobs_done: int, rss: int, baseline_rss: Optional[int], max_jobs: int,
+                   max_growth_mb: float, max_rss_mb: float) -> Optional[str]:
+    if max_jobs and jobs_done >= max_jobs:
+        return "jobs"
+    if max_rss_mb and rss > max_rss_mb * _MB:
+        return "rss"
+    if max_growth_mb and baseline_rss is not None and rss - baseline_rss > max_growth_mb * _MB:
+        return "rss_growth"
+    return None
+
+
+def _worker_main(worker_index: int, pipe, num_threads: int, jobs, results, limits: Dict):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    logger.info(f"[Pool] Worker {worker_index} ready (pid={os.getpid()}, threads={num_threads})")
+    jobs_done = 0
+    baseline_rss = None  # after the first job, once allocator pools and caches are warm
+    while True:
+        job = jobs.get()
+        if job is _STOP:
+            break
+        job_id, path, params = job
+        rss_before = current_rss_bytes()
+        image, error = None, None
+        try:
+            seed = params.pop("seed", None)
+            generator = torch.Generator(device="cpu").manual_seed(int(seed)) if seed is not None else None
+            with torch.no_grad():
+                image = pipe(generator=generator, **params).images[0]
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        results.put(("done", job_id, image, error, (worker_index, path, rss_before, current_rss_bytes())))
+        # Drop this job's tensors and images before measuring what it left behind
+        image = None
+        gc.collect()
+        jobs_done += 1
+        rss = current_rss_bytes()
+        if baseline_rss is None:
+            baseline_rss = rss
+        reason = _retire_reason(jobs_done, rss, baseline_rss, **limits)
+        if reason:
+            # Exit between jobs: a job already handed to us stays in our inbox for the replacement
+            results.put(("retire", worker_index, os.getpid(), (reason, jobs_done, rss, baseline_rss)))
+            break
+
+
+def _fail(future: Future, exc: Exception):
+    """Fail a future whether or not it was dispatched yet; cancelled ones are left alone"""
+    if future.running() or future.set_running_or_notify_cancel():
+        future.set_exception(exc)
+
+
+def _drain(inbox) -> list:
+    """Whatever is still readable from a dead worker's inbox"""
+    items = []
+    try:
+        while True:
+            items.append(inbox.get_nowait())
+    except Exception:  # Empty, or a reader lock/partial message left behind by the dead worker
+        pass
+    inbox.close()
+    return items
+
+
+class InferencePool:
+    """Dispatches generation jobs across worker processes that share one pipeline's weights"""
+
+    def __init__(self, pipeline_factory: Callable, num_workers: int, threads_per_worker: int = 0,
+                 max_jobs: int = WORKER_MAX_JOBS, max_rss_growth_mb: float = WORKER_MAX_RSS_GROWTH_MB,
+                 max_rss_mb: float = WORKER_MAX_RSS_MB):
+        if num_workers < 1:
+            raise ValueError("num_workers must be >= 1")
+        cores = os.cpu_count() or 1
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(cores // num_workers, 1)
+        self._limits = {"max_jobs": max_jobs, "max_growth_mb": max_rss_growth_mb, "max_rss_mb": max_rss_mb}
+
+        # Kept for the life of the pool: replacement workers get the same shared weights
+        self._pipe = share_pipeline_weights(pipeline_factory())
+        # Not fork: the parent already runs the monitor, collector and logging threads
+        self._ctx = mp.get_context("forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn")
+        if self._ctx.get_start_method() == "forkserver":
+            # Preload torch and this module instead of re-running the caller's script (Firebase init etc.)
+            self._ctx.set_forkserver_preload([__name__])
+        self._inboxes = [self._ctx.Queue() for _ in range(num_workers)]
+        self._results = self._ctx.Queue()
+        self._pending: Dict[str, Future] = {}
+        self._backlog: deque = deque()  # (job_id, path, params) not yet handed to a worker
+        self._assigned: List[Optional[tuple]] = [None] * num_workers  # job handed to each worker and not finished
+        self._lock = threading.Lock()
+        self._closing = False
+        self.stats = {"recycles": 0, "crashes": 0, "jobs": 0, "requeued": 0}
+        self._workers = [self._start_worker(i) for i in range(num_workers)]
+        self._collector = threading.Thread(target=self._collect, name="sd-pool-collector", daemon=True)
+        self._collector.start()
+        logger.info(f"[Pool] Started {num_workers} inference workers x {self.threads_per_worker} threads "
+                    f"(recycle after {max_jobs or 'unlimited'} jobs or +{max_rss_growth_mb or 'unlimited'} MB RSS)")
+
+    def _start_worker(self, worker_index: int):
+        worker = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_index, self._pipe, self.threads_per_worker, self._inboxes[worker_index], self._results,
+                  self._limits),
+            name=f"sd-worker-{worker_index}",
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def _dispatch(self):
+        """Hand backlog jobs to workers with nothing assigned; call with self._lock held"""
+        for worker_index, assigned in enumerate(self._assigned):
+            while assigned is None and self._backlog:
+                job = self._backlog.popleft()
+                future = self._pending.get(job[0])
+                if future is None or not (future.running() or future.set_running_or_notify_cancel()):
+                    self._pending.pop(job[0], None)
+                    continue  # cancelled while queued (caller timed out)
+                assigned = self._assigned[worker_index] = job
+                self._inboxes[worker_index].put(job)
+
+    def _collect(self):
+        next_check = time.monotonic() + _CHECK_INTERVAL
+        while True:
+            try:
+                item = self._results.get(timeout=_CHECK_INTERVAL)
+            except queue.Empty:
+                item = ()
+            # On a timer rather than only when idle, so a busy results queue cannot hide a dead worker
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + _CHECK_INTERVAL
+            if item is _STOP:
+                break
+            if not item:
+                continue
+            kind = item[0]
+            if kind == "done":
+                self._finish(*item[1:])
+            elif kind == "retire":
+                self._replace(*item[1:])
+
+    def _finish(self, job_id: str, image, error: Optional[str], memory: tuple):
+        worker_index, path, rss_before, rss_after = memory
+        with self._lock:
+            future = self._pending.pop(job_id, None)
+            assigned = self._assigned[worker_index]
+            if assigned is not None and assigned[0] == job_id:
+                self._assigned[worker_index] = None
+            self.stats["jobs"] += 1
+            self._dispatch()
+        WORKER_JOB_RSS.observe(rss_after - rss_before, path=path)
+        logger.info(f"[Pool] Worker {worker_index} {path} job: RSS {rss_after / _MB:.0f} MB "
+                    f"({(rss_after - rss_before) / _MB:+.1f} MB)")
+        if future is None:
+            return
+        if error:
+            future.set_exception(RuntimeError(f"Inference worker failed: {error}"))
+        else:
+            future.set_result(image)
+
+    def _replace(self, worker_index: int, pid: int, retirement: tuple):
+        reason, jobs_done, rss, baseline_rss = retirement
+        worker = self._workers[worker_index]
+        if worker.pid != pid:
+            return  # _check_workers saw it exit first and already started its replacement
+        worker.join(timeout=30)
+        with self._lock:
+            if self._closing:
+                return
+            self.stats["recycles"] += 1
+        WORKER_RECYCLES.inc(reason=reason)
+        logger.info(f"[Pool] Recycling worker {worker_index} ({reason}): {jobs_done} jobs, RSS {rss / _MB:.0f} MB "
+                    f"(+{(rss - baseline_rss) / _MB:.0f} MB since its first job)")
+        self._workers[worker_index] = self._start_worker(worker_index)
+
+    def _check_workers(self):
+        """Restart workers that died without retiring; only the job they were handed is failed"""
+        for worker_index, worker in enumerate(self._workers):
+            if worker.is_alive() or self._closing:
+                continue
+            if worker.exitcode == 0:
+                # Retired between jobs; its retire message may still be queued and is dropped by pid
+                with self._lock:
+                    self.stats["recycles"] += 1
+                WORKER_RECYCLES.inc(reason="retired")
+                logger.info(f"[Pool] Worker {worker_index} (pid={worker.pid}) retired; restarting")
+                self._workers[worker_index] = self._start_worker(worker_index)
+                continue
+            future = None
+            with self._lock:
+                job, self._assigned[worker_index] = self._assigned[worker_index], None
+                # A worker killed inside get() can leave its inbox locked, so the replacement gets a new one
+                stranded = _drain(self._inboxes[worker_index])
+                self._inboxes[worker_index] = self._ctx.Queue()
+                if job is not None and any(item is not _STOP and item[0] == job[0] for item in stranded):
+                    self._backlog.appendleft(job)  # died before taking it: run it elsewhere
+                    self.stats["requeued"] += 1
+                elif job is not None:
+                    future = self._pending.pop(job[0], None)
+                self.stats["crashes"] += 1
+            WORKER_RECYCLES.inc(reason="crash")
+            logger.error(f"[Pool] Worker {worker_index} (pid={worker.pid}) died with exit code {worker.exitcode}; restarting")
+            if future is not None:
+                future.set_exception(RuntimeError(f"Inference worker {worker_index} died (exit code {worker.exitcode})"))
+            self._workers[worker_index] = self._start_worker(worker_index)
+            with self._lock:
+                self._dispatch()
+
+    def submit(self, prompt: str, width: int = 512, height: int = 512, num_steps: int = 30,
+               guidance_scale: float = 7.5, negative_prompt: Optional[str] = None,
+               seed: Optional[int] = None, path: str = "generate") -> Future:
+        """Queue one render; `path` labels the calling code path in per-job memory reports"""
+        job_id = uuid.uuid4().hex
+        future: Future = Future()
+        with self._lock:
+            self._pending[job_id] = future
+            self._backlog.append((job_id, path, {
+                "prompt": prompt,
+                "width": width,
+                "height": height,
+                "num_inference_steps": num_steps,
+                "guidance_scale": guidance_scale,
+                "negative_prompt": negative_prompt,
+                "seed": seed,
+            }))
+            self._dispatch()
+        return future
+
+    def generate(self, *args, timeout: Optional[float] = None, **kwargs):
+        """Blocking helper: submit a job and wait for its PIL image"""
+        return self.submit(*args, **kwargs).result(timeout=timeout)
+
+    def worker_stats(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "backlog": len(self._backlog),
+                    "workers": [{"index": i, "pid": w.pid, "alive": w.is_alive(),
+                                 "running": self._assigned[i][0] if self._assigned[i] else None}
+                                for i, w in enumerate(self._workers)]}
+
+    def shutdown(self):
+        with self._lock:
+            self._closing = True
+        for inbox in self._inboxes:
+            inbox.put(_STOP)
+        deadline = time.monotonic() + 30
+        for worker in self._workers:
+            worker.join(timeout=max(deadline - time.monotonic(), 0.1))
+        self._results.put(_STOP)
+        self._collector.join(timeout=5)
+        with self._lock:
+            for future in self._pending.values():
+                _fail(future, RuntimeError("Inference pool shut down"))
+            self._pending.clear()
+            self._backlog.clear()
@@ -6,18 +6,42 @@ Uses diffusers with local GPU (much faster than Cloud Functions!)
 import os
 import json
 import time
+import random
+import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import List, Optional
 
 import torch
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+from diffusers import StableDiffusionPipeline
 from PIL import Image
 from google.cloud import firestore
 from google.cloud import storage
 from firebase_admin import initialize_app, credentials
 import requests
 from rag_image_retriever import ImageStyleRetriever
+from story_lease import StoryLeaseManager, FirestoreLeaseStore, lease_is_active, WORKER_ID
+from inference_pool import InferencePool, POOL_JOB_TIMEOUT, POOL_SIZE, THREADS_PER_WORKER, current_rss_bytes
+from services.scheduler import Priority, get_scheduler
+from services.model_registry import get_registry
+from services.samplers import DEFAULT_SAMPLER, apply_sampler
+from services.compilation import PIPELINE_COMPILE, maybe_compile
+from services.rate_limit import RateLimited, call_with_limit, get_limiter
+from services.profiling import install_signal_handlers
+from services.candidate_scoring import rank_candidates
+from concept_reuse import ConceptReuseIndex
+from prompt_cache import PromptCache, PromptEntry
+from monitor_logging import CycleLog, dropped_records, enable_async_logging
+from hires_generation import HIRES_PROFILE, render_hires
+from story_refresh import (
+    CONCEPT_EDITED_FIELD, CONCEPT_HASH_FIELD, REFRESH_STEPS, REFRESH_STRENGTH, SEED_FIELD, ImageCache, concept_fingerprint,
+    render_refresh, story_needs_refresh,
+)
+from tracing import current_trace_id, start_span
+from services.metrics import (
+    BACKEND_SELECTED, FIRESTORE_COMMIT, IMAGE_ENCODE, RAG_RETRIEVAL, RETRIES, UPLOAD, cache_lookup, start_exporter,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,7 +56,21 @@ BUCKET_NAME = os.environ.get("IMAGE_BUCKET_NAME", "systemicshiftv2.firebasestora
 IMAGE_FOLDER = os.environ.get("IMAGE_FOLDER", "generated_images")
 HF_TOKEN = os.environ.get("HF_API_TOKEN")  # Set this in your environment
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")  # Gemini 3 API key (preferred for image gen)
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")  # Overridable for local stubs
+HF_API_BASE = os.environ.get("HF_API_BASE", "https://api-inference.huggingface.co")  # Overridable for local stubs
 USE_GEMINI_3 = os.environ.get("USE_GEMINI_3", "true").lower() in ("1", "true", "yes")  # Default to Gemini 3
+IMAGE_CANDIDATES = int(os.environ.get("IMAGE_CANDIDATES", "1"))  # >1: batch N local variants and keep the best
+USE_CONCEPT_REUSE = os.environ.get("USE_CONCEPT_REUSE", "false").lower() in ("1", "true", "yes")  # Reuse images of near-duplicate concepts
+CONCEPT_REUSE_THRESHOLD = float(os.environ.get("CONCEPT_REUSE_THRESHOLD", "0.92"))  # Cosine similarity needed to reuse
+METRICS_PORT = int(os.environ.get("MONITOR_METRICS_PORT", "0"))  # Serve Prometheus /metrics from the monitor on this port (0 = off)
+PROFILE_SIGNAL_GENERATIONS = int(os.environ.get("PROFILE_SIGNAL_GENERATIONS", "1"))  # Generations profiled per SIGUSR1/SIGUSR2
+USE_HIRES_MODE = os.environ.get("USE_HIRES_MODE", "false").lower() in ("1", "true", "yes")  # Try a 768x1344 low-memory render before the 512px profiles (not with LOCAL_WORKER_POOL_SIZE > 0)
+USE_REFRESH_MODE = os.environ.get("USE_REFRESH_MODE", "false").lower() in ("1", "true", "yes")  # img2img re-render when an imaged story's concept changes (not with LOCAL_WORKER_POOL_SIZE > 0)
+USE_STORY_LEASES = os.environ.get("USE_STORY_LEASES", "true").lower() in ("1", "true", "yes")  # Claim stories before generating (multi-worker safe)
+if POOL_SIZE > 0 and (USE_HIRES_MODE or USE_REFRESH_MODE):
+    # Pool workers only run text-to-image jobs; hi-res and refresh renders need the scheduler's pipeline
+    logger.warning("LOCAL_WORKER_POOL_SIZE > 0: hi-res and refresh modes are turned off (pool workers render text-to-image only)")
+    USE_HIRES_MODE = USE_REFRESH_MODE = False
 PROJECT_ID = "systemicshiftv2"
 
 # Initialize Firebase Admin with service account key
@@ -87,9 +125,20 @@ else:
         logger.error("")
         raise
 
-# Global pipeline (loaded once, reused)
-_pipeline: Optional[StableDiffusionPipeline] = None
+# Pipelines are loaded on demand and cached by services.model_registry
 _use_api_fallback = False  # Flag to use API instead of local model
+_inference_pool: Optional[InferencePool] = None  # Multi-process pool (LOCAL_WORKER_POOL_SIZE > 0)
+_inference_pool_lock = threading.Lock()
+STORY_CONCURRENCY = int(os.environ.get("STORY_CONCURRENCY", str(max(POOL_SIZE, 1))))  # Stories processed in parallel per cycle
+MONITOR_SWEEP_EVERY = int(os.environ.get("MONITOR_SWEEP_EVERY", "20"))  # Re-read all pending stories every N cycles (0 = first cycle only)
+MONITOR_QUERY_LIMIT = int(os.environ.get("MONITOR_QUERY_LIMIT", "50"))  # Max documents read per monitor query
+# Only the fields the monitor and process_story read; keeps each document read small
+MONITOR_FIELDS = [
+    "aiInfographicConcept", "aiGeneratedImageUrl", "nonShiftTitle", "storyTitle", "submittedAt", "updatedAt",
+    "imageGenerationStatus", "imageLeaseOwner", "imageLeaseExpiresAt",
+    "imageGeneratedBy", CONCEPT_HASH_FIELD, SEED_FIELD, CONCEPT_EDITED_FIELD,
+]
+monitor_stats = {"cycles": 0, "queries": 0, "reads": 0, "full_sweeps": 0}  # Firestore document reads by the monitor
 
 # Initialize RAG style retriever with Firestore client for KB queries
 try:
@@ -99,6 +148,27 @@ except Exception as e:
     logger.warning(f"Failed to initialize RAG retriever: {e}. Continuing without RAG enhancement.")
     style_retriever = None
 
+# Optional near-duplicate reuse: embed concepts with the retriever's sentence-transformer
+concept_index = None
+if USE_CONCEPT_REUSE:
+    try:
+        concept_index = ConceptReuseIndex(
+            style_retriever.semantic_model if style_retriever else None,
+            threshold=CONCEPT_REUSE_THRESHOLD,
+        )
+        logger.info(f"Concept reuse enabled ({len(concept_index)} indexed, threshold {CONCEPT_REUSE_THRESHOLD})")
+    except Exception as e:
+        logger.warning(f"Concept reuse disabled: {e}")
+
+# Prompt construction per concept, invalidated when the retriever's styles or KB index change
+prompt_cache = PromptCache()
+
+# Latest image per story on local disk, the starting point for refresh renders
+image_cache = ImageCache()
+
+# Lease manager so several generator instances can share the stories collection
+lease_manager = StoryLeaseManager(FirestoreLeaseStore(db)) if USE_STORY_LEASES else None
+
 SEMANTIC_SYNONYMS = {
     "metrics": ["performance indicators", "impact numbers", "KPI callouts"],
     "timeline": ["journey ribbon", "sequenced milestones"],
@@ -178,41 +248,61 @@ def categorize_generation_error(error: Exception) -> str:
         return "rate_limit"
     return "unknown"
 
-def generate_image_with_retries(prompt: str, negative_prompt: str) -> Image.Image:
-    profiles = [
-        {"width": 512, "height": 512, "num_steps": 30, "guidance_scale": 7.5},
-        {"width": 512, "height": 512, "num_steps": 24, "guidance_scale": 6.8},
-        {"width": 448, "height": 448, "num_steps": 20, "guidance_scale": 6.2},
-    ]
+RETRY_PROFILES = [
+    {"width": 512, "height": 512, "num_steps": 30, "guidance_scale": 7.5},
+    {"width": 512, "height": 512, "num_steps": 24, "guidance_scale": 6.8},
+    {"width": 448, "height": 448, "num_steps": 20, "guidance_scale": 6.2},
+]
+
+def generate_image_with_retries(prompt: str, negative_prompt: str, seed: Optional[int] = None) -> Image.Image:
+    profiles = [{**HIRES_PROFILE, "hires": True}] + RETRY_PROFILES if USE_HIRES_MODE else RETRY_PROFILES
+    return run_with_retry_profiles(lambda profile: (generate_hires_image if profile.get("hires") else generate_image)(
+        prompt=prompt,
+        width=profile["width"],
+        height=profile["height"],
+        num_steps=profile["num_steps"],
+        guidance_scale=profile["guidance_scale"],
+        negative_prompt=negative_prompt,
+        seed=seed
+    ), profiles)
+
+def generate_candidates_with_retries(prompt: str, negative_prompt: str, seeds: List[int]) -> List[Image.Image]:
+    """Like generate_image_with_retries, but renders one image per seed in a single batch"""
+    return run_with_retry_profiles(lambda profile: generate_images(
+        prompt=prompt,
+        seeds=seeds,
+        width=profile["width"],
+        height=profile["height"],
+        num_steps=profile["num_steps"],
+        guidance_scale=profile["guidance_scale"],
+        negative_prompt=negative_prompt
+    ))
+
+def run_with_retry_profiles(render, profiles: Optional[List[dict]] = None):
+    """Call render(profile) with progressively cheaper profiles until one succeeds"""
+    profiles = profiles or RETRY_PROFILES
     last_error = None
     for attempt, profile in enumerate(profiles, start=1):
         try:
             logger.info(f"[ImageGen] Attempt {attempt}/{len(profiles)} with profile {profile}")
-            return generate_image(
-                prompt=prompt,
-                width=profile["width"],
-                height=profile["height"],
-                num_steps=profile["num_steps"],
-                guidance_scale=profile["guidance_scale"],
-                negative_prompt=negative_prompt
-            )
+            with start_span("generate.attempt", attempt=attempt, width=profile["width"], height=profile["height"],
+                            num_steps=profile["num_steps"], hires=bool(profile.get("hires"))):
+                return render(profile)
         except Exception as exc:
             category = categorize_generation_error(exc)
+            RETRIES.inc(category=category)
             logger.warning(f"[ImageGen] Attempt {attempt} failed ({category}): {exc}")
             last_error = exc
             time.sleep(2)
     raise last_error if last_error else RuntimeError("Image generation failed after retries")
 
-def get_pipeline() -> StableDiffusionPipeline:
-    """Get or create the Stable Diffusion pipeline (singleton pattern)"""
-    global _pipeline
-    if _pipeline is not None:
-        return _pipeline
-    
-    logger.info(f"Loading Stable Diffusion pipeline: {MODEL_ID}")
+def load_pipeline(model_id: str = MODEL_ID, torch_dtype=None, device: Optional[str] = None,
+                  cpu_offload: bool = True) -> StableDiffusionPipeline:
+    """Load a fresh Stable Diffusion pipeline (no caching)"""
+    logger.info(f"Loading Stable Diffusion pipeline: {model_id}")
     
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    torch_dtype = torch.float16 if device == "cuda" else torch.float32
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    torch_dtype = torch_dtype or (torch.float16 if device == "cuda" else torch.float32)
     
     logger.info(f"Using device: {device}, dtype: {torch_dtype}")
     
@@ -220,19 +310,19 @@ def get_pipeline() -> StableDiffusionPipeline:
         # Use memory-efficient loading options
         logger.info("Loading pipeline with memory optimizations...")
         pipe = StableDiffusionPipeline.from_pretrained(
-            MODEL_ID,
+            model_id,
             torch_dtype=torch_dtype,
             token=HF_TOKEN if HF_TOKEN else None,
             low_cpu_mem_usage=True,  # Memory-efficient loading
             use_safetensors=True  # Use safetensors format (more memory efficient)
         )
-        pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
+        apply_sampler(pipe, DEFAULT_SAMPLER or "dpmpp_2m")  # SD_SAMPLER; this service has always rendered with DPM++ 2M
         
         # Enable memory optimizations
         pipe.enable_attention_slicing()
         
-        # For CPU, try sequential CPU offload to save memory
-        if device == "cpu":
+        # For CPU, try sequential CPU offload to save memory (its hooks rule out the compiled path)
+        if device == "cpu" and cpu_offload and not PIPELINE_COMPILE:
             try:
                 pipe.enable_sequential_cpu_offload()
                 logger.info("Sequential CPU offload enabled for memory efficiency")
@@ -244,19 +334,39 @@ def get_pipeline() -> StableDiffusionPipeline:
             pipe = pipe.to(device)
         
         logger.info("Pipeline loaded successfully")
-        _pipeline = pipe
-        return _pipeline
+        return maybe_compile(pipe, model_id)
+    except Exception as e:
+        logger.error(f"Failed to load pipeline: {e}")
+        logger.error(f"Error type: {type(e).__name__}")
+        raise
+
+def get_pipeline(model_id: Optional[str] = None) -> StableDiffusionPipeline:
+    """Get or load a Stable Diffusion pipeline (cached and evicted by the shared model registry)"""
+    global _use_api_fallback
+    try:
+        return get_registry(load_pipeline, MODEL_ID).get(model_id or MODEL_ID)
     except MemoryError as e:
         logger.error(f"MemoryError: Not enough RAM to load the model locally.")
         logger.warning(f"Falling back to Hugging Face Inference API (no local model needed)")
-        global _use_api_fallback
         _use_api_fallback = True
         # Return None - we'll use API instead
         return None
-    except Exception as e:
-        logger.error(f"Failed to load pipeline: {e}")
-        logger.error(f"Error type: {type(e).__name__}")
-        raise
+
+def get_inference_pool() -> Optional[InferencePool]:
+    """Get or start the multi-process inference pool (None unless LOCAL_WORKER_POOL_SIZE > 0)"""
+    global _inference_pool
+    if POOL_SIZE <= 0:
+        return None
+    # Concurrent callers (backfill --workers) must not each build a pool and load the weights
+    with _inference_pool_lock:
+        if _inference_pool is None:
+            # Workers share the parent's weights, so load without sequential offload hooks
+            _inference_pool = InferencePool(
+                lambda: load_pipeline(cpu_offload=False),
+                num_workers=POOL_SIZE,
+                threads_per_worker=THREADS_PER_WORKER,
+            )
+        return _inference_pool
 
 def generate_image_via_api(prompt: str, width: int = 512, height: int = 512,
                            num_steps: int = 30, guidance_scale: float = 7.5,
@@ -265,11 +375,12 @@ def generate_image_via_api(prompt: str, width: int = 512, height: int = 512,
     if not HF_TOKEN:
         raise ValueError("HF_API_TOKEN is required for API fallback")
     
-    api_url = f"https://api-inference.huggingface.co/models/{MODEL_ID}"
+    api_url = f"{HF_API_BASE}/models/{MODEL_ID}"
     logger.info(f"Generating image via HF API: {len(prompt)} chars, {width}x{height}, {num_steps} steps")
     
     try:
-        response = requests.post(
+        # Token bucket + adaptive concurrency per backend; 429/503 are retried after Retry-After, then RateLimited
+        response = call_with_limit(get_limiter("hf"), lambda: requests.post(
             api_url,
             headers={"Authorization": f"Bearer {HF_TOKEN}"},
             json={
@@ -286,9 +397,10 @@ def generate_image_via_api(prompt: str, width: int = 512, height: int = 512,
                 }
             },
             timeout=300  # 5 minute timeout
-        )
+        ))
         
         response.raise_for_status()
+        BACKEND_SELECTED.inc(backend="hf-api")
         
         # Parse image from response
         from io import BytesIO
@@ -305,40 +417,120 @@ def generate_image_via_api(prompt: str, width: int = 512, height: int = 512,
                 
     except requests.exceptions.Timeout:
         raise RuntimeError("Hugging Face API request timed out after 5 minutes")
+    except RateLimited:
+        raise
     except Exception as e:
         logger.error(f"HF API request failed: {e}")
         raise RuntimeError(f"HF API request failed: {e}")
 
 def generate_image(prompt: str, width: int = 512, height: int = 512, 
                    num_steps: int = 50, guidance_scale: float = 7.5,
-                   negative_prompt: Optional[str] = None) -> Image.Image:
+                   negative_prompt: Optional[str] = None, seed: Optional[int] = None) -> Image.Image:
     """Generate image from prompt - uses local model or API fallback"""
+    return generate_images(prompt, [seed], width, height, num_steps, guidance_scale, negative_prompt)[0]
+
+def generate_images(prompt: str, seeds: List[Optional[int]], width: int = 512, height: int = 512,
+                    num_steps: int = 50, guidance_scale: float = 7.5,
+                    negative_prompt: Optional[str] = None) -> List[Image.Image]:
+    """Generate one image per seed; locally this is a single batched call sharing one text encoding"""
     global _use_api_fallback
     
-    # If we're using API fallback, use that instead
+    # If we're using API fallback, use that instead (one request per image)
     if _use_api_fallback:
-        return generate_image_via_api(prompt, width, height, num_steps, guidance_scale, negative_prompt)
+        return [generate_image_via_api(prompt, width, height, num_steps, guidance_scale, negative_prompt) for _ in seeds]
+    
+    # Dispatch to the multi-process pool when enabled (candidates run in parallel workers)
+    pool = get_inference_pool()
+    if pool is not None:
+        logger.info(f"Generating {len(seeds)} image(s) in worker pool: {len(prompt)} chars, {width}x{height}, {num_steps} steps")
+        path = "candidates" if len(seeds) > 1 else "generate"
+        futures = [pool.submit(prompt, width, height, num_steps, guidance_scale, negative_prompt, seed=seed, path=path)
+                   for seed in seeds]
+        _, unfinished = wait_futures(futures, timeout=POOL_JOB_TIMEOUT or None)
+        if unfinished:
+            # A stuck or lost job must not hang the monitor thread; jobs not yet started are dropped
+            for future in unfinished:
+                future.cancel()
+            logger.warning(f"Worker pool did not return {len(seeds)} image(s) within {POOL_JOB_TIMEOUT:.0f}s; using the API")
+            return [generate_image_via_api(prompt, width, height, num_steps, guidance_scale, negative_prompt) for _ in seeds]
+        images = [future.result() for future in futures]
+        BACKEND_SELECTED.inc(len(images), backend="worker-pool")
+        return images
     
-    # Try to get local pipeline
-    pipe = get_pipeline()
+    # Try to get local pipeline (owned by the shared scheduler)
+    scheduler = get_scheduler(get_pipeline)
     
     # If pipeline is None (memory error), use API
-    if pipe is None:
-        return generate_image_via_api(prompt, width, height, num_steps, guidance_scale)
-    
-    logger.info(f"Generating image locally: {len(prompt)} chars, {width}x{height}, {num_steps} steps")
-    
-    with torch.no_grad():
-        result = pipe(
-            prompt,
-            num_inference_steps=num_steps,
-            guidance_scale=guidance_scale,
-            width=width,
-            height=height,
-            negative_prompt=negative_prompt
-        )
+    if scheduler.get_pipeline(MODEL_ID) is None:
+        return [generate_image_via_api(prompt, width, height, num_steps, guidance_scale) for _ in seeds]
+    
+    logger.info(f"Generating {len(seeds)} image(s) locally: {len(prompt)} chars, {width}x{height}, {num_steps} steps")
+    
+    def _job(pipe, step_callback):
+        generator = None
+        if any(seed is not None for seed in seeds):
+            generator = [torch.Generator(device="cpu").manual_seed(int(seed or 0)) for seed in seeds]
+        with torch.no_grad():
+            result = pipe(
+                prompt,
+                num_inference_steps=num_steps,
+                guidance_scale=guidance_scale,
+                width=width,
+                height=height,
+                negative_prompt=negative_prompt,
+                num_images_per_prompt=len(seeds),
+                generator=generator,
+                callback_on_step_end=step_callback
+            )
+        return list(result.images)
+    
+    # Background priority: interactive /generate requests on this host run first
+    images = scheduler.run(_job, priority=Priority.BACKGROUND, steps=num_steps, model=MODEL_ID)
+    BACKEND_SELECTED.inc(len(images), backend="local-sd")
+    return images
+
+def generate_hires_image(prompt: str, width: int = HIRES_PROFILE["width"], height: int = HIRES_PROFILE["height"],
+                         num_steps: int = HIRES_PROFILE["num_steps"], guidance_scale: float = HIRES_PROFILE["guidance_scale"],
+                         negative_prompt: Optional[str] = None, seed: Optional[int] = None) -> Image.Image:
+    """Large portrait render in low-memory mode (tiled VAE, chunked attention, optional upscale stage)"""
+    if _use_api_fallback:
+        return generate_image_via_api(prompt, width, height, num_steps, guidance_scale, negative_prompt)
+    if get_inference_pool() is not None:
+        # Pool workers render fixed-size jobs; hi-res needs the scheduler's pipeline
+        raise RuntimeError("hi-res mode is not available with LOCAL_WORKER_POOL_SIZE > 0")
+    
+    scheduler = get_scheduler(get_pipeline)
+    if scheduler.get_pipeline(MODEL_ID) is None:
+        return generate_image_via_api(prompt, width, height, num_steps, guidance_scale, negative_prompt)
     
-    return result.images[0]
+    logger.info(f"Generating hi-res image locally: {len(prompt)} chars, {width}x{height}, {num_steps} steps")
+    
+    def _job(pipe, step_callback):
+        generator = torch.Generator(device="cpu").manual_seed(int(seed)) if seed is not None else None
+        return render_hires(pipe, prompt, negative_prompt, width, height, num_steps, guidance_scale,
+                            generator=generator, step_callback=step_callback)
+    
+    refine_steps = int(HIRES_PROFILE["refine_steps"] * HIRES_PROFILE["refine_strength"])  # img2img skips the rest
+    image = scheduler.run(_job, priority=Priority.BACKGROUND, steps=num_steps + refine_steps, model=MODEL_ID)
+    BACKEND_SELECTED.inc(backend="local-sd-hires")
+    return image
+
+def generate_refresh_image(prompt: str, negative_prompt: Optional[str], init_image: Image.Image, seed: int,
+                           strength: float = REFRESH_STRENGTH, num_steps: int = REFRESH_STEPS) -> Image.Image:
+    """img2img re-render of a story's previous image with its original seed (local pipeline only)"""
+    if _use_api_fallback or get_inference_pool() is not None:
+        raise RuntimeError("refresh renders need the local scheduler pipeline")
+    scheduler = get_scheduler(get_pipeline)
+    if scheduler.get_pipeline(MODEL_ID) is None:
+        raise RuntimeError("local pipeline unavailable for refresh render")
+    
+    def _job(pipe, step_callback):
+        return render_refresh(pipe, prompt, negative_prompt, init_image, seed, strength, num_steps,
+                              step_callback=step_callback)
+    
+    image = scheduler.run(_job, priority=Priority.BACKGROUND, steps=max(int(num_steps * strength), 1), model=MODEL_ID)
+    BACKEND_SELECTED.inc(backend="local-sd-refresh")
+    return image
 
 def generate_image_via_gemini3(prompt: str, aspect_ratio: str = "1:1", image_size: str = "2K") -> Image.Image:
     """Generate image using Gemini 3 Pro Image API (faster than local SD on CPU)"""
@@ -346,12 +538,12 @@ def generate_image_via_gemini3(prompt: str, aspect_ratio: str = "1:1", image_siz
         raise ValueError("GEMINI_API_KEY is required for Gemini 3 image generation")
     
     model = "gemini-3-pro-image-preview"
-    endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+    endpoint = f"{GEMINI_API_BASE}/v1beta/models/{model}:generateContent"
     
     logger.info(f"[Gemini3] Generating image: {len(prompt)} chars, {aspect_ratio}, {image_size}")
     
     try:
-        response = requests.post(
+        response = call_with_limit(get_limiter("gemini"), lambda: requests.post(
             endpoint,
             headers={
                 "Content-Type": "application/json",
@@ -367,7 +559,7 @@ def generate_image_via_gemini3(prompt: str, aspect_ratio: str = "1:1", image_siz
                 }
             },
             timeout=120  # 2 minute timeout
-        )
+        ))
         
         if not response.ok:
             error_text = response.text
@@ -402,19 +594,23 @@ def generate_image_via_gemini3(prompt: str, aspect_ratio: str = "1:1", image_siz
         logger.error(f"[Gemini3] Error: {e}")
         raise
 
-def upload_to_storage(image: Image.Image, filename: str) -> str:
-    """Upload image to Firebase Storage and return public URL"""
+def upload_to_storage(image: Image.Image, filename: str, cache_key: Optional[str] = None) -> str:
+    """Upload image to Firebase Storage and return public URL (cache_key: also keep the PNG in image_cache)"""
     bucket = storage_client.bucket(BUCKET_NAME)
     blob = bucket.blob(filename)
     
     # Convert PIL Image to bytes
     from io import BytesIO
     buf = BytesIO()
-    image.save(buf, format="PNG")
+    with IMAGE_ENCODE.time(), start_span("image.encode", format="PNG"):
+        image.save(buf, format="PNG")
     buf.seek(0)
+    if cache_key:
+        image_cache.put(cache_key, buf.getvalue())
     
-    blob.upload_from_file(buf, content_type="image/png")
-    blob.make_public()
+    with UPLOAD.time(), start_span("storage.upload", path=filename, bytes=buf.getbuffer().nbytes):
+        blob.upload_from_file(buf, content_type="image/png")
+        blob.make_public()
     
     return f"https://storage.googleapis.com/{BUCKET_NAME}/{filename}"
 
@@ -451,78 +647,206 @@ def convert_firestore_timestamp(timestamp_obj) -> Optional[datetime]:
     return timestamp_obj
 
 
-def process_story(doc_id: str, story_data: dict):
+def format_log_timestamp(timestamp_obj) -> str:
+    """Firestore timestamp as a UTC string for log lines"""
+    if not timestamp_obj:
+        return "unknown"
+    converted = convert_firestore_timestamp(timestamp_obj)
+    return converted.strftime("%Y-%m-%d %H:%M:%S UTC") if converted else "unknown (conversion failed)"
+
+
+def commit_story_update(doc_id: str, update_data: dict, lease=None) -> bool:
+    """Write story updates; under a lease the write only lands if we still hold it"""
+    with FIRESTORE_COMMIT.time(), start_span("firestore.commit", leased=lease is not None):
+        if lease is not None:
+            return lease.commit(update_data)
+        db.collection("stories").document(doc_id).update(update_data)
+    return True
+
+def story_needs_image(story_data: dict, retry_errors: bool = False) -> bool:
+    """True if the story has a concept but no valid image URL (and no recorded error, unless retry_errors)"""
+    if not story_data.get("aiInfographicConcept"):
+        return False
+    image_url = story_data.get("aiGeneratedImageUrl")
+    if isinstance(image_url, str) and (image_url.startswith("http://") or image_url.startswith("https://")):
+        return False
+    has_error = isinstance(image_url, str) and ("Error:" in image_url or "failed" in image_url.lower())
+    return retry_errors or not has_error
+
+def story_concept_changed(story_data: dict) -> bool:
+    """True if the story has a refreshable image rendered from an older version of its concept"""
+    return USE_REFRESH_MODE and story_needs_refresh(story_data, concept_fingerprint(*extract_concept_fields(story_data)))
+
+def extract_concept_fields(story_data: dict) -> tuple:
+    """Return (title, key_metrics_text) from a story's aiInfographicConcept (dict or JSON string)"""
+    # Get infographic concept - handle both dict and string formats
+    concept_raw = story_data.get("aiInfographicConcept", {})
+
+    # If concept is a string, try to parse it as JSON, otherwise treat as empty
+    if isinstance(concept_raw, str):
+        try:
+            concept = json.loads(concept_raw) if concept_raw else {}
+        except (json.JSONDecodeError, TypeError):
+            concept = {}
+    else:
+        concept = concept_raw if isinstance(concept_raw, dict) else {}
+
+    # Get title from concept or fallback to story title
+    title = (concept.get("title") if isinstance(concept, dict) else None) or \
+            story_data.get("nonShiftTitle") or \
+            story_data.get("storyTitle") or \
+            "Systemic Shift Story"
+
+    # Build key metrics text
+    if isinstance(concept, dict):
+        key_metrics = concept.get("keyMetrics", [])
+        if isinstance(key_metrics, list):
+            key_metrics_text = "; ".join([f"{m.get('label', '')}: {m.get('value', '')}" for m in key_metrics if isinstance(m, dict)])
+        else:
+            key_metrics_text = "Key metrics and achievements"
+    else:
+        key_metrics_text = "Key metrics and achievements"
+    return title, key_metrics_text
+
+def _construct_prompts(title: str, key_metrics_text: str) -> tuple:
+    """(PromptEntry, cacheable): base prompt enhanced with RAG style references; not cacheable if retrieval failed"""
+    # Build base prompt (keep it under 77 tokens to avoid truncation)
+    # Shorten the prompt to fit CLIP's 77 token limit
+    title_short = title[:50] if len(title) > 50 else title
+    metrics_short = key_metrics_text[:100] if len(key_metrics_text) > 100 else key_metrics_text
+    
+    base_prompt = f"Corporate infographic for PETRONAS Upstream. Vertical layout. TEAL and GREEN colors. Title: {title_short}. Metrics: {metrics_short}. Flat design, minimal icons, professional."
+    
+    prompt = base_prompt
+    negative_prompt = build_negative_prompt([])
+    style_ids = []
+    cacheable = True
+
+    # Use RAG to enhance prompt with style references
+    if style_retriever:
+        try:
+            with RAG_RETRIEVAL.time(), start_span("rag.retrieve", top_k=2):
+                retrieved_styles = style_retriever.retrieve_styles(title, key_metrics_text, top_k=2)
+            if retrieved_styles:
+                top_style = retrieved_styles[0]
+                logger.info(f"Using RAG style reference: {top_style.get('id', 'unknown')} - {top_style.get('description', '')[:50]}")
+                positive_descriptors = style_retriever.get_style_descriptors(retrieved_styles)
+                positive_descriptors = expand_semantic_descriptors(title, key_metrics_text, positive_descriptors)
+                prompt = compose_positive_prompt(base_prompt, positive_descriptors)
+                negative_prompt = build_negative_prompt(style_retriever.get_negative_cues(retrieved_styles))
+                style_ids = [style.get("id", "unknown") for style in retrieved_styles]
+            else:
+                logger.debug("No styles retrieved, using base prompt")
+        except Exception as e:
+            logger.warning(f"RAG retrieval failed: {e}. Using base prompt.")
+            cacheable = False
+    else:
+        logger.debug("RAG retriever not available, using base prompt")
+    
+    # Ensure prompt stays within CLIP token budget (~77 tokens)
+    prompt = truncate_for_clip(prompt, max_tokens=70)
+    return PromptEntry(prompt, negative_prompt, style_ids), cacheable
+
+def build_story_prompts(title: str, key_metrics_text: str) -> PromptEntry:
+    """Prompt, negative prompt and style ids for a concept; repeats and retries skip embedding and Firestore"""
+    if style_retriever is None:
+        return _construct_prompts(title, key_metrics_text)[0]
+    try:
+        version = style_retriever.check_for_updates()
+    except Exception as e:
+        logger.warning(f"Retriever update check failed: {e}")
+        version = style_retriever.version
+    cached = prompt_cache.get(title, key_metrics_text, version)
+    cache_lookup("prompt", hit=cached is not None)
+    if cached is not None:
+        logger.info(f"Prompt cache hit (styles: {', '.join(cached.style_ids) or 'none'})")
+        return cached
+    entry, cacheable = _construct_prompts(title, key_metrics_text)
+    if cacheable:
+        prompt_cache.put(title, key_metrics_text, version, entry)
+    return entry
+
+def process_story(doc_id: str, story_data: dict, lease=None, num_candidates: int = None):
     """Process a single story: generate image and update Firestore"""
+    # One trace per story; its id is written onto the document as imageTraceId
+    with start_span("process_story", **{"story.id": doc_id, "worker.id": WORKER_ID}) as span:
+        rss_before = current_rss_bytes()
+        result = _process_story(doc_id, story_data, lease, num_candidates)
+        rss_after = current_rss_bytes()
+        span.set_attribute("story.success", bool(result))
+        # Monitor-process memory per story; with the trace's backend spans this points growth at a code path
+        span.set_attribute("memory.rss_mb", round(rss_after / (1024 * 1024), 1))
+        span.set_attribute("memory.rss_delta_mb", round((rss_after - rss_before) / (1024 * 1024), 1))
+        return result
+
+def _process_story(doc_id: str, story_data: dict, lease=None, num_candidates: int = None):
+    num_candidates = num_candidates or IMAGE_CANDIDATES
+    refreshing = False
     try:
         logger.info(f"Processing story: {doc_id}")
         
-        # Get infographic concept - handle both dict and string formats
-        concept_raw = story_data.get("aiInfographicConcept", {})
+        title, key_metrics_text = extract_concept_fields(story_data)
+        fingerprint = concept_fingerprint(title, key_metrics_text)
+        refreshing = USE_REFRESH_MODE and story_needs_refresh(story_data, fingerprint)
         
-        # If concept is a string, try to parse it as JSON, otherwise treat as empty
-        if isinstance(concept_raw, str):
+        # Near-duplicate concept? Reuse the earlier image instead of generating from scratch
+        concept_text = f"{title}. {key_metrics_text}"
+        concept_vector = None
+        if concept_index is not None and not refreshing:
             try:
-                import json
-                concept = json.loads(concept_raw) if concept_raw else {}
-            except (json.JSONDecodeError, TypeError):
-                concept = {}
-        else:
-            concept = concept_raw if isinstance(concept_raw, dict) else {}
-        
-        # Get title from concept or fallback to story title
-        title = (concept.get("title") if isinstance(concept, dict) else None) or \
-                story_data.get("nonShiftTitle") or \
-                story_data.get("storyTitle") or \
-                "Systemic Shift Story"
-        
-        # Build key metrics text
-        if isinstance(concept, dict):
-            key_metrics = concept.get("keyMetrics", [])
-            if isinstance(key_metrics, list):
-                key_metrics_text = "; ".join([f"{m.get('label', '')}: {m.get('value', '')}" for m in key_metrics if isinstance(m, dict)])
-            else:
-                key_metrics_text = "Key metrics and achievements"
-        else:
-            key_metrics_text = "Key metrics and achievements"
-        
-        # Build base prompt (keep it under 77 tokens to avoid truncation)
-        # Shorten the prompt to fit CLIP's 77 token limit
-        title_short = title[:50] if len(title) > 50 else title
-        metrics_short = key_metrics_text[:100] if len(key_metrics_text) > 100 else key_metrics_text
-        
-        base_prompt = f"Corporate infographic for PETRONAS Upstream. Vertical layout. TEAL and GREEN colors. Title: {title_short}. Metrics: {metrics_short}. Flat design, minimal icons, professional."
-        
-        prompt = base_prompt
-        negative_prompt = build_negative_prompt([])
-
-        # Use RAG to enhance prompt with style references
-        if style_retriever:
-            try:
-                retrieved_styles = style_retriever.retrieve_styles(title, key_metrics_text, top_k=2)
-                if retrieved_styles:
-                    top_style = retrieved_styles[0]
-                    logger.info(f"Using RAG style reference: {top_style.get('id', 'unknown')} - {top_style.get('description', '')[:50]}")
-                    positive_descriptors = style_retriever.get_style_descriptors(retrieved_styles)
-                    positive_descriptors = expand_semantic_descriptors(title, key_metrics_text, positive_descriptors)
-                    prompt = compose_positive_prompt(base_prompt, positive_descriptors)
-                    negative_prompt = build_negative_prompt(style_retriever.get_negative_cues(retrieved_styles))
-                else:
-                    logger.debug("No styles retrieved, using base prompt")
+                with start_span("concept_reuse.lookup") as reuse_span:
+                    concept_vector = concept_index.embed(concept_text)
+                    match = concept_index.find_match(concept_vector, exclude_story_id=doc_id)
+                    reuse_span.set_attribute("hit", bool(match))
             except Exception as e:
-                logger.warning(f"RAG retrieval failed: {e}. Using base prompt.")
-        else:
-            logger.debug("RAG retriever not available, using base prompt")
+                logger.warning(f"Concept reuse lookup failed: {e}. Generating normally.")
+                match = None
+            cache_lookup("concept_reuse", hit=bool(match))
+            if match:
+                BACKEND_SELECTED.inc(backend="concept-reuse")
+                logger.info(f"♻️  Reusing image from story {match['storyId']} (similarity {match['similarity']:.3f})")
+                reuse_data = {
+                    "aiGeneratedImageUrl": match["imageUrl"],
+                    "analysisTimestamp": firestore.SERVER_TIMESTAMP,
+                    "imageGeneratedAt": firestore.SERVER_TIMESTAMP,
+                    "imageGeneratedBy": "concept-reuse",
+                    "imageGeneratedLocally": False,
+                    "imageReusedFromStoryId": match["storyId"],
+                    "imageReuseSimilarity": match["similarity"],
+                    "imageGenerationStatus": "completed",
+                    "imageTraceId": current_trace_id(),
+                    "updatedAt": firestore.SERVER_TIMESTAMP,
+                }
+                return commit_story_update(doc_id, reuse_data, lease)
         
-        # Ensure prompt stays within CLIP token budget (~77 tokens)
-        prompt = truncate_for_clip(prompt, max_tokens=70)
+        prompt, negative_prompt, _ = build_story_prompts(title, key_metrics_text)
     
         logger.info(f"Generating image for: {title}")
         
         # Choose generation method: Gemini 3 (fast, cloud) or local SD (slow, CPU)
         image = None
         image_generator = "unknown"
+        candidate_meta = None
+        alternates = []
+        render_seed = None
+        previous_url = story_data.get("aiGeneratedImageUrl")
+        
+        if refreshing:
+            # Concept edited after a seeded local render: img2img from the old image instead of a full render
+            logger.info(f"[ImageGen] Concept changed since the last render; refreshing {doc_id} with img2img")
+            try:
+                with start_span("backend.refresh", model=MODEL_ID, strength=REFRESH_STRENGTH, num_steps=REFRESH_STEPS):
+                    init_image = image_cache.load(doc_id, previous_url, storage_client)
+                    if init_image is None:
+                        raise RuntimeError("previous image not found in the local cache or Storage")
+                    render_seed = int(story_data[SEED_FIELD])
+                    image = generate_refresh_image(prompt, negative_prompt, init_image, render_seed)
+                image_generator = "stable-diffusion-img2img"
+            except Exception as refresh_error:
+                logger.warning(f"[ImageGen] Refresh failed: {refresh_error}. Falling back to a full render...")
+                image, render_seed = None, None
         
-        if USE_GEMINI_3 and GEMINI_API_KEY:
+        if image is None and USE_GEMINI_3 and GEMINI_API_KEY:
             # Use Gemini 3 Pro Image (much faster, no local GPU needed)
             logger.info("[ImageGen] Using Gemini 3 Pro Image API")
             try:
@@ -541,7 +865,9 @@ Requirements:
 
 DO NOT include dense text blocks. Focus on visual representation."""
                 
-                image = generate_image_via_gemini3(gemini_prompt, aspect_ratio="9:16", image_size="2K")
+                with start_span("backend.gemini", model="gemini-3-pro-image-preview"):
+                    image = generate_image_via_gemini3(gemini_prompt, aspect_ratio="9:16", image_size="2K")
+                BACKEND_SELECTED.inc(backend="gemini-3-pro-image")
                 image_generator = "gemini-3-pro-image"
             except Exception as gemini_error:
                 logger.warning(f"[ImageGen] Gemini 3 failed: {gemini_error}. Falling back to local SD...")
@@ -552,28 +878,71 @@ DO NOT include dense text blocks. Focus on visual representation."""
             logger.info("[ImageGen] Using local Stable Diffusion")
             logger.debug(f"Final prompt: {prompt[:150]}...")
             logger.debug(f"Negative prompt: {negative_prompt}")
-            image = generate_image_with_retries(prompt, negative_prompt)
+            with start_span("backend.local_sd", model=MODEL_ID, candidates=num_candidates):
+                if num_candidates > 1:
+                    # Render N variants in one batch and keep the best-scoring one
+                    base_seed = random.randrange(2**31)
+                    seeds = [base_seed + i for i in range(num_candidates)]
+                    candidates = generate_candidates_with_retries(prompt, negative_prompt, seeds)
+                    with start_span("candidates.rank", count=len(candidates)):
+                        ranked = rank_candidates(prompt, candidates)
+                    best_index, best_score = ranked[0]
+                    image = candidates[best_index]
+                    candidate_meta = {"seed": seeds[best_index], "score": round(best_score, 4)}
+                    alternates = [(candidates[i], seeds[i], score) for i, score in ranked[1:]]
+                    logger.info(f"[ImageGen] Picked candidate seed={seeds[best_index]} (score {best_score:.3f}) of {len(candidates)}")
+                else:
+                    render_seed = random.randrange(2**31)  # recorded so a later refresh can reuse it
+                    image = generate_image_with_retries(prompt, negative_prompt, seed=render_seed)
             image_generator = "stable-diffusion-local"
         
         # Upload to storage
-        filename = f"{IMAGE_FOLDER}/{doc_id}_{int(time.time())}.png"
-        image_url = upload_to_storage(image, filename)
+        upload_stamp = int(time.time())
+        filename = f"{IMAGE_FOLDER}/{doc_id}_{upload_stamp}.png"
+        image_url = upload_to_storage(image, filename, cache_key=doc_id)
+        alternate_records = [
+            {
+                "url": upload_to_storage(alt_image, f"{IMAGE_FOLDER}/{doc_id}_{upload_stamp}_alt{i}.png"),
+                "seed": alt_seed,
+                "score": round(alt_score, 4),
+            }
+            for i, (alt_image, alt_seed, alt_score) in enumerate(alternates, start=1)
+        ]
         
         logger.info(f"Image uploaded: {image_url}")
         logger.info(f"Updating Firestore document {doc_id} with image URL...")
         
         # Update Firestore
-        doc_ref = db.collection("stories").document(doc_id)
         update_data = {
             "aiGeneratedImageUrl": image_url,
             "analysisTimestamp": firestore.SERVER_TIMESTAMP,
             "imageGeneratedAt": firestore.SERVER_TIMESTAMP,
             "imageGeneratedBy": image_generator,
-            "imageGeneratedLocally": image_generator == "stable-diffusion-local"
+            "imageGeneratedLocally": image_generator in ("stable-diffusion-local", "stable-diffusion-img2img"),
+            "imageGenerationStatus": "completed",
+            "imageTraceId": current_trace_id(),
+            "updatedAt": firestore.SERVER_TIMESTAMP,
+            CONCEPT_HASH_FIELD: fingerprint,
         }
-        doc_ref.update(update_data)
+        if render_seed is not None:
+            update_data[SEED_FIELD] = render_seed
+        if image_generator == "stable-diffusion-img2img":
+            update_data["imageRefreshedFrom"] = previous_url
+        if candidate_meta:
+            update_data["aiGeneratedImageSeed"] = candidate_meta["seed"]
+            update_data["aiGeneratedImageScore"] = candidate_meta["score"]
+            update_data["aiGeneratedImageAlternates"] = alternate_records
+        if not commit_story_update(doc_id, update_data, lease):
+            logger.warning(f"Skipped Firestore update for {doc_id}: lease was lost to another worker")
+            return False
         logger.info(f"✅ Firestore updated successfully for {doc_id}")
         
+        if concept_index is not None:
+            try:
+                concept_index.add(doc_id, concept_text, image_url, concept_vector)
+            except Exception as e:
+                logger.warning(f"Failed to index concept for reuse: {e}")
+        
         logger.info(f"✅ Successfully processed story: {doc_id}")
         return True
         
@@ -581,34 +950,57 @@ DO NOT include dense text blocks. Focus on visual representation."""
         error_category = categorize_generation_error(e)
         logger.error(f"❌ Error processing story {doc_id}: {e} (category: {error_category})", exc_info=True)
         
-        # Update Firestore with error
+        # Update Firestore with error (a failed refresh keeps the story's existing image)
         try:
-            doc_ref = db.collection("stories").document(doc_id)
-            doc_ref.update({
-                "aiGeneratedImageUrl": f"Error: {str(e)}",
+            error_data = {
                 "imageGenerationErrorCategory": error_category,
-                "imageGeneratedAt": firestore.SERVER_TIMESTAMP
-            })
+                "imageGeneratedAt": firestore.SERVER_TIMESTAMP,
+                "imageGenerationStatus": "failed",
+                "imageTraceId": current_trace_id(),
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            }
+            if refreshing:
+                error_data["imageRefreshError"] = str(e)
+            else:
+                error_data["aiGeneratedImageUrl"] = f"Error: {str(e)}"
+            commit_story_update(doc_id, error_data, lease)
         except:
             pass
         
         return False
 
+def claim_and_process(doc_id: str, doc_data: dict) -> Optional[bool]:
+    """Claim a story's lease (when enabled) and process it; None if another worker holds it, else process_story's result"""
+    if not lease_manager:
+        return process_story(doc_id, doc_data)
+    lease = lease_manager.try_claim(doc_id, refresh=story_concept_changed(doc_data))
+    if lease is None:
+        logger.info(f"[Monitor Cycle] Story {doc_id} claimed by another worker, skipping")
+        return None
+    with lease:
+        return process_story(doc_id, doc_data, lease=lease)
+
 def monitor_firestore():
     """Monitor Firestore for stories that need image generation"""
     logger.info("Starting Firestore monitor...")
+    start_exporter(METRICS_PORT)
+    install_signal_handlers(PROFILE_SIGNAL_GENERATIONS)
     
-    # Record script start time - only process stories submitted AFTER this time
+    # Record script start time - the initial watermark when no pending story is found on the first sweep
     # Use UTC to match Firestore timestamps (Firestore stores all timestamps in UTC)
     script_start_time = datetime.now(timezone.utc)
     logger.info(f"Script started at: {script_start_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
-    logger.info(f"Will only process stories submitted AFTER script start time")
+    logger.info(f"Watching stories with imageGenerationStatus == 'pending' (full sweep every {MONITOR_SWEEP_EVERY} cycles)")
+    if USE_REFRESH_MODE:
+        logger.info(f"Refresh mode: completed stories whose concept changes get an img2img re-render (strength {REFRESH_STRENGTH})")
     
     # Try to load pipeline once at startup
     logger.info("Loading pipeline (this may take a few minutes on first run)...")
     try:
-        pipeline = get_pipeline()
-        if pipeline is None:
+        if POOL_SIZE > 0:
+            get_inference_pool()
+            logger.info(f"✅ Inference pool started with {POOL_SIZE} worker(s)! Ready to process stories.")
+        elif get_scheduler(get_pipeline).get_pipeline(MODEL_ID) is None:
             logger.warning("⚠️  Local model loading failed - using Hugging Face Inference API instead")
             logger.info("✅ API fallback ready! Ready to process stories.")
         else:
@@ -617,130 +1009,114 @@ def monitor_firestore():
         logger.error(f"Failed to initialize: {e}")
         logger.info("Will attempt to use API fallback when processing stories...")
     
+    stories_ref = db.collection("stories")
+    cycle_log = CycleLog(logger)
+    watermark = None  # max updatedAt seen so far; incremental queries only read stories changed since
+    sweep_cursor = None  # last pending story of the previous full sweep's window
+    refresh_watermark = script_start_time  # max conceptUpdatedAt seen; only concept edits move it, not our own writes
+    cycle = 0
+    
     while True:
         try:
-            stories_ref = db.collection("stories")
-            
-            logger.info("=" * 60)
-            logger.info(f"[Monitor Cycle] Checking for stories needing image generation at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}")
-            logger.info(f"[Monitor Cycle] Script started at: {script_start_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
-            
-            # Query for stories needing image generation in two ways:
-            # 1. Stories submitted AFTER script start (new submissions)
-            # 2. Recent stories with concepts that need images (regardless of submission time)
-            logger.info(f"[Monitor Cycle] Querying for stories needing image generation...")
+            cycle += 1
+            cycle_started = time.perf_counter()
+            full_sweep = watermark is None or (MONITOR_SWEEP_EVERY > 0 and cycle % MONITOR_SWEEP_EVERY == 0)
+            cycle_log.start()
+            logger.debug("[Monitor Cycle] %d: checking for stories needing image generation (full sweep: %s)", cycle, full_sweep)
             
+            # Query pending stories by status. Normally only those updated after the watermark
+            # (idle cycles cost a single read); every MONITOR_SWEEP_EVERY cycles read the next window of
+            # pending stories by id to pick up expired leases and documents written without updatedAt.
+            # The window moves on each sweep, so stories still marked pending from before the status
+            # field (see backfill_images.py --set-status) cannot fill every sweep and starve the rest.
             try:
-                all_docs_dict = {}  # Use dict to deduplicate by document ID
-                
-                # Query 1: Stories submitted after script start (for new submissions)
-                try:
-                    query_new = stories_ref.where("submittedAt", ">=", script_start_time)\
-                                          .order_by("submittedAt")\
-                                          .limit(20)
-                    docs_new = list(query_new.stream())
-                    logger.info(f"[Monitor Cycle] Found {len(docs_new)} document(s) submitted after script start")
-                    for doc in docs_new:
-                        all_docs_dict[doc.id] = doc
-                except Exception as e:
-                    logger.warning(f"Error querying new submissions: {e}")
-                
-                # Query 2: Recent documents (last 50) - we'll filter for those with concepts needing images
-                # This catches documents submitted before script start that have concepts
-                try:
-                    query_recent = stories_ref.order_by("submittedAt", direction=firestore.Query.DESCENDING).limit(50)
-                    docs_recent = list(query_recent.stream())
-                    logger.info(f"[Monitor Cycle] Checking {len(docs_recent)} most recent documents for concepts needing images")
-                    
-                    for doc in docs_recent:
-                        doc_data = doc.to_dict()
-                        has_concept = bool(doc_data.get("aiInfographicConcept"))
-                        image_url = doc_data.get("aiGeneratedImageUrl", "NOT SET")
-                        
-                        # Check if this document needs image generation
-                        # (has concept but no valid image URL)
-                        is_valid_url = isinstance(image_url, str) and (image_url.startswith("http://") or image_url.startswith("https://"))
-                        has_error = isinstance(image_url, str) and ("Error:" in image_url or "failed" in image_url.lower())
-                        
-                        if has_concept and not is_valid_url and not has_error:
-                            # This document has a concept and needs an image
-                            if doc.id not in all_docs_dict:
-                                all_docs_dict[doc.id] = doc
-                                logger.info(f"[Monitor Cycle] Found document with concept needing image (submitted before script start): {doc.id}")
-                except Exception as e:
-                    logger.warning(f"Error querying recent documents: {e}")
-                
-                # Convert dict values to list
-                docs = list(all_docs_dict.values())
-                logger.info(f"[Monitor Cycle] Total documents to check: {len(docs)} (after deduplication)")
-                
-                # Diagnostic logging for first few documents
-                if len(docs) > 0:
-                    logger.info(f"[Monitor Cycle] Sample of documents to process:")
-                    for doc in docs[:3]:  # Show first 3
-                        doc_data = doc.to_dict()
-                        doc_id = doc.id
-                        title = doc_data.get("nonShiftTitle") or doc_data.get("storyTitle", "N/A")
-                        has_concept = bool(doc_data.get("aiInfographicConcept"))
-                        image_url = doc_data.get("aiGeneratedImageUrl", "NOT SET")
-                        logger.info(f"[Monitor Cycle]   - {doc_id}: '{title[:40]}', hasConcept={has_concept}, imageUrl='{str(image_url)[:50]}'")
-                
+                query = stories_ref.where("imageGenerationStatus", "==", "pending")
+                if full_sweep:
+                    query = query.order_by("__name__")
+                    if sweep_cursor is not None:
+                        query = query.start_after(sweep_cursor)
+                else:
+                    query = query.where("updatedAt", ">", watermark).order_by("updatedAt")
+                snapshots = list(query.select(MONITOR_FIELDS).limit(MONITOR_QUERY_LIMIT).stream())
+                if full_sweep:
+                    sweep_cursor = snapshots[-1] if len(snapshots) == MONITOR_QUERY_LIMIT else None  # wrap at the end
+                docs = [(doc.id, doc.to_dict() or {}) for doc in snapshots]
+                # Completed stories whose concept was edited since the last cycle: candidates for an img2img refresh
+                edited = []
+                if USE_REFRESH_MODE:
+                    edited_query = stories_ref.where("imageGenerationStatus", "==", "completed") \
+                        .where(CONCEPT_EDITED_FIELD, ">", refresh_watermark).order_by(CONCEPT_EDITED_FIELD)
+                    edited = [(doc.id, doc.to_dict() or {}) for doc in edited_query.select(MONITOR_FIELDS).limit(MONITOR_QUERY_LIMIT).stream()]
             except Exception as e:
                 logger.warning(f"Query timeout or error, retrying: {e}")
                 time.sleep(5)
                 continue
             
-            processed_count = 0
-            for doc in docs:
-                doc_data = doc.to_dict()
-                doc_id = doc.id
-                
-                # Log document details for debugging
-                image_url = doc_data.get("aiGeneratedImageUrl", "NOT SET")
-                has_concept = bool(doc_data.get("aiInfographicConcept"))
-                submitted_at = doc_data.get("submittedAt")
-                
-                # Convert Firestore timestamp to string for logging
-                if submitted_at:
-                    submitted_dt = convert_firestore_timestamp(submitted_at)
-                    if submitted_dt:
-                        submitted_str = submitted_dt.strftime("%Y-%m-%d %H:%M:%S UTC")
-                    else:
-                        submitted_str = "unknown (conversion failed)"
-                else:
-                    submitted_str = "unknown"
-                
-                title = doc_data.get("nonShiftTitle") or doc_data.get("storyTitle", "N/A")
-                
-                logger.info(f"[Monitor Cycle] Doc {doc_id}: title='{title[:40]}', submitted={submitted_str}, imageUrl='{str(image_url)[:60]}', hasConcept={has_concept}")
-                
-                # Skip documents that already have error messages (they've been tried before)
-                if isinstance(image_url, str) and ("Error:" in image_url or "failed" in image_url.lower()):
-                    logger.debug(f"[Monitor Cycle] Skipping doc {doc_id} - already has error: {image_url[:50]}")
-                    continue
+            # Firestore bills one read per returned document, and one for a query that returns nothing
+            cycle_reads = max(len(docs), 1) + (max(len(edited), 1) if USE_REFRESH_MODE else 0)
+            monitor_stats["cycles"] += 1
+            monitor_stats["queries"] += 2 if USE_REFRESH_MODE else 1
+            monitor_stats["reads"] += cycle_reads
+            monitor_stats["full_sweeps"] += int(full_sweep)
+            
+            seen = [convert_firestore_timestamp(doc_data.get("updatedAt")) for _, doc_data in docs]
+            seen = [ts for ts in seen if isinstance(ts, datetime)]
+            if seen:
+                watermark = max([watermark, *seen]) if watermark else max(seen)
+            elif watermark is None:
+                watermark = script_start_time
+            edited_seen = [convert_firestore_timestamp(doc_data.get(CONCEPT_EDITED_FIELD)) for _, doc_data in edited]
+            edited_seen = [ts for ts in edited_seen if isinstance(ts, datetime)]
+            if edited_seen:
+                refresh_watermark = max([refresh_watermark, *edited_seen])
+            
+            returned = (len(docs), len(edited))
+            docs = docs + [(doc_id, doc_data) for doc_id, doc_data in edited if story_concept_changed(doc_data)]
+            
+            if lease_manager:
+                docs_by_id = dict(docs)
+                docs = [(doc_id, docs_by_id[doc_id]) for doc_id in lease_manager.order_candidates(docs_by_id)]
+
+            pending = []
+            for doc_id, doc_data in docs:
+                # Sampled document details; the lambdas only run if the line is emitted
+                cycle_log.doc(
+                    "seen", doc_id,
+                    title=lambda d=doc_data: (d.get("nonShiftTitle") or d.get("storyTitle", "N/A"))[:40],
+                    submitted=lambda d=doc_data: format_log_timestamp(d.get("submittedAt")),
+                    imageUrl=lambda d=doc_data: str(d.get("aiGeneratedImageUrl", "NOT SET"))[:60],
+                    hasConcept=bool(doc_data.get("aiInfographicConcept")),
+                )
                 
-                # Skip documents that already have a valid image URL
-                is_valid_url = isinstance(image_url, str) and (image_url.startswith("http://") or image_url.startswith("https://"))
-                if is_valid_url:
-                    logger.debug(f"[Monitor Cycle] Skipping doc {doc_id} - already has valid image URL")
+                # Skip documents that already have an up-to-date image, a recorded error, or no concept yet
+                if story_concept_changed(doc_data):
+                    cycle_log.doc("concept_changed", doc_id, sample=False)
+                elif not story_needs_image(doc_data):
+                    cycle_log.doc("skipped_done", doc_id)
                     continue
-                
-                # Check if concept exists
-                if not has_concept:
-                    logger.debug(f"Story {doc_id} has no concept yet, skipping (waiting for analyzeStorySubmission)")
+                else:
+                    # Process this story (has concept, no valid image yet)
+                    cycle_log.doc("needs_image", doc_id, sample=False)
+                if lease_manager and lease_is_active(doc_data) and doc_data.get("imageLeaseOwner") != WORKER_ID:
+                    cycle_log.doc("skipped_leased", doc_id, owner=doc_data.get("imageLeaseOwner"))
                     continue
-                
-                # Process this story (has concept, no valid image yet)
-                logger.info(f"Found story needing image generation: {doc_id}")
-                process_story(doc_id, doc_data)
-                processed_count += 1
+                pending.append((doc_id, doc_data))
             
-            if processed_count > 0:
-                logger.info(f"Processed {processed_count} stories in this cycle")
+            if STORY_CONCURRENCY > 1 and len(pending) > 1:
+                with ThreadPoolExecutor(max_workers=STORY_CONCURRENCY, thread_name_prefix="story") as executor:
+                    results = list(executor.map(lambda item: claim_and_process(*item), pending))
             else:
-                logger.info("[Monitor Cycle] No stories to process in this cycle")
+                results = [claim_and_process(doc_id, doc_data) for doc_id, doc_data in pending]
+            processed_count = sum(1 for result in results if result is not None)
             
-            logger.info("=" * 60)
+            # One summary line per cycle
+            logger.info(
+                "[Monitor Cycle] %d%s: %d pending + %d edited returned, %d queued, %d processed in %.2fs; "
+                "reads %d (%d over %d cycles, %.1f/cycle); %s; dropped log records %d",
+                cycle, " (full sweep)" if full_sweep else "", returned[0], returned[1], len(pending), processed_count,
+                time.perf_counter() - cycle_started, cycle_reads, monitor_stats["reads"], monitor_stats["cycles"],
+                monitor_stats["reads"] / monitor_stats["cycles"], cycle_log.summary(), dropped_records(),
+            )
             
             # Wait before next check
             time.sleep(30)  # Check every 30 seconds
@@ -753,12 +1129,14 @@ def monitor_firestore():
             time.sleep(60)  # Wait longer on error
 
 if __name__ == "__main__":
+    enable_async_logging()  # log writes move to a background thread for the long-running monitor
     logger.info("=" * 60)
     logger.info("Local Image Generator Service")
     logger.info("=" * 60)
     logger.info(f"Model: {MODEL_ID}")
     logger.info(f"Device: {'CUDA' if torch.cuda.is_available() else 'CPU'}")
     logger.info(f"Bucket: {BUCKET_NAME}")
+    logger.info(f"Worker: {WORKER_ID} (story leases {'enabled' if USE_STORY_LEASES else 'disabled'})")
     logger.info("=" * 60)
     
     monitor_firestore()
\ No newline at end of file
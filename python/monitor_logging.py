@@ -0,0 +1,149 @@
+"""
+Monitor Logging
+Keeps logging off the monitor's hot path: enable_async_logging() puts the root handlers behind a bounded queue
+drained by a background QueueListener (records are formatted there, not on the calling thread), and CycleLog
+turns per-document lines into structured records that are sampled, capped per cycle and formatted only if
+they are actually emitted. Every cycle still ends with one INFO summary carrying the counts of every event
+
+Usage:
+    enable_async_logging()
+    cycle_log = CycleLog(logger)
+    cycle_log.start()
+    cycle_log.doc("seen", doc_id, title=title, submitted=lambda: fmt(submitted_at))   # callables run lazily
+    cycle_log.doc("needs_image", doc_id, sample=False)                              # capped, never sampled out
+    logger.info("[Monitor Cycle] %s", cycle_log.summary())
+"""
+import os
+import zlib
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+ASYNC_LOGGING = os.environ.get("ASYNC_LOGGING", "true").lower() in ("1", "true", "yes")  # Write logs from a background thread
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))  # Records buffered before new ones are dropped (and counted)
+DOC_LOG_SAMPLE_RATE = float(os.environ.get("DOC_LOG_SAMPLE_RATE", "0.1"))  # Share of documents whose per-doc lines are logged
+DOC_LOG_MAX_PER_CYCLE = int(os.environ.get("DOC_LOG_MAX_PER_CYCLE", "20"))  # Per-doc lines per monitor cycle, sampled or not
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["DroppingQueueHandler"] = None
+_lock = threading.Lock()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks or formats on the caller's thread; full queue = record dropped"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener lives in this process, so the record can cross as is; message and traceback
+        # formatting happen on the listener thread instead of here.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def enable_async_logging(logger: Optional[logging.Logger] = None, queue_size: int = LOG_QUEUE_SIZE) -> Optional[DroppingQueueHandler]:
+    """Move `logger`'s (default: root) handlers behind a queue and a background writer thread; idempotent"""
+    global _listener, _handler
+    if not ASYNC_LOGGING:
+        return None
+    target = logger or logging.getLogger()
+    with _lock:
+        existing = next((h for h in target.handlers if isinstance(h, DroppingQueueHandler)), None)
+        if existing is not None:
+            return existing
+        handlers = list(target.handlers)
+        if not handlers:
+            return None
+        log_queue = queue.Queue(maxsize=queue_size)
+        handler = DroppingQueueHandler(log_queue)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        for h in handlers:
+            target.removeHandler(h)
+        target.addHandler(handler)
+        listener.start()
+        _listener, _handler = listener, handler
+    atexit.register(flush_async_logging)
+    return handler
+
+
+def flush_async_logging():
+    """Stop the writer thread after it has drained the queue (runs at exit)"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def dropped_records() -> int:
+    """Records lost to a full queue since async logging was enabled"""
+    return _handler.dropped if _handler is not None else 0
+
+
+class _Fields:
+    """key=value rendering deferred until a handler formats the record; callable values are evaluated then"""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: Dict):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        parts = []
+        for key, value in self.fields.items():
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    value = f"<{type(e).__name__}>"
+            parts.append(f"{key}={value!r}" if isinstance(value, str) else f"{key}={value}")
+        return " ".join(parts)
+
+
+class CycleLog:
+    """Per-document monitor records for one cycle: counted always, emitted sampled and capped"""
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = DOC_LOG_SAMPLE_RATE,
+                 max_per_cycle: int = DOC_LOG_MAX_PER_CYCLE, level: int = logging.INFO):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.max_per_cycle = max_per_cycle
+        self.level = level
+        self._sample_below = int(sample_rate * 10000)
+        self.counts: Dict[str, int] = {}
+        self.emitted = 0
+        self.suppressed = 0
+
+    def start(self):
+        self.counts = {}
+        self.emitted = 0
+        self.suppressed = 0
+
+    def sampled(self, doc_id: str) -> bool:
+        """Stable per document, so a sampled story's lines show up in every cycle it appears in"""
+        return zlib.crc32(doc_id.encode("utf-8")) % 10000 < self._sample_below
+
+    def doc(self, event: str, doc_id: str, sample: bool = True, **fields):
+        self.counts[event] = self.counts.get(event, 0) + 1
+        if not self.logger.isEnabledFor(self.level):
+            return
+        if (sample and not self.sampled(doc_id)) or self.emitted >= self.max_per_cycle:
+            self.suppressed += 1
+            return
+        self.emitted += 1
+        self.logger.log(self.level, "[Monitor Doc] %s %s %s", event, doc_id, _Fields(fields),
+                        extra={"doc_id": doc_id, "doc_event": event})
+
+    def summary(self) -> str:
+        events = ", ".join(f"{event}={count}" for event, count in sorted(self.counts.items())) or "none"
+        return f"doc events: {events} (logged {self.emitted}, suppressed {self.suppressed})"
@@ -0,0 +1,87 @@
+"""
+Prompt Cache
+Bounded TTL + LRU memo of prompt construction (RAG retrieval, descriptors, negative cues) per story concept
+Keys are the normalized title and metrics text; every entry records the retriever version it was built
+against, so a styles file reload or KB index change makes older entries misses without flushing the cache
+
+Usage:
+    cache = PromptCache()
+    entry = cache.get(title, metrics_text, retriever.check_for_updates())
+    if entry is None:
+        entry = cache.put(title, metrics_text, version, PromptEntry(prompt, negative_prompt, style_ids))
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_SIZE = int(os.environ.get("PROMPT_CACHE_SIZE", "512"))  # Concepts kept (0 = disabled)
+PROMPT_CACHE_TTL = float(os.environ.get("PROMPT_CACHE_TTL", "3600"))  # Seconds an entry stays valid regardless of version
+
+
+class PromptEntry(NamedTuple):
+    prompt: str
+    negative_prompt: str
+    style_ids: List[str]
+
+
+def concept_key(title: str, metrics_text: str) -> str:
+    """Case- and whitespace-insensitive key for a story concept"""
+    normalized = "\n".join(re.sub(r"\s+", " ", part or "").strip().lower() for part in (title, metrics_text))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """LRU of concept key -> (retriever version, expiry, PromptEntry)"""
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_SIZE, ttl: float = PROMPT_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, title: str, metrics_text: str, version: int) -> Optional[PromptEntry]:
+        if self.max_entries <= 0:
+            return None
+        key = concept_key(title, metrics_text)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                self.stats["misses"] += 1
+                return None
+            entry_version, expires_at, entry = cached
+            if entry_version != version or self.clock() >= expires_at:
+                del self._entries[key]
+                self.stats["stale"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, title: str, metrics_text: str, version: int, entry: PromptEntry) -> PromptEntry:
+        if self.max_entries <= 0:
+            return entry
+        key = concept_key(title, metrics_text)
+        with self._lock:
+            self._entries[key] = (version, self.clock() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
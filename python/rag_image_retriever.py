@@ -2,10 +2,17 @@
 RAG Image Retriever
 Retrieves relevant visual style references from example images based on story content
 Combines local JSON styles with Firestore knowledge base image examples
+The styles file is watched (mtime/size, then content hash) and reloaded live: only added or edited styles are
+re-encoded, and each retrieve_styles call works on one immutable snapshot of styles + embeddings
+Style and KB embeddings persist in memory-mapped float16/int8 matrices (see embedding_store.py)
+`version` increases whenever the styles snapshot or the KB index changes, so callers can memoize retrieval output
 """
 import json
 import os
+import time
+import hashlib
 import logging
+import threading
 from typing import List, Dict, Optional
 from pathlib import Path
 
@@ -18,6 +25,8 @@ except ImportError:  # pragma: no cover - optional dependency
     SentenceTransformer = None
     np = None
 
+from embedding_store import EmbeddingStore
+
 try:
     from google.cloud import firestore
     FIRESTORE_AVAILABLE = True
@@ -27,6 +36,21 @@ except ImportError:
     FirestoreClient = None
     logger.warning("Firestore not available. Knowledge base image retrieval will be disabled.")
 
+STYLES_RELOAD_INTERVAL = float(os.environ.get("STYLES_RELOAD_INTERVAL", "5"))  # Seconds between styles file checks (0 = never reload)
+KB_REFRESH_INTERVAL = float(os.environ.get("KB_REFRESH_INTERVAL", "300"))  # Seconds between KB embedding syncs from Firestore
+KB_QUERY_LIMIT = int(os.environ.get("KB_QUERY_LIMIT", "50"))  # Most recent KB documents considered
+
+
+class StyleSnapshot:
+    """Styles, their embedding rows and per-style text hashes, swapped as one unit on reload"""
+
+    def __init__(self, styles_data: Dict, embeddings=None, text_hashes: Optional[List[str]] = None, content_hash: str = ""):
+        self.styles_data = styles_data
+        self.embeddings = embeddings
+        self.text_hashes = text_hashes or []
+        self.content_hash = content_hash
+
+
 class ImageStyleRetriever:
     """Retrieves relevant image styles based on story content"""
     
@@ -38,26 +62,79 @@ class ImageStyleRetriever:
             styles_file = os.path.join(current_dir, "rag_image_styles.json")
         
         self.styles_file = styles_file
-        self.styles_data = self._load_styles()
         self.db = db  # Firestore client for querying knowledge base
         self.semantic_model = None
-        self.style_embeddings = None
-        self.kb_image_cache = None  # Cache for KB image embeddings
+        self.style_store = self._open_store("styles")  # Style embeddings by text hash; skips re-encoding on restart
+        self.kb_store = self._open_store("kb")  # KB image embeddings + metadata, shared across processes via mmap
+        self._kb_next_refresh = 0.0
+        self._version = 0
+        self._version_lock = threading.Lock()
+        self.reload_interval = STYLES_RELOAD_INTERVAL
+        self._reload_lock = threading.Lock()
+        self._next_check = 0.0
+        self._file_stat = self._stat_styles_file()
+        styles_data, content_hash = self._load_styles()
+        self._snapshot = StyleSnapshot(styles_data, content_hash=content_hash)
         self._initialize_semantic_model()
-    
-    def _load_styles(self) -> Dict:
-        """Load styles from JSON file"""
+
+    def _open_store(self, name: str) -> Optional[EmbeddingStore]:
+        if np is None:
+            return None
         try:
-            with open(self.styles_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            return EmbeddingStore(name)
+        except Exception as exc:
+            logger.warning(f"Embedding store '{name}' unavailable: {exc}")
+            return None
+
+    @property
+    def styles_data(self) -> Dict:
+        return self._snapshot.styles_data
+
+    @property
+    def style_embeddings(self):
+        return self._snapshot.embeddings
+
+    @property
+    def version(self) -> int:
+        """Bumped on every styles reload and KB index change"""
+        return self._version
+
+    def _bump_version(self, reason: str):
+        with self._version_lock:
+            self._version += 1
+        logger.info(f"Retriever version {self._version}: {reason}")
+
+    def check_for_updates(self) -> int:
+        """Apply pending styles/KB changes (stat checks; Firestore at most once per KB_REFRESH_INTERVAL) and return version"""
+        self.maybe_reload()
+        if FIRESTORE_AVAILABLE and self.db and self.kb_store is not None:
+            try:
+                self._sync_kb_store()
+            except Exception as exc:
+                logger.warning(f"KB index sync failed: {exc}")
+        return self._version
+
+    def _stat_styles_file(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.styles_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load_styles(self) -> tuple:
+        """Load styles from JSON file; returns (data, content hash)"""
+        try:
+            with open(self.styles_file, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw.decode('utf-8'))
             logger.info(f"Loaded {len(data.get('styles', []))} style references from {self.styles_file}")
-            return data
+            return data, hashlib.sha256(raw).hexdigest()
         except FileNotFoundError:
             logger.warning(f"Styles file not found: {self.styles_file}. Using default style.")
-            return {"styles": [], "defaultStyle": {}}
-        except json.JSONDecodeError as e:
+            return {"styles": [], "defaultStyle": {}}, ""
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
             logger.error(f"Error parsing styles JSON: {e}. Using default style.")
-            return {"styles": [], "defaultStyle": {}}
+            return {"styles": [], "defaultStyle": {}}, ""
 
     def _initialize_semantic_model(self):
         """Initialize optional semantic model and style embeddings"""
@@ -65,13 +142,78 @@ class ImageStyleRetriever:
             return
         try:
             self.semantic_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-            style_texts = [self._style_to_text(style) for style in self.styles_data.get("styles", [])]
-            self.style_embeddings = self.semantic_model.encode(style_texts, normalize_embeddings=True)
-            logger.info("Semantic style embeddings loaded for %d references", len(style_texts))
+            self._snapshot = self._build_snapshot(self._snapshot.styles_data, self._snapshot.content_hash, previous=None)
+            logger.info("Semantic style embeddings loaded for %d references", len(self._snapshot.text_hashes))
         except Exception as exc:
             logger.warning("Semantic model initialization failed: %s", exc)
             self.semantic_model = None
-            self.style_embeddings = None
+            self._snapshot = StyleSnapshot(self._snapshot.styles_data, content_hash=self._snapshot.content_hash)
+
+    def _build_snapshot(self, styles_data: Dict, content_hash: str, previous: Optional[StyleSnapshot]) -> StyleSnapshot:
+        """Embed styles, reusing rows from the previous snapshot for styles whose text did not change"""
+        styles = styles_data.get("styles", [])
+        texts = [self._style_to_text(style) for style in styles]
+        text_hashes = [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in texts]
+        if self.semantic_model is None or np is None or not styles:
+            return StyleSnapshot(styles_data, None, text_hashes, content_hash)
+        reusable = {}
+        if previous is not None and previous.embeddings is not None:
+            reusable = {h: previous.embeddings[i] for i, h in enumerate(previous.text_hashes)}
+        elif self.style_store is not None:
+            reusable = {h: self.style_store.vector(self.style_store.row(h)) for h in text_hashes
+                        if self.style_store.row(h) is not None}
+        missing = [i for i, h in enumerate(text_hashes) if h not in reusable]
+        encoded = {}
+        if missing:
+            vectors = self.semantic_model.encode([texts[i] for i in missing], normalize_embeddings=True)
+            encoded = {text_hashes[i]: vectors[row] for row, i in enumerate(missing)}
+            if self.style_store is not None:
+                try:
+                    self.style_store.write(
+                        (h, reusable.get(h, encoded.get(h)), {"id": style.get("id")}) for h, style in zip(text_hashes, styles))
+                except OSError as exc:
+                    logger.warning(f"Could not persist style embeddings: {exc}")
+        # A fresh matrix rather than writing into the old one: in-flight queries keep indexing their own snapshot
+        embeddings = np.stack([reusable.get(h, encoded.get(h)) for h in text_hashes])
+        if previous is not None:
+            logger.info("Style embeddings updated: %d re-encoded, %d reused", len(missing), len(styles) - len(missing))
+        return StyleSnapshot(styles_data, embeddings, text_hashes, content_hash)
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """Reload the styles file if it changed; cheap stat check, at most once per reload interval"""
+        if not force:
+            if self.reload_interval <= 0 or time.monotonic() < self._next_check:
+                return False
+        # One caller reloads; concurrent callers carry on with the current snapshot
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_check = time.monotonic() + self.reload_interval
+            file_stat = self._stat_styles_file()
+            if not force and (file_stat is None or file_stat == self._file_stat):
+                return False
+            self._file_stat = file_stat
+            styles_data, content_hash = self._load_styles()
+            current = self._snapshot
+            if content_hash == current.content_hash:
+                return False  # touched but identical
+            if not content_hash and current.styles_data.get("styles"):
+                logger.warning("Keeping the previous %d styles until %s is valid again",
+                               len(current.styles_data["styles"]), self.styles_file)
+                return False
+            if self.semantic_model is None and SentenceTransformer is not None and styles_data.get("styles"):
+                self._snapshot = StyleSnapshot(styles_data, content_hash=content_hash)
+                self._initialize_semantic_model()
+            else:
+                self._snapshot = self._build_snapshot(styles_data, content_hash, previous=current)
+            logger.info(f"Reloaded {len(styles_data.get('styles', []))} style references from {self.styles_file}")
+            self._bump_version("styles file reloaded")
+            return True
+        except Exception as exc:
+            logger.warning(f"Styles reload failed, keeping previous snapshot: {exc}")
+            return False
+        finally:
+            self._reload_lock.release()
 
     def _style_to_text(self, style: Dict) -> str:
         """Convert style fields into descriptive text for embedding"""
@@ -133,42 +275,59 @@ class ImageStyleRetriever:
         
         return min(similarity, 1.0)  # Cap at 1.0
     
-    def _query_kb_images(self, query_text: str, top_k: int = 3) -> List[Dict]:
-        """Query Firestore knowledge base for documents with imageUrl"""
-        if not FIRESTORE_AVAILABLE or not self.db:
+    def _sync_kb_store(self):
+        """Pull recent KB image documents into the memory-mapped store (at most once per KB_REFRESH_INTERVAL)"""
+        if time.monotonic() < self._kb_next_refresh:
+            if self.kb_store.refresh():  # another process may have synced already
+                self._bump_version("KB index updated by another process")
+            return
+        self._kb_next_refresh = time.monotonic() + KB_REFRESH_INTERVAL
+        kb_ref = self.db.collection('knowledgeBase')
+        # Note: Firestore doesn't support querying for non-null fields directly
+        # For now, we'll query all recent documents and filter for those with imageUrl
+        query = kb_ref.order_by('createdAt', direction=firestore.Query.DESCENDING).limit(KB_QUERY_LIMIT)
+        entries = []
+        for doc in query.stream():
+            doc_data = doc.to_dict()
+            # Check if document has imageUrl and embedding
+            if doc_data.get('imageUrl') and doc_data.get('embedding'):
+                # Create a style-like object from KB document; the embedding lives only in the store
+                kb_style = {
+                    'id': f"kb_{doc.id}",
+                    'source': 'knowledgeBase',
+                    'imageUrl': doc_data.get('imageUrl'),
+                    'title': doc_data.get('title', ''),
+                    'description': doc_data.get('content', '')[:200],  # First 200 chars
+                    'keywords': doc_data.get('tags', []),
+                    'category': doc_data.get('category', ''),
+                    'layout': self._infer_layout_from_content(doc_data.get('content', '')),
+                    'visualElements': self._extract_visual_elements(doc_data),
+                    'version': str(doc_data.get('updatedAt') or doc_data.get('createdAt') or ''),
+                }
+                entries.append((doc.id, doc_data['embedding'], kb_style))
+        current = [(doc_id, meta.get('version')) for doc_id, meta in zip(self.kb_store.ids, self.kb_store.metadata)]
+        if current != [(doc_id, meta['version']) for doc_id, _, meta in entries]:
+            self.kb_store.write(entries)
+            self._bump_version("KB index synced")
+        logger.info(f"Found {len(entries)} image examples in knowledge base")
+
+    def _query_kb_images(self, query_embedding, story_keywords: List[str], top_k: int = 3) -> List[tuple]:
+        """Top (similarity, kb_style) pairs from the knowledge base, scored on the packed embedding matrix"""
+        if not FIRESTORE_AVAILABLE or not self.db or self.kb_store is None:
             return []
         
         try:
-            # Query knowledge base for documents with imageUrl field
-            kb_ref = self.db.collection('knowledgeBase')
-            # Note: Firestore doesn't support querying for non-null fields directly
-            # We'll need to fetch and filter, or use a different approach
-            # For now, we'll query all recent documents and filter for those with imageUrl
-            query = kb_ref.order_by('createdAt', direction=firestore.Query.DESCENDING).limit(50)
-            docs = query.stream()
-            
-            kb_images = []
-            for doc in docs:
-                doc_data = doc.to_dict()
-                # Check if document has imageUrl and embedding
-                if doc_data.get('imageUrl') and doc_data.get('embedding'):
-                    # Create a style-like object from KB document
-                    kb_style = {
-                        'id': f"kb_{doc.id}",
-                        'source': 'knowledgeBase',
-                        'imageUrl': doc_data.get('imageUrl'),
-                        'title': doc_data.get('title', ''),
-                        'description': doc_data.get('content', '')[:200],  # First 200 chars
-                        'keywords': doc_data.get('tags', []),
-                        'category': doc_data.get('category', ''),
-                        'embedding': doc_data.get('embedding'),  # Store embedding for similarity
-                        'layout': self._infer_layout_from_content(doc_data.get('content', '')),
-                        'visualElements': self._extract_visual_elements(doc_data)
-                    }
-                    kb_images.append(kb_style)
-            
-            logger.info(f"Found {len(kb_images)} image examples in knowledge base")
-            return kb_images[:top_k]  # Return top K
+            self._sync_kb_store()
+            store = self.kb_store
+            if not len(store):
+                return []
+            semantic_scores = store.scores(query_embedding) if query_embedding is not None else None
+            scored = []
+            for row, kb_style in enumerate(store.metadata):
+                semantic = float(semantic_scores[row]) if semantic_scores is not None else None
+                scored.append((self._calculate_kb_similarity(semantic, story_keywords, kb_style), kb_style))
+            scored.sort(key=lambda x: x[0], reverse=True)
+            return scored[:top_k]
             
         except Exception as exc:
             logger.warning(f"Failed to query knowledge base images: {exc}")
@@ -208,36 +367,15 @@ class ImageStyleRetriever:
         
         return elements[:3]  # Limit to 3 elements
     
-    def _calculate_kb_similarity(self, query_embedding: Optional[np.ndarray], story_keywords: List[str], kb_style: Dict) -> float:
-        """Calculate similarity score for knowledge base image using embeddings and keywords"""
-        if not query_embedding or not kb_style.get('embedding'):
+    def _calculate_kb_similarity(self, semantic_score: Optional[float], story_keywords: List[str], kb_style: Dict) -> float:
+        """Combine the stored-embedding cosine similarity with keyword overlap for a knowledge base image"""
+        keyword_score = self._calculate_similarity(story_keywords, kb_style)
+        if semantic_score is None:
             # Fallback to keyword matching only
-            return self._calculate_similarity(story_keywords, kb_style)
-        
-        try:
-            # Convert embedding to numpy array if it's a list
-            kb_embedding = kb_style['embedding']
-            if isinstance(kb_embedding, list):
-                kb_embedding = np.array(kb_embedding)
-            
-            # Normalize embeddings
-            query_norm = query_embedding / (np.linalg.norm(query_embedding) + 1e-8)
-            kb_norm = kb_embedding / (np.linalg.norm(kb_embedding) + 1e-8)
-            
-            # Calculate cosine similarity (dot product of normalized vectors)
-            semantic_score = float(np.dot(query_norm, kb_norm))
-            
-            # Calculate keyword score
-            keyword_score = self._calculate_similarity(story_keywords, kb_style)
-            
-            # Combined score: 70% semantic, 30% keyword (optimized weighting)
-            combined_score = (0.7 * semantic_score) + (0.3 * keyword_score)
-            
-            return min(combined_score, 1.0)  # Cap at 1.0
-            
-        except Exception as exc:
-            logger.warning(f"Error calculating KB similarity: {exc}")
-            return self._calculate_similarity(story_keywords, kb_style)
+            return keyword_score
+        # Combined score: 70% semantic, 30% keyword (optimized weighting)
+        combined_score = (0.7 * semantic_score) + (0.3 * keyword_score)
+        return min(combined_score, 1.0)  # Cap at 1.0
     
     def retrieve_styles(self, title: str, metrics_text: str, top_k: int = 2) -> List[Dict]:
         """
@@ -253,17 +391,15 @@ class ImageStyleRetriever:
             List of style dictionaries sorted by relevance
         """
         all_styles = []
+        self.maybe_reload()
+        snapshot = self._snapshot  # styles and embedding rows stay consistent for this call
         
         # 1. Get local JSON styles
         local_styles = []
-        if self.styles_data.get("styles"):
-            local_styles = self.styles_data.get("styles", [])
+        if snapshot.styles_data.get("styles"):
+            local_styles = snapshot.styles_data.get("styles", [])
         
-        # 2. Get knowledge base image examples
-        kb_styles = []
         query_text = f"{title} {metrics_text}".strip()
-        if self.db:
-            kb_styles = self._query_kb_images(query_text, top_k=3)
         
         # Extract keywords from story
         story_keywords = self._extract_keywords(title, metrics_text)
@@ -278,14 +414,19 @@ class ImageStyleRetriever:
                 logger.warning("Failed to generate semantic embedding for prompt: %s", exc)
                 query_embedding = None
         
+        # 2. Get knowledge base image examples (already scored against the stored embeddings)
+        kb_scored = []
+        if self.db:
+            kb_scored = self._query_kb_images(query_embedding, story_keywords, top_k=3)
+        
         # Calculate similarity for local styles
         styles_with_scores = []
-        if self.style_embeddings is not None and query_embedding is not None:
+        if snapshot.embeddings is not None and query_embedding is not None:
             for idx, style in enumerate(local_styles):
                 keyword_score = self._calculate_similarity(story_keywords, style)
                 semantic_score = 0.0
                 if query_embedding is not None:
-                    semantic_score = float(np.dot(query_embedding, self.style_embeddings[idx]))
+                    semantic_score = float(np.dot(query_embedding, snapshot.embeddings[idx]))
                 # Optimized weighting: 70% semantic, 30% keyword
                 combined_score = (0.7 * semantic_score) + (0.3 * keyword_score)
                 styles_with_scores.append((combined_score, style, 'local'))
@@ -295,9 +436,8 @@ class ImageStyleRetriever:
                 keyword_score = self._calculate_similarity(story_keywords, style)
                 styles_with_scores.append((keyword_score, style, 'local'))
         
-        # Calculate similarity for KB styles
-        for kb_style in kb_styles:
-            similarity = self._calculate_kb_similarity(query_embedding, story_keywords, kb_style)
+        # Add KB styles
+        for similarity, kb_style in kb_scored:
             styles_with_scores.append((similarity, kb_style, 'kb'))
         
         # Sort by similarity (descending)
@@ -312,7 +452,7 @@ class ImageStyleRetriever:
             logger.info(f"Retrieved {len(top_styles)} style(s). Top match: {top_styles[0].get('id', 'unknown')} (similarity: {top_score:.2f}, source: {top_source})")
         else:
             logger.warning("No styles matched, using default")
-            default = self.styles_data.get("defaultStyle", {})
+            default = snapshot.styles_data.get("defaultStyle", {})
             top_styles = [default] if default else []
         
         return top_styles
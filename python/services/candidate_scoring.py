@@ -0,0 +1,103 @@
+# Cheap automatic ranking of candidate images against their prompt.
+import os
+import logging
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageStat
+
+logger = logging.getLogger("candidate_scoring")
+logger.setLevel(logging.INFO)
+
+CLIP_MODEL_ID = os.environ.get("CANDIDATE_CLIP_MODEL", "openai/clip-vit-base-patch32")
+# Same sentence-transformers stack the RAG retriever uses. Its all-MiniLM-L6-v2 model is text-only
+# and cannot embed images, so the fallback loads the stack's CLIP checkpoint instead.
+ST_CLIP_MODEL_ID = os.environ.get("CANDIDATE_ST_CLIP_MODEL", "clip-ViT-B-32")
+
+
+class CandidateScorer:
+    """Scores images by CLIP prompt similarity; falls back to sentence-transformers CLIP, then contrast."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend: Optional[str] = None
+        self._clip = None
+        self._processor = None
+        self._st_model = None
+
+    @property
+    def backend(self) -> str:
+        self._ensure_backend()
+        return self._backend
+
+    def _ensure_backend(self):
+        with self._lock:
+            if self._backend is not None:
+                return
+            try:
+                from transformers import CLIPModel, CLIPProcessor
+                self._clip = CLIPModel.from_pretrained(CLIP_MODEL_ID).eval()
+                self._processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID)
+                self._backend = "clip"
+            except Exception as exc:
+                logger.warning("CLIP scorer unavailable (%s); trying sentence-transformers", exc)
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._st_model = SentenceTransformer(ST_CLIP_MODEL_ID)
+                    self._backend = "sentence-transformers"
+                except Exception as st_exc:
+                    logger.warning("sentence-transformers scorer unavailable (%s); using contrast heuristic", st_exc)
+                    self._backend = "contrast"
+            logger.info("Candidate scorer backend: %s", self._backend)
+
+    def score(self, prompt: str, images: Sequence[Image.Image]) -> List[float]:
+        if not images:
+            return []
+        self._ensure_backend()
+        try:
+            if self._backend == "clip":
+                return self._score_clip(prompt, images)
+            if self._backend == "sentence-transformers":
+                return self._score_st(prompt, images)
+        except Exception as exc:
+            logger.warning("Candidate scoring failed (%s); using contrast heuristic", exc)
+        return [_contrast_score(image) for image in images]
+
+    def _score_clip(self, prompt: str, images: Sequence[Image.Image]) -> List[float]:
+        import torch
+        inputs = self._processor(text=[prompt], images=list(images), return_tensors="pt",
+                                 padding=True, truncation=True)
+        with torch.no_grad():
+            outputs = self._clip(**inputs)
+        image_embeds = outputs.image_embeds / outputs.image_embeds.norm(dim=-1, keepdim=True)
+        text_embeds = outputs.text_embeds / outputs.text_embeds.norm(dim=-1, keepdim=True)
+        return (image_embeds @ text_embeds[0]).tolist()
+
+    def _score_st(self, prompt: str, images: Sequence[Image.Image]) -> List[float]:
+        image_embeds = self._st_model.encode(list(images), normalize_embeddings=True)
+        text_embed = self._st_model.encode([prompt], normalize_embeddings=True)[0]
+        return [float(v) for v in image_embeds @ text_embed]
+
+
+def _contrast_score(image: Image.Image) -> float:
+    # Washed-out or blank renders have low luminance spread; prefer the most detailed one.
+    return ImageStat.Stat(image.convert("L")).stddev[0] / 128.0
+
+
+_scorer: Optional[CandidateScorer] = None
+_scorer_lock = threading.Lock()
+
+
+def get_scorer() -> CandidateScorer:
+    """Process-wide scorer, so concurrent requests share one loaded model."""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            _scorer = CandidateScorer()
+        return _scorer
+
+
+def rank_candidates(prompt: str, images: Sequence[Image.Image]) -> List[Tuple[int, float]]:
+    """(index, score) pairs for `images`, best first."""
+    scores = get_scorer().score(prompt, images)
+    return sorted(enumerate(scores), key=lambda item: item[1], reverse=True)
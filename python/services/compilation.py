@@ -0,0 +1,160 @@
+# Opt-in torch.compile path for CPU hosts: channels-last UNet/VAE, fused SDPA attention, one graph per shape bucket.
+import os
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("compilation")
+logger.setLevel(logging.INFO)
+
+PIPELINE_COMPILE = os.environ.get("PIPELINE_COMPILE", "false").lower() in ("1", "true", "yes")
+COMPILE_MODE = os.environ.get("PIPELINE_COMPILE_MODE", "max-autotune-no-cudagraphs")
+# Width x height buckets compiled and warmed up at load (the monitor's retry profiles); other shapes run eager.
+COMPILE_SHAPES = os.environ.get("PIPELINE_COMPILE_SHAPES", "512x512,448x448")
+COMPILE_WARMUP_STEPS = int(os.environ.get("PIPELINE_COMPILE_WARMUP_STEPS", "2"))
+COMPILE_CACHE_DIR = os.environ.get(
+    "PIPELINE_COMPILE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compile_cache"),
+)
+
+if PIPELINE_COMPILE:
+    # Inductor reads these when it is first imported; its FX graph cache makes restarts skip codegen.
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(COMPILE_CACHE_DIR, "inductor"))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+
+
+def parse_shapes(spec: str) -> List[Tuple[int, int]]:
+    shapes = []
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if item:
+            width, _, height = item.partition("x")
+            shapes.append((int(width), int(height)))
+    return shapes
+
+
+class _BucketedForward:
+    """Routes a module's forward to its compiled graph for bucketed latent sizes, eager otherwise.
+
+    A compiled call that raises is retried eagerly and the bucket path is switched off for good.
+    """
+
+    def __init__(self, module, name: str, latent_sizes: Iterable[Tuple[int, int]], mode: str):
+        import torch
+        self.name = name
+        self.eager = module.forward
+        self.compiled = torch.compile(self.eager, mode=mode, dynamic=False)
+        self.latent_sizes = set(latent_sizes)
+        self.failed = False
+        self.calls = {"compiled": 0, "eager": 0}
+
+    def __call__(self, sample, *args, **kwargs):
+        if not self.failed and tuple(sample.shape[-2:]) in self.latent_sizes:
+            try:
+                result = self.compiled(sample, *args, **kwargs)
+                self.calls["compiled"] += 1
+                return result
+            except Exception as exc:
+                self.failed = True
+                logger.warning("Compiled %s failed, falling back to eager: %s", self.name, exc)
+        self.calls["eager"] += 1
+        return self.eager(sample, *args, **kwargs)
+
+
+def _cache_artifact_path(model_id: str, pipe, shapes: List[Tuple[int, int]]) -> str:
+    import torch
+    shape_key = "-".join(f"{w}x{h}" for w, h in shapes)
+    name = f"{model_id.replace('/', '--')}_{str(pipe.dtype).replace('torch.', '')}_{shape_key}_torch{torch.__version__}.bin"
+    return os.path.join(COMPILE_CACHE_DIR, name)
+
+
+def _load_cache_artifacts(path: str):
+    """torch >= 2.6 can preload every compile artifact (graphs, autotuning) from one file."""
+    import torch
+    loader = getattr(getattr(torch, "compiler", None), "load_cache_artifacts", None)
+    if loader is None or not os.path.exists(path):
+        return
+    try:
+        with open(path, "rb") as f:
+            loader(f.read())
+        logger.info("Loaded compile cache %s", path)
+    except Exception as exc:
+        logger.warning("Ignoring unreadable compile cache %s: %s", path, exc)
+
+
+def _save_cache_artifacts(path: str):
+    import torch
+    saver = getattr(getattr(torch, "compiler", None), "save_cache_artifacts", None)
+    if saver is None:
+        return
+    try:
+        artifacts = saver()
+        if artifacts:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(artifacts[0])
+            os.replace(path + ".tmp", path)
+    except Exception as exc:
+        logger.warning("Could not save compile cache %s: %s", path, exc)
+
+
+def restore_eager(pipe):
+    """Undo compile_pipeline: original forwards, default memory layout kept (harmless for eager)."""
+    for module, _ in getattr(pipe, "_vera_compiled", {}).values():
+        module.__dict__.pop("forward", None)
+    pipe._vera_compiled = {}
+    return pipe
+
+
+def compile_pipeline(pipe, model_id: str, shapes: Optional[List[Tuple[int, int]]] = None,
+                     mode: str = COMPILE_MODE, warmup_steps: int = COMPILE_WARMUP_STEPS) -> bool:
+    """Compile the UNet and VAE decoder for each shape bucket and warm them up; False (eager) on any failure."""
+    import torch
+    shapes = shapes or parse_shapes(COMPILE_SHAPES)
+    if any(hasattr(getattr(pipe, name, None), "_hf_hook") for name in ("unet", "vae")):
+        logger.warning("CPU offload hooks are installed; skipping compilation")
+        return False
+    started = time.perf_counter()
+    cache_path = _cache_artifact_path(model_id, pipe, shapes)
+    try:
+        from diffusers.models.attention_processor import AttnProcessor2_0
+        _load_cache_artifacts(cache_path)
+        # Fused SDPA replaces attention slicing; channels-last suits oneDNN convolutions on CPU.
+        pipe.unet.set_attn_processor(AttnProcessor2_0())
+        pipe.unet.to(memory_format=torch.channels_last)
+        pipe.vae.to(memory_format=torch.channels_last)
+        # Classifier-free guidance and candidate batches each add a graph per bucket.
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 8 * len(shapes))
+        latent_sizes = [(h // 8, w // 8) for w, h in shapes]
+        pipe._vera_compiled = {}
+        for name, module in (("unet", pipe.unet), ("vae.decoder", pipe.vae.decoder)):
+            bucketed = _BucketedForward(module, name, latent_sizes, mode)
+            module.forward = bucketed  # instance attribute: hooks and attributes of the module stay intact
+            pipe._vera_compiled[name] = (module, bucketed)
+        with torch.no_grad():
+            for width, height in shapes:
+                bucket_started = time.perf_counter()
+                pipe("warm-up", num_inference_steps=warmup_steps, width=width, height=height, guidance_scale=7.5)
+                logger.info("Compiled %dx%d bucket in %.1fs", width, height, time.perf_counter() - bucket_started)
+        if any(bucketed.failed for _, bucketed in pipe._vera_compiled.values()):
+            raise RuntimeError("compiled graph failed during warm-up")
+    except Exception as exc:
+        logger.warning("Compilation failed, using eager mode: %s", exc)
+        restore_eager(pipe)
+        return False
+    _save_cache_artifacts(cache_path)
+    logger.info("Compiled pipeline %s for %s in %.1fs (mode=%s)", model_id,
+                ", ".join(f"{w}x{h}" for w, h in shapes), time.perf_counter() - started, mode)
+    return True
+
+
+def maybe_compile(pipe, model_id: str):
+    """compile_pipeline when PIPELINE_COMPILE is set; always returns the (possibly compiled) pipeline."""
+    if PIPELINE_COMPILE:
+        compile_pipeline(pipe, model_id)
+    return pipe
+
+
+def compiled_stats(pipe) -> Dict[str, Any]:
+    return {name: {"failed": bucketed.failed, **bucketed.calls}
+            for name, (_, bucketed) in getattr(pipe, "_vera_compiled", {}).items()}
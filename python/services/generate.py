@@ -1,16 +1,33 @@
 # Minimal generate wrapper: returns PNG bytes.
 import io
+import os
+import random
 import logging
-from typing import Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 
 import torch
 from PIL import Image
 
-from .pipeline import get_pipeline
+from .candidate_scoring import rank_candidates
+from .metrics import BACKEND_SELECTED, IMAGE_ENCODE
+from .samplers import use_sampler
+from .scheduler import Priority, get_scheduler
+from .singleflight import SingleFlight
 
 logger = logging.getLogger("image_generate")
 logger.setLevel(logging.INFO)
 
+# on_step(step_index, total_steps, latents) is called after every denoising step;
+# raising GenerationCancelled from it stops the run at that step boundary.
+StepObserver = Callable[[int, int, Optional[torch.Tensor]], None]
+
+
+class GenerationCancelled(Exception):
+    """Raised by a step observer when the caller no longer wants the result."""
+
+
 def generate_image_bytes(
     prompt: str,
     seed: Optional[int] = None,
@@ -18,51 +35,158 @@ def generate_image_bytes(
     num_inference_steps: int = 25,
     width: int = 512,
     height: int = 512,
+    priority: Priority = Priority.INTERACTIVE,
+    model_id: Optional[str] = None,
+    on_step: Optional[StepObserver] = None,
+    sampler: Optional[str] = None,
+) -> bytes:
+    images = _generate_images(prompt, [seed], guidance_scale, num_inference_steps, width, height,
+                              priority, model_id, on_step, sampler)
+    return _to_png(images[0])
+
+
+# Identical concurrent requests (retries, several users) share one diffusion run.
+_inflight = SingleFlight(name="generate_singleflight")
+_inflight_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("GENERATE_MAX_INFLIGHT", "32")), thread_name_prefix="generate"
+)
+
+
+async def generate_image_bytes_shared(
+    prompt: str,
+    seed: Optional[int] = None,
+    guidance_scale: float = 7.5,
+    num_inference_steps: int = 25,
+    width: int = 512,
+    height: int = 512,
+    model_id: Optional[str] = None,
+    sampler: Optional[str] = None,
 ) -> bytes:
+    """Async generate_image_bytes that attaches to an identical in-flight generation if one exists."""
+    key = (prompt, seed, float(guidance_scale), int(num_inference_steps), int(width), int(height), model_id, sampler)
+
+    def _start(cancel_event: threading.Event) -> Future:
+        def _stop_if_abandoned(step_index, total_steps, latents):
+            if cancel_event.is_set():
+                raise GenerationCancelled()
+
+        return _inflight_executor.submit(
+            generate_image_bytes, prompt, seed, guidance_scale, num_inference_steps, width, height,
+            model_id=model_id, on_step=_stop_if_abandoned, sampler=sampler,
+        )
+
+    return await _inflight.run_async(key, _start)
+
+
+def coalescing_stats() -> Dict[str, int]:
+    """started = real runs, coalesced = requests served by someone else's run."""
+    return _inflight.stats()
+
+
+def generate_candidate_bytes(
+    prompt: str,
+    num_candidates: int,
+    seed: Optional[int] = None,
+    guidance_scale: float = 7.5,
+    num_inference_steps: int = 25,
+    width: int = 512,
+    height: int = 512,
+    priority: Priority = Priority.INTERACTIVE,
+    model_id: Optional[str] = None,
+    sampler: Optional[str] = None,
+) -> List[Dict]:
+    """Render N variants in one batched call (shared text encoding, seeds seed..seed+N-1).
+
+    Returns [{"seed", "score", "png"}, ...] ranked best-first by the candidate scorer.
+    """
+    if num_candidates < 1:
+        raise ValueError("num_candidates must be >= 1")
+    base_seed = int(seed) if seed is not None else random.randrange(2**31)
+    seeds = [base_seed + i for i in range(num_candidates)]
+    images = _generate_images(prompt, seeds, guidance_scale, num_inference_steps, width, height, priority, model_id,
+                              sampler=sampler)
+    ranked = rank_candidates(prompt, images)
+    return [{"seed": seeds[i], "score": round(score, 4), "png": _to_png(images[i])} for i, score in ranked]
+
+
+def _generate_images(prompt, seeds, guidance_scale, num_inference_steps, width, height,
+                     priority, model_id, on_step=None, sampler=None) -> List[Image.Image]:
     if not prompt:
         raise ValueError("prompt must be a non-empty string")
 
-    pipe = get_pipeline()
+    def _job(pipe, step_callback):
+        if on_step is not None:
+            step_callback = _observe_steps(step_callback, on_step, int(num_inference_steps))
+        # The scheduler runs one job at a time, so swapping the sampler for this job is safe.
+        with use_sampler(pipe, sampler):
+            return _run_pipeline(pipe, prompt, seeds, guidance_scale, num_inference_steps, width, height, step_callback)
+
+    try:
+        images = get_scheduler().run(_job, priority=priority, steps=int(num_inference_steps), model=model_id)
+        BACKEND_SELECTED.inc(len(images), backend="local-sd")
+        return images
+    except GenerationCancelled:
+        raise
+    except Exception as exc:
+        logger.exception("Pipeline inference failed")
+        raise RuntimeError(f"Image generation failed: {exc}") from exc
+
+
+def _to_png(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    with IMAGE_ENCODE.time():
+        image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _observe_steps(step_callback, on_step: StepObserver, total_steps: int):
+    def _callback(pipe, step_index, timestep, callback_kwargs):
+        callback_kwargs = step_callback(pipe, step_index, timestep, callback_kwargs)
+        on_step(step_index, total_steps, callback_kwargs.get("latents"))
+        return callback_kwargs
+    return _callback
+
 
+def _run_pipeline(pipe, prompt, seeds, guidance_scale, num_inference_steps, width, height, step_callback) -> List[Image.Image]:
     # Determine device/dtype
     device = next(pipe.unet.parameters()).device if hasattr(pipe, "unet") else ("cuda" if torch.cuda.is_available() else "cpu")
     is_cuda = str(device).startswith("cuda")
     use_fp16 = getattr(pipe, "dtype", None) == torch.float16
 
+    # One generator per image so each candidate is reproducible from its own seed.
     generator = None
-    if seed is not None:
+    if any(seed is not None for seed in seeds):
         gen_device = device if isinstance(device, torch.device) else torch.device(device)
-        generator = torch.Generator(device=gen_device).manual_seed(int(seed))
+        generator = [torch.Generator(device=gen_device).manual_seed(int(seed if seed is not None else random.randrange(2**31)))
+                     for seed in seeds]
+        if len(generator) == 1:
+            generator = generator[0]
 
-    try:
-        with torch.no_grad():
-            if is_cuda and use_fp16:
-                with torch.cuda.amp.autocast():
-                    result = pipe(
-                        prompt,
-                        height=height,
-                        width=width,
-                        num_inference_steps=int(num_inference_steps),
-                        guidance_scale=float(guidance_scale),
-                        generator=generator,
-                    )
-            else:
+    with torch.no_grad():
+        if is_cuda and use_fp16:
+            with torch.cuda.amp.autocast():
                 result = pipe(
                     prompt,
                     height=height,
                     width=width,
                     num_inference_steps=int(num_inference_steps),
                     guidance_scale=float(guidance_scale),
+                    num_images_per_prompt=len(seeds),
                     generator=generator,
+                    callback_on_step_end=step_callback,
                 )
-    except Exception as exc:
-        logger.exception("Pipeline inference failed")
-        raise RuntimeError(f"Image generation failed: {exc}") from exc
+        else:
+            result = pipe(
+                prompt,
+                height=height,
+                width=width,
+                num_inference_steps=int(num_inference_steps),
+                guidance_scale=float(guidance_scale),
+                num_images_per_prompt=len(seeds),
+                generator=generator,
+                callback_on_step_end=step_callback,
+            )
 
     if not hasattr(result, "images") or not result.images:
         raise RuntimeError("Pipeline returned no images")
-
-    image: Image.Image = result.images[0]
-    buf = io.BytesIO()
-    image.save(buf, format="PNG")
-    return buf.getvalue()
\ No newline at end of file
+    return list(result.images)
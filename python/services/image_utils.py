@@ -1,13 +1,34 @@
 import base64
-from typing import Tuple
+from typing import Dict, Iterator, Optional, Tuple
+
+# Multiple of 3 so independently encoded chunks concatenate into one valid base64 string.
+DATA_URI_CHUNK_BYTES = 48 * 1024
 
 def bytes_to_data_uri_png(png_bytes: bytes) -> str:
     b64 = base64.b64encode(png_bytes).decode("ascii")
     return f"data:image/png;base64,{b64}"
 
+def iter_data_uri_png(png_bytes: bytes, chunk_bytes: int = DATA_URI_CHUNK_BYTES) -> Iterator[str]:
+    """The same data URI as bytes_to_data_uri_png, as a header then base64 chunks (no full-size copy)."""
+    if chunk_bytes <= 0 or chunk_bytes % 3:
+        raise ValueError("chunk_bytes must be a positive multiple of 3")
+    yield "data:image/png;base64,"
+    view = memoryview(png_bytes)
+    for start in range(0, len(view), chunk_bytes):
+        yield base64.b64encode(view[start:start + chunk_bytes]).decode("ascii")
+
+def multipart_part_head(boundary: str, content_type: str, length: int, headers: Optional[Dict[str, str]] = None) -> bytes:
+    """Delimiter and headers of one multipart/mixed part; the body and a trailing CRLF follow."""
+    lines = [f"--{boundary}", f"Content-Type: {content_type}", f"Content-Length: {length}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("ascii")
+
+def multipart_end(boundary: str) -> bytes:
+    return f"--{boundary}--\r\n".encode("ascii")
+
 def split_data_uri(data_uri: str) -> Tuple[str, str]:
     if not data_uri.startswith("data:"):
         raise ValueError("Not a data URI")
     header, _, payload = data_uri.partition(",")
     mime = header[5:].split(";")[0]
-    return mime, payload
\ No newline at end of file
+    return mime, payload
@@ -0,0 +1,240 @@
+# Stage-level latency histograms and counters in Prometheus text format (no client dependency).
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("metrics")
+logger.setLevel(logging.INFO)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; wide enough for both a 30 ms Firestore commit and a 10 minute CPU render.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[LabelValues, List[float]] = {}  # per-bucket counts, then sum
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 1)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+# Generation stages, in pipeline order.
+QUEUE_WAIT = histogram("vera_queue_wait_seconds", "Time a job waited in the generation scheduler queue.", ["priority"])
+RAG_RETRIEVAL = histogram("vera_rag_retrieval_seconds", "Style retrieval (RAG) time per story.")
+TEXT_ENCODE = histogram("vera_text_encode_seconds", "CLIP text encoder forward time.")
+DENOISE_STEP = histogram("vera_denoise_step_seconds", "Wall time of one denoising step.",
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 40.0))
+VAE_DECODE = histogram("vera_vae_decode_seconds", "VAE latent-to-image decode time.")
+IMAGE_ENCODE = histogram("vera_image_encode_seconds", "PNG encode time per image.")
+UPLOAD = histogram("vera_upload_seconds", "Cloud Storage upload time per image.")
+FIRESTORE_COMMIT = histogram("vera_firestore_commit_seconds", "Story document write time.")
+
+CACHE_HITS = counter("vera_cache_hits_total", "Cache lookups served without new work.", ["cache"])
+CACHE_MISSES = counter("vera_cache_misses_total", "Cache lookups that required new work.", ["cache"])
+RETRIES = counter("vera_generation_retries_total", "Failed generation attempts, by error category.", ["category"])
+BACKEND_SELECTED = counter("vera_backend_selected_total", "Images produced, by backend.", ["backend"])
+
+
+def cache_lookup(cache: str, hit: bool):
+    (CACHE_HITS if hit else CACHE_MISSES).inc(cache=cache)
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
+
+
+def instrument_pipeline(pipe):
+    """Time the text encoder and VAE decode of a diffusers pipeline (idempotent)."""
+    if getattr(pipe, "_vera_instrumented", False):
+        return pipe
+    text_encoder = getattr(pipe, "text_encoder", None)
+    if text_encoder is not None and hasattr(text_encoder, "register_forward_pre_hook"):
+        starts = threading.local()
+        text_encoder.register_forward_pre_hook(lambda module, args: setattr(starts, "t", time.perf_counter()))
+        text_encoder.register_forward_hook(
+            lambda module, args, output: TEXT_ENCODE.observe(time.perf_counter() - getattr(starts, "t", time.perf_counter())))
+    vae = getattr(pipe, "vae", None)
+    if vae is not None and hasattr(vae, "decode"):
+        decode = vae.decode
+
+        def timed_decode(*args, **kwargs):
+            with VAE_DECODE.time():
+                return decode(*args, **kwargs)
+        vae.decode = timed_decode
+    pipe._vera_instrumented = True
+    return pipe
+
+
+class StepTimer:
+    """Observes the wall time between consecutive denoising-step callbacks."""
+
+    def __init__(self):
+        self._last: Optional[float] = None
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._last is not None:
+            DENOISE_STEP.observe(now - self._last)
+        self._last = now
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_latest().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # scrapes every few seconds; keep them out of the service log
+        return
+
+
+def start_exporter(port: int, addr: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a background thread (for processes without the FastAPI app)."""
+    if port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer((addr, port), _Handler)
+    except OSError as exc:
+        logger.warning("Metrics exporter could not bind %s:%d: %s", addr, port, exc)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    logger.info("Metrics exporter listening on %s:%d/metrics", addr, port)
+    return server
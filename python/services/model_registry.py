@@ -0,0 +1,161 @@
+# Multi-model pipeline registry with LRU eviction under a memory budget and idle unloading.
+import gc
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import torch
+
+from .metrics import cache_lookup, instrument_pipeline
+
+logger = logging.getLogger("model_registry")
+logger.setLevel(logging.INFO)
+
+MEMORY_BUDGET_MB = float(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0"))  # 0 = unlimited
+IDLE_TIMEOUT_SECONDS = float(os.environ.get("MODEL_IDLE_TIMEOUT_SECONDS", "900"))  # 0 = never unload
+FORCE_FP32 = os.environ.get("PIPELINE_FORCE_FP32", "false").lower() in ("1", "true", "yes")
+
+# (model_id, dtype name, device)
+ModelKey = Tuple[str, str, str]
+# loader(model_id, torch_dtype, device) -> pipeline
+Loader = Callable[[str, Any, str], Any]
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def default_dtype(device: str):
+    return torch.float16 if device == "cuda" and not FORCE_FP32 else torch.float32
+
+
+def pipeline_memory_bytes(pipe) -> int:
+    """Resident size of a pipeline's weights: parameter and buffer bytes of every torch module."""
+    total = 0
+    components = getattr(pipe, "components", None) or {}
+    for component in components.values():
+        if isinstance(component, torch.nn.Module):
+            for tensor in list(component.parameters()) + list(component.buffers()):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _Entry:
+    __slots__ = ("pipe", "size_bytes", "last_used")
+
+    def __init__(self, pipe, size_bytes: int):
+        self.pipe = pipe
+        self.size_bytes = size_bytes
+        self.last_used = time.monotonic()
+
+
+class ModelRegistry:
+    """Loads pipelines on demand keyed by model id, dtype and device; evicts least-recently-used."""
+
+    def __init__(self, loader: Loader, default_model_id: str, budget_mb: float = MEMORY_BUDGET_MB,
+                 idle_timeout: float = IDLE_TIMEOUT_SECONDS):
+        self.loader = loader
+        self.default_model_id = default_model_id
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.idle_timeout = idle_timeout
+        self._entries: "OrderedDict[ModelKey, _Entry]" = OrderedDict()
+        self._known_sizes: Dict[ModelKey, int] = {}
+        self._lock = threading.RLock()
+        if idle_timeout > 0:
+            threading.Thread(target=self._reap_idle, name="model-registry-reaper", daemon=True).start()
+
+    def key_for(self, model_id: Optional[str] = None, dtype=None, device: Optional[str] = None) -> ModelKey:
+        device = device or default_device()
+        dtype = dtype or default_dtype(device)
+        return (model_id or self.default_model_id, str(dtype).replace("torch.", ""), device)
+
+    def get(self, model_id: Optional[str] = None, dtype=None, device: Optional[str] = None):
+        """Return the pipeline for this model, loading (and evicting others) if needed."""
+        device = device or default_device()
+        dtype = dtype or default_dtype(device)
+        key = self.key_for(model_id, dtype, device)
+        with self._lock:
+            entry = self._entries.get(key)
+            cache_lookup("model_registry", hit=entry is not None)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(key)
+                return entry.pipe
+
+            # Make room using the size seen on a previous load, if any.
+            self._evict_for(self._known_sizes.get(key, 0), keep=key)
+            logger.info("Loading model %s (dtype=%s, device=%s)", *key)
+            pipe = instrument_pipeline(self.loader(key[0], dtype, device))
+            size = pipeline_memory_bytes(pipe)
+            self._known_sizes[key] = size
+            self._entries[key] = _Entry(pipe, size)
+            logger.info("Loaded model %s: %.0f MB resident (%d model(s) loaded, %.0f MB total)",
+                        key[0], size / 2**20, len(self._entries), self.resident_bytes() / 2**20)
+            self._evict_for(0, keep=key)
+            return pipe
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._entries.values())
+
+    def _evict_for(self, incoming_bytes: int, keep: ModelKey):
+        if self.budget_bytes <= 0:
+            return
+        while self._entries and self.resident_bytes() + incoming_bytes > self.budget_bytes:
+            victim = next((k for k in self._entries if k != keep), None)
+            if victim is None:
+                logger.warning("Model %s alone exceeds the %.0f MB budget", keep[0], self.budget_bytes / 2**20)
+                return
+            self.unload(victim, reason="memory budget")
+
+    def unload(self, key: ModelKey, reason: str = "requested"):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        # A job already holding the pipeline keeps it alive until it finishes.
+        del entry
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info("Unloaded model %s (dtype=%s, device=%s): %s", key[0], key[1], key[2], reason)
+
+    def _reap_idle(self):
+        interval = min(60.0, max(self.idle_timeout / 4.0, 1.0))
+        while True:
+            time.sleep(interval)
+            cutoff = time.monotonic() - self.idle_timeout
+            with self._lock:
+                idle = [key for key, entry in self._entries.items() if entry.last_used < cutoff]
+            for key in idle:
+                self.unload(key, reason=f"idle > {self.idle_timeout:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "budget_mb": round(self.budget_bytes / 2**20, 1),
+                "resident_mb": round(self.resident_bytes() / 2**20, 1),
+                "models": [
+                    {"model_id": k[0], "dtype": k[1], "device": k[2],
+                     "resident_mb": round(e.size_bytes / 2**20, 1), "idle_s": round(now - e.last_used, 1)}
+                    for k, e in reversed(self._entries.items())
+                ],
+            }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(loader: Optional[Loader] = None, default_model_id: Optional[str] = None) -> ModelRegistry:
+    """Process-wide registry; the first caller's loader and default model are used."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            from . import pipeline
+            _registry = ModelRegistry(loader or pipeline.load_pipeline, default_model_id or pipeline.MODEL_ID)
+        return _registry
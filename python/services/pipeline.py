@@ -6,6 +6,9 @@ from typing import Optional
 import torch
 from diffusers import StableDiffusionPipeline
 
+from .compilation import maybe_compile
+from .samplers import apply_sampler
+
 logger = logging.getLogger("image_pipeline")
 logger.setLevel(logging.INFO)
 
@@ -13,14 +16,22 @@ MODEL_ID = os.environ.get("SD_MODEL_ID", "stabilityai/stable-diffusion-2-1")
 FORCE_FP32 = os.environ.get("PIPELINE_FORCE_FP32", "false").lower() in ("1", "true", "yes")
 USE_XFORMERS = os.environ.get("PIPELINE_USE_XFORMERS", "true").lower() not in ("0", "false", "no")
 
-_pipeline: Optional[StableDiffusionPipeline] = None
+def load_pipeline(model_id: str, torch_dtype, device: str) -> StableDiffusionPipeline:
+    logger.info("Loading StableDiffusion pipeline '%s' on %s (dtype=%s)", model_id, device, torch_dtype)
+    pipe = StableDiffusionPipeline.from_pretrained(model_id, torch_dtype=torch_dtype, use_safetensors=True)
 
-def get_pipeline() -> StableDiffusionPipeline:
-    global _pipeline
-    if _pipeline is not None:
-        return _pipeline
+    if device == "cuda" and USE_XFORMERS:
+        try:
+            pipe.enable_xformers_memory_efficient_attention()
+        except Exception as exc:
+            logger.warning("xformers unavailable, using default attention: %s", exc)
+    pipe.enable_attention_slicing()
+    apply_sampler(pipe)  # SD_SAMPLER if set, else the model's own; requests can swap per job via `sampler`
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    torch_dtype = torch.float16 if device == "cuda" and not FORCE_FP32 else torch.float32
+    # PIPELINE_COMPILE: compile + warm up the configured shape buckets now, before the first request
+    return maybe_compile(pipe.to(device), model_id)
 
-    logger.info("Loading StableDiffusion pipeline '%s' on %s (dtype=%s)", MODEL_ID, device, torch_dtype)
+def get_pipeline(model_id: Optional[str] = None) -> StableDiffusionPipeline:
+    # Pipelines are cached (and evicted) by the model registry, keyed by model id/dtype/device.
+    from .model_registry import get_registry
+    return get_registry().get(model_id)
@@ -0,0 +1,29 @@
+# Cheap intermediate previews: approximate latent -> RGB projection instead of a full VAE decode.
+import io
+
+import torch
+from PIL import Image
+
+# Linear projection from the 4 SD 1.x/2.x latent channels to RGB (community-derived fit of
+# the VAE decoder's average response). Good enough to show composition and colour early.
+LATENT_RGB_FACTORS = torch.tensor([
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+])
+
+
+def latents_to_preview(latents: torch.Tensor) -> Image.Image:
+    """Project the first latent in a batch to RGB at latent resolution (1/8 of the output)."""
+    latent = latents[0] if latents.dim() == 4 else latents
+    latent = latent[:4].detach().to(device="cpu", dtype=torch.float32)
+    rgb = torch.einsum("chw,cr->hwr", latent, LATENT_RGB_FACTORS)
+    rgb = ((rgb + 1.0) / 2.0).clamp(0.0, 1.0).mul(255).round().to(torch.uint8)
+    return Image.fromarray(rgb.numpy(), mode="RGB")
+
+
+def latents_to_preview_png(latents: torch.Tensor) -> bytes:
+    buf = io.BytesIO()
+    latents_to_preview(latents).save(buf, format="PNG")
+    return buf.getvalue()
@@ -0,0 +1,223 @@
+# On-demand profiling of the next N generations: torch operator breakdowns plus flame-graph stacks.
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .compilation import compiled_stats
+
+logger = logging.getLogger("profiling")
+logger.setLevel(logging.INFO)
+
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
+)
+SAMPLE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Labels attached to module forwards so the operator table can be rolled up per pipeline stage.
+STAGE_LABELS = ("text_encoder", "unet", "attention", "vae.decode")
+
+
+class _StackSampler:
+    """Samples one thread's Python stack on a timer; writes collapsed stacks (flamegraph.pl / speedscope)."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _stage_hooks(pipe, record_function) -> List[Any]:
+    """Wrap text encoder, UNet, attention and VAE decode forwards in profiler ranges; returns hook handles."""
+    handles = []
+
+    def add_range(module, label):
+        open_ranges = []
+
+        def pre(mod, args):
+            scope = record_function(label)
+            scope.__enter__()
+            open_ranges.append(scope)
+
+        def post(mod, args, output):
+            if open_ranges:
+                open_ranges.pop().__exit__(None, None, None)
+
+        handles.append(module.register_forward_pre_hook(pre))
+        handles.append(module.register_forward_hook(post))
+
+    if getattr(pipe, "text_encoder", None) is not None:
+        add_range(pipe.text_encoder, "text_encoder")
+    unet = getattr(pipe, "unet", None)
+    if unet is not None:
+        add_range(unet, "unet")
+        for module in unet.modules():
+            if type(module).__name__ == "Attention":
+                add_range(module, "attention")
+    vae = getattr(pipe, "vae", None)
+    if vae is not None and getattr(vae, "decoder", None) is not None:
+        add_range(vae.decoder, "vae.decode")
+    return handles
+
+
+def pipeline_settings(pipe) -> Dict[str, Any]:
+    """The memory/speed knobs that get_pipeline sets, as they actually ended up on this pipeline."""
+    unet = getattr(pipe, "unet", None)
+    processors = sorted({type(p).__name__ for p in getattr(unet, "attn_processors", {}).values()}) if unet else []
+    return {
+        "dtype": str(getattr(pipe, "dtype", "")),
+        "device": str(getattr(pipe, "device", "")),
+        "attention_processors": processors,  # SlicedAttnProcessor = attention slicing enabled
+        "cpu_offload": any(hasattr(getattr(pipe, name, None), "_hf_hook") for name in ("unet", "text_encoder", "vae")),
+        "vae_tiling": bool(getattr(getattr(pipe, "vae", None), "use_tiling", False)),
+        "vae_slicing": bool(getattr(getattr(pipe, "vae", None), "use_slicing", False)),
+        "compiled": compiled_stats(pipe),  # per-module compiled/eager call counts under PIPELINE_COMPILE
+    }
+
+
+class ProfilingController:
+    """Armed from the admin endpoint or a signal; profiles the next N jobs the scheduler runs."""
+
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._sampling = False
+        self._captures: List[str] = []
+
+    def arm(self, generations: int = 1, sampling: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            self._remaining = max(int(generations), 0)
+            self._sampling = bool(sampling)
+        logger.info("Profiling armed for the next %d generation(s) (sampling=%s)", generations, sampling)
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"remaining": self._remaining, "sampling": self._sampling,
+                    "output_dir": self.output_dir, "captures": list(self._captures[-20:])}
+
+    def _take(self) -> Optional[bool]:
+        with self._lock:
+            if self._remaining <= 0:
+                return None
+            self._remaining -= 1
+            return self._sampling
+
+    @contextmanager
+    def maybe_profile(self, pipe, label: str):
+        """Profile the block if armed; otherwise a no-op."""
+        sampling = self._take()
+        if sampling is None:
+            yield
+            return
+        import torch
+        from torch.profiler import ProfilerActivity, profile, record_function
+
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if torch.cuda.is_available() else [])
+        # Python frames in export_stacks need the verbose experimental config on torch 2.x
+        experimental = getattr(getattr(torch._C, "_profiler", None), "_ExperimentalConfig", None)
+        extra = {"experimental_config": experimental(verbose=True)} if experimental else {}
+        handles = _stage_hooks(pipe, record_function)
+        sampler = _StackSampler(threading.get_ident()) if sampling else None
+        started = time.perf_counter()
+        try:
+            with profile(activities=activities, record_shapes=True, with_stack=True, profile_memory=True, **extra) as prof:
+                if sampler:
+                    sampler.start()
+                try:
+                    yield
+                finally:
+                    if sampler:
+                        sampler.stop()
+        finally:
+            for handle in handles:
+                handle.remove()
+        try:
+            self._write(prof, sampler, pipe, label, time.perf_counter() - started)
+        except Exception:
+            logger.exception("Failed to write profile for %s", label)
+
+    def _write(self, prof, sampler: Optional[_StackSampler], pipe, label: str, wall_seconds: float):
+        with self._lock:
+            sequence = len(self._captures) + 1
+        capture_dir = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{sequence:03d}_{label}")
+        os.makedirs(capture_dir, exist_ok=True)
+        averages = prof.key_averages()
+        sort_key = "self_cuda_time_total" if any(getattr(e, "self_cuda_time_total", 0) for e in averages) else "self_cpu_time_total"
+        with open(os.path.join(capture_dir, "operators.txt"), "w", encoding="utf-8") as f:
+            f.write(averages.table(sort_by=sort_key, row_limit=60))
+        stages = {
+            e.key: {"calls": e.count, "cpu_ms": round(e.cpu_time_total / 1000, 2),
+                    "cuda_ms": round(getattr(e, "cuda_time_total", 0) / 1000, 2)}
+            for e in averages if e.key in STAGE_LABELS
+        }
+        summary = {"label": label, "wall_seconds": round(wall_seconds, 3), "stages": stages,
+                   "pipeline": pipeline_settings(pipe)}
+        with open(os.path.join(capture_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        prof.export_chrome_trace(os.path.join(capture_dir, "trace.json"))  # chrome://tracing or Perfetto
+        prof.export_stacks(os.path.join(capture_dir, "torch_stacks.txt"), sort_key)  # flamegraph.pl collapsed stacks
+        if sampler is not None:
+            sampler.write(os.path.join(capture_dir, "python_stacks.txt"))
+        with self._lock:
+            self._captures.append(capture_dir)
+        logger.info("Profile written to %s (%.1fs; stages %s)", capture_dir, wall_seconds,
+                    {k: v["cpu_ms"] for k, v in stages.items()})
+
+
+_controller: Optional[ProfilingController] = None
+_controller_lock = threading.Lock()
+
+
+def get_profiler() -> ProfilingController:
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = ProfilingController()
+        return _controller
+
+
+def install_signal_handlers(generations: int = 1) -> bool:
+    """SIGUSR1 arms torch profiling for the next N generations, SIGUSR2 adds the stack sampler (POSIX, main thread)."""
+    import signal
+    if not hasattr(signal, "SIGUSR1"):
+        logger.info("Profiling signals unavailable on this platform; use the admin endpoint instead")
+        return False
+    try:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: get_profiler().arm(generations, sampling=False))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: get_profiler().arm(generations, sampling=True))
+    except ValueError:  # not the main thread (e.g. monitor embedded in the API process)
+        return False
+    logger.info("Profiling signals installed: kill -USR1 %d (torch), kill -USR2 %d (torch + stack sampler)",
+                os.getpid(), os.getpid())
+    return True
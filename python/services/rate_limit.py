@@ -0,0 +1,249 @@
+# Per-backend limits for external image APIs: a token bucket for the quota plus AIMD concurrency driven by 429s and latency.
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import counter, histogram
+
+logger = logging.getLogger("rate_limit")
+logger.setLevel(logging.INFO)
+
+# Longest a caller waits for a token or slot before giving up (the story then falls back to another backend).
+MAX_WAIT_SECONDS = float(os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", "300"))
+# Pause after a 429 that carries no Retry-After.
+DEFAULT_RETRY_AFTER = float(os.environ.get("RATE_LIMIT_DEFAULT_RETRY_AFTER", "5"))
+THROTTLE_STATUSES = (429, 503)
+
+THROTTLED = counter("vera_api_throttled_total", "Responses from an external image API that signalled throttling.", ["backend"])
+LIMITER_WAIT = histogram("vera_api_limiter_wait_seconds", "Time a request waited for a rate-limit token and slot.", ["backend"])
+
+
+class RateLimited(RuntimeError):
+    """The backend is throttling us (or the local limiter could not admit the call in time)."""
+
+    def __init__(self, backend: str, retry_after: Optional[float] = None, detail: str = ""):
+        self.backend = backend
+        self.retry_after = retry_after
+        # "rate limit" in the message so categorize_generation_error files it under rate_limit
+        super().__init__(f"{backend} rate limit: {detail or 'throttled'}"
+                         + (f" (retry after {retry_after:.1f}s)" if retry_after else ""))
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(when.timestamp() - (now if now is not None else time.time()), 0.0)
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `capacity`; pause() empties it until a Retry-After deadline."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        if rate <= 0:
+            # wait_time() divides by the rate; a zero rate would never refill anyway.
+            raise ValueError(f"TokenBucket rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(self._updated, now)
+
+    def wait_time(self) -> float:
+        """0 if a token is available now (and takes it), else seconds until one will be."""
+        now = self.clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._refill(now)
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+    def pause(self, seconds: float):
+        now = self.clock()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = now
+
+
+class AdaptiveLimiter:
+    """Token bucket (quota) + AIMD concurrency window for one backend.
+
+    The window grows by one slot per window's worth of fast successes and shrinks by `decrease_factor` on a
+    429/503 or a response slower than `target_latency`. Only responses to requests started after the last
+    decrease can shrink it again, so one burst of throttled in-flight calls counts as a single congestion
+    signal; growth slows to a quarter near the window size that was last throttled, so the limiter settles
+    just under the quota instead of probing past it every few requests.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: Optional[float] = None, max_concurrency: int = 4,
+                 min_concurrency: int = 1, target_latency: float = 60.0, decrease_factor: float = 0.7,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst if burst is not None else max_concurrency, clock)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.clock = clock
+        self.limit = float(max(min_concurrency, min(max_concurrency, 2)))
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._throttled_at = float("inf")  # window size when the backend last pushed back
+        self._cond = threading.Condition()
+        self._stats = {"admitted": 0, "throttled": 0, "slow": 0, "timeouts": 0}
+
+    def _acquire(self, timeout: float) -> float:
+        """Wait for a concurrency slot and a token; returns the admission time."""
+        deadline = self.clock() + timeout
+        with self._cond:
+            while True:
+                now = self.clock()
+                if self._in_flight < int(self.limit):
+                    wait = self.bucket.wait_time()
+                    if wait == 0.0:
+                        self._in_flight += 1
+                        self._stats["admitted"] += 1
+                        return now
+                else:
+                    wait = None  # woken when a slot frees up
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise RateLimited(self.name, wait, "local limiter wait exceeded")
+                self._cond.wait(min(wait, remaining) if wait is not None else remaining)
+
+    def _release(self, started: float, latency: float, throttled: bool, retry_after: Optional[float]):
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self._stats["throttled"] += 1
+                self.bucket.pause(retry_after if retry_after is not None else DEFAULT_RETRY_AFTER)
+                self._decrease(started, "throttled", throttled=True)
+            elif latency > self.target_latency:
+                self._stats["slow"] += 1
+                self._decrease(started, f"latency {latency:.1f}s > {self.target_latency:.0f}s")
+            elif self._in_flight + 1 >= int(self.limit):
+                # Additive increase only while the window is actually in use
+                step = 1.0 / self.limit
+                if self.limit + 1.0 >= self._throttled_at:
+                    step /= 4.0
+                self.limit = min(float(self.max_concurrency), self.limit + step)
+            self._cond.notify_all()
+
+    def _decrease(self, started: float, reason: str, throttled: bool = False):
+        if started <= self._last_decrease:
+            return
+        if throttled:
+            self._throttled_at = float(int(self.limit))
+        self._last_decrease = self.clock()
+        previous = self.limit
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+        logger.info("%s limiter: concurrency %.1f -> %.1f (%s)", self.name, previous, self.limit, reason)
+
+    @contextmanager
+    def request(self, timeout: float = MAX_WAIT_SECONDS):
+        """Admit one call; report its outcome with call.observe(response) or call.throttled(retry_after)."""
+        waited_from = self.clock()
+        started = self._acquire(timeout)
+        LIMITER_WAIT.observe(started - waited_from, backend=self.name)
+        call = _Call(self.name)
+        try:
+            yield call
+        finally:
+            self._release(started, self.clock() - started, call.was_throttled, call.retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"limit": round(self.limit, 2), "in_flight": self._in_flight,
+                    "rate_per_minute": self.bucket.rate * 60, **self._stats}
+
+
+class _Call:
+    __slots__ = ("backend", "was_throttled", "retry_after")
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.was_throttled = False
+        self.retry_after: Optional[float] = None
+
+    def throttled(self, retry_after: Optional[float] = None):
+        self.was_throttled = True
+        self.retry_after = retry_after
+        THROTTLED.inc(backend=self.backend)
+
+    def observe(self, response):
+        """Feed back an HTTP response (anything with status_code and headers)."""
+        if response.status_code in THROTTLE_STATUSES:
+            self.throttled(parse_retry_after(response.headers.get("Retry-After")))
+
+
+def call_with_limit(limiter: AdaptiveLimiter, send: Callable[[], Any], attempts: int = 3,
+                    timeout: float = MAX_WAIT_SECONDS):
+    """send() under the limiter; throttled responses are retried after their Retry-After, then raise RateLimited."""
+    for attempt in range(1, attempts + 1):
+        with limiter.request(timeout) as call:
+            response = send()
+            call.observe(response)
+        if not call.was_throttled:
+            return response
+        logger.info("%s throttled (attempt %d/%d, retry after %s)", limiter.name, attempt, attempts,
+                    f"{call.retry_after:.1f}s" if call.retry_after is not None else "default")
+    raise RateLimited(limiter.name, call.retry_after, f"still throttled after {attempts} attempts")
+
+
+def _env_limiter(name: str, prefix: str, rate: str, concurrency: str, latency: str) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        name,
+        rate_per_minute=float(os.environ.get(f"{prefix}_RATE_PER_MINUTE", rate)),
+        burst=float(os.environ[f"{prefix}_BURST"]) if os.environ.get(f"{prefix}_BURST") else None,
+        max_concurrency=int(os.environ.get(f"{prefix}_MAX_CONCURRENCY", concurrency)),
+        target_latency=float(os.environ.get(f"{prefix}_TARGET_LATENCY_SECONDS", latency)),
+    )
+
+
+# Defaults sized to the free/preview tiers; set *_RATE_PER_MINUTE to the project's quota.
+_FACTORIES = {
+    "gemini": lambda: _env_limiter("gemini", "GEMINI", "10", "4", "90"),
+    "hf": lambda: _env_limiter("hf", "HF", "30", "2", "180"),
+}
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> AdaptiveLimiter:
+    """Process-wide limiter per backend ("gemini", "hf")."""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = _FACTORIES[name]()
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        return {name: limiter.stats() for name, limiter in _limiters.items()}
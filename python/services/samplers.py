@@ -0,0 +1,98 @@
+# Diffusion scheduler (sampler) registry and quality presets; samplers swap on a loaded pipeline without reloading weights.
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("samplers")
+logger.setLevel(logging.INFO)
+
+# Unset: each model keeps the scheduler it shipped with unless a request asks for another.
+DEFAULT_SAMPLER = os.environ.get("SD_SAMPLER") or None
+# Model ids (comma separated) that are LCM-distilled or carry a fused LCM-LoRA, besides ids containing "lcm".
+LCM_MODEL_IDS = {m.strip() for m in os.environ.get("LCM_MODEL_IDS", "").split(",") if m.strip()}
+
+# name -> (diffusers scheduler class, config overrides applied on top of the model's own scheduler config)
+SAMPLERS: Dict[str, Any] = {
+    "dpmpp_2m": ("DPMSolverMultistepScheduler", {"algorithm_type": "dpmsolver++", "solver_order": 2}),
+    "dpmpp_2m_karras": ("DPMSolverMultistepScheduler", {"algorithm_type": "dpmsolver++", "solver_order": 2,
+                                                        "use_karras_sigmas": True}),
+    "dpmpp_2m_sde_karras": ("DPMSolverMultistepScheduler", {"algorithm_type": "sde-dpmsolver++", "solver_order": 2,
+                                                            "use_karras_sigmas": True}),
+    "euler": ("EulerDiscreteScheduler", {}),
+    "euler_a": ("EulerAncestralDiscreteScheduler", {}),
+    "unipc": ("UniPCMultistepScheduler", {}),
+    "lcm": ("LCMScheduler", {}),  # few-step; needs an LCM-distilled model or LCM-LoRA
+}
+
+# Named quality presets. `fast` replaces the preset when the model supports LCM.
+# guidance_scale <= 1 turns off classifier-free guidance, halving UNet evaluations per step.
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "draft": {"sampler": "dpmpp_2m_karras", "num_steps": 12, "guidance_scale": 6.5,
+              "fast": {"sampler": "lcm", "num_steps": 4, "guidance_scale": 1.0}},
+    "standard": {"sampler": "dpmpp_2m_karras", "num_steps": 20, "guidance_scale": 7.5},
+    "final": {"sampler": "dpmpp_2m_sde_karras", "num_steps": 32, "guidance_scale": 7.5},
+}
+
+_lock = threading.Lock()
+
+
+def model_supports_lcm(model_id: Optional[str], pipe=None) -> bool:
+    if pipe is not None and type(getattr(pipe, "scheduler", None)).__name__ == "LCMScheduler":
+        return True
+    return bool(model_id) and ("lcm" in model_id.lower() or model_id in LCM_MODEL_IDS)
+
+
+def resolve_preset(name: str, model_id: Optional[str] = None) -> Dict[str, Any]:
+    """{"sampler", "num_steps", "guidance_scale"} for a preset name on this model."""
+    if name not in PRESETS:
+        raise ValueError(f"Unknown preset '{name}'; choose from {sorted(PRESETS)}")
+    preset = PRESETS[name]
+    if "fast" in preset and model_supports_lcm(model_id):
+        preset = preset["fast"]
+    return {k: preset[k] for k in ("sampler", "num_steps", "guidance_scale")}
+
+
+def _get_sampler(pipe, name: str):
+    """Build (once per pipeline) the named scheduler from the config the model shipped with."""
+    if name not in SAMPLERS:
+        raise ValueError(f"Unknown sampler '{name}'; choose from {sorted(SAMPLERS)}")
+    with _lock:
+        cache = getattr(pipe, "_vera_samplers", None)
+        if cache is None:
+            cache = {}
+            pipe._vera_samplers = cache
+            pipe._vera_base_scheduler_config = dict(pipe.scheduler.config)
+        sampler = cache.get(name)
+        if sampler is None:
+            import diffusers
+            class_name, overrides = SAMPLERS[name]
+            sampler = getattr(diffusers, class_name).from_config(pipe._vera_base_scheduler_config, **overrides)
+            cache[name] = sampler
+        return sampler
+
+
+def apply_sampler(pipe, name: Optional[str] = None):
+    """Make `name` (default SD_SAMPLER) the pipeline's scheduler; weights are untouched. No-op if neither is set."""
+    name = name or DEFAULT_SAMPLER
+    if name:
+        pipe.scheduler = _get_sampler(pipe, name)
+    return pipe
+
+
+@contextmanager
+def use_sampler(pipe, name: Optional[str]):
+    """Run the block with another sampler, then restore the previous one (None = leave as is).
+
+    Only safe while the caller owns the pipeline, i.e. inside a GenerationScheduler job.
+    """
+    if not name:
+        yield pipe.scheduler
+        return
+    previous = pipe.scheduler
+    pipe.scheduler = _get_sampler(pipe, name)
+    try:
+        yield pipe.scheduler
+    finally:
+        pipe.scheduler = previous
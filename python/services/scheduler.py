@@ -0,0 +1,200 @@
+# Priority scheduler that owns the diffusion pipeline and serves interactive and background jobs.
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import QUEUE_WAIT, StepTimer
+from .profiling import get_profiler
+
+logger = logging.getLogger("image_scheduler")
+logger.setLevel(logging.INFO)
+
+# A waiting job gains one priority level per AGING_SECONDS, so background work cannot starve.
+AGING_SECONDS = float(os.environ.get("SCHEDULER_AGING_SECONDS", "120"))
+# A running background job is only preempted before this fraction of its steps is done.
+PREEMPT_MAX_PROGRESS = float(os.environ.get("SCHEDULER_PREEMPT_MAX_PROGRESS", "0.5"))
+MAX_PREEMPTIONS = int(os.environ.get("SCHEDULER_MAX_PREEMPTIONS", "3"))
+WAIT_SAMPLE_WINDOW = 512
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+# A job receives the pipeline and a step callback (diffusers `callback_on_step_end`
+# signature) and returns its result.
+JobFn = Callable[[Any, Callable], Any]
+
+
+class Preempted(Exception):
+    """Raised from the step callback to hand the pipeline to a higher-priority job."""
+
+
+class _Job:
+    __slots__ = ("fn", "priority", "steps", "model", "future", "enqueued_at", "queued_since", "waited", "preemptions")
+
+    def __init__(self, fn: JobFn, priority: Priority, steps: Optional[int], model: Optional[str]):
+        self.fn = fn
+        self.priority = priority
+        self.steps = steps
+        self.model = model
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.queued_since = self.enqueued_at
+        self.waited = 0.0
+        self.preemptions = 0
+
+    def effective_priority(self, now: float) -> float:
+        return float(self.priority) - (now - self.enqueued_at) / AGING_SECONDS
+
+
+class GenerationScheduler:
+    """Single owner of the pipeline; runs one job at a time from prioritized queues."""
+
+    def __init__(self, pipeline_factory: Callable[[Optional[str]], Any]):
+        self.pipeline_factory = pipeline_factory
+        self._queue: List[_Job] = []
+        self._cond = threading.Condition()
+        self._running: Optional[_Job] = None
+        self._wait_samples: Dict[Priority, deque] = {p: deque(maxlen=WAIT_SAMPLE_WINDOW) for p in Priority}
+        self._counters: Dict[Priority, Dict[str, int]] = {
+            p: {"submitted": 0, "completed": 0, "failed": 0, "preempted": 0} for p in Priority
+        }
+        self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._worker.start()
+
+    def get_pipeline(self, model: Optional[str] = None):
+        return self.pipeline_factory(model)
+
+    def submit(self, fn: JobFn, priority: Priority = Priority.INTERACTIVE, steps: Optional[int] = None,
+               model: Optional[str] = None) -> Future:
+        job = _Job(fn, Priority(priority), steps, model)
+        with self._cond:
+            self._queue.append(job)
+            self._counters[job.priority]["submitted"] += 1
+            self._cond.notify()
+        return job.future
+
+    def run(self, fn: JobFn, priority: Priority = Priority.INTERACTIVE, steps: Optional[int] = None,
+            model: Optional[str] = None, timeout: Optional[float] = None) -> Any:
+        return self.submit(fn, priority, steps, model).result(timeout=timeout)
+
+    def _pop_next(self) -> _Job:
+        now = time.monotonic()
+        best = min(self._queue, key=lambda job: (job.effective_priority(now), job.enqueued_at))
+        self._queue.remove(best)
+        return best
+
+    def _should_preempt(self, job: _Job, step_index: int) -> bool:
+        if job.priority == Priority.INTERACTIVE or job.preemptions >= MAX_PREEMPTIONS:
+            return False
+        if job.steps and (step_index + 1) / job.steps > PREEMPT_MAX_PROGRESS:
+            return False
+        with self._cond:
+            if not self._queue:
+                return False
+            now = time.monotonic()
+            mine = job.effective_priority(now)
+            return any(other.effective_priority(now) < mine - 1e-9 and other.priority < job.priority
+                       for other in self._queue)
+
+    def _step_callback(self, job: _Job) -> Callable:
+        step_timer = StepTimer()
+
+        def _callback(pipe, step_index, timestep, callback_kwargs):
+            step_timer.tick()
+            if self._should_preempt(job, step_index):
+                raise Preempted()
+            return callback_kwargs
+        return _callback
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._pop_next()
+                job.waited += time.monotonic() - job.queued_since
+                self._running = job
+            # A preempted job is already running from its caller's point of view.
+            if not job.preemptions and not job.future.set_running_or_notify_cancel():
+                with self._cond:
+                    self._running = None
+                continue
+            try:
+                pipe = self.get_pipeline(job.model)
+                # No-op unless profiling was armed (admin endpoint or monitor signal).
+                with get_profiler().maybe_profile(pipe, job.priority.name.lower()):
+                    result = job.fn(pipe, self._step_callback(job))
+            except Preempted:
+                with self._cond:
+                    job.preemptions += 1
+                    job.queued_since = time.monotonic()
+                    self._counters[job.priority]["preempted"] += 1
+                    # Requeue with the original enqueue time so aging keeps counting.
+                    self._queue.append(job)
+                    self._running = None
+                logger.info("Preempted %s job at step boundary (preemptions=%d)", job.priority.name, job.preemptions)
+                continue
+            except BaseException as exc:
+                self._finish(job, error=exc)
+            else:
+                self._finish(job, result=result)
+
+    def _finish(self, job: _Job, result: Any = None, error: Optional[BaseException] = None):
+        with self._cond:
+            self._running = None
+            self._wait_samples[job.priority].append(job.waited)
+            self._counters[job.priority]["failed" if error else "completed"] += 1
+        QUEUE_WAIT.observe(job.waited, priority=job.priority.name.lower())
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth, counters and queue-wait percentiles per priority class."""
+        with self._cond:
+            depth = {p: sum(1 for job in self._queue if job.priority == p) for p in Priority}
+            report = {}
+            for p in Priority:
+                samples = sorted(self._wait_samples[p])
+                report[p.name.lower()] = {
+                    "queued": depth[p],
+                    **self._counters[p],
+                    "wait_mean_s": round(sum(samples) / len(samples), 3) if samples else 0.0,
+                    "wait_p50_s": round(_percentile(samples, 0.50), 3),
+                    "wait_p95_s": round(_percentile(samples, 0.95), 3),
+                    "wait_max_s": round(samples[-1], 3) if samples else 0.0,
+                }
+            report["running"] = self._running.priority.name.lower() if self._running else None
+            return report
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(q * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+_scheduler: Optional[GenerationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(pipeline_factory: Optional[Callable[[Optional[str]], Any]] = None) -> GenerationScheduler:
+    """Process-wide scheduler; the first caller's pipeline factory (model id -> pipeline) is used."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            if pipeline_factory is None:
+                from .pipeline import get_pipeline
+                pipeline_factory = get_pipeline
+            _scheduler = GenerationScheduler(pipeline_factory)
+        return _scheduler
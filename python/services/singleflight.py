@@ -0,0 +1,109 @@
+# Single-flight coalescing: concurrent identical requests share one in-flight computation.
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .metrics import cache_lookup
+
+logger = logging.getLogger("singleflight")
+logger.setLevel(logging.INFO)
+
+# start(cancel_event) launches the work and returns its Future; the work should stop
+# early once cancel_event is set (it is only set when no waiter is left).
+Starter = Callable[[threading.Event], Future]
+
+
+class _Call:
+    __slots__ = ("future", "waiters", "cancel_event")
+
+    def __init__(self, future: Future, cancel_event: threading.Event):
+        self.future = future
+        self.waiters = 0
+        self.cancel_event = cancel_event
+
+
+class SingleFlight:
+    """Deduplicates in-flight work by key; the shared job is cancelled only when its last waiter leaves."""
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name  # when set, joins are counted as cache hits/misses under this name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "coalesced": 0, "abandoned_waiters": 0, "cancelled": 0}
+
+    def _join(self, key: Hashable, start: Starter) -> _Call:
+        with self._lock:
+            call = self._calls.get(key)
+            coalesced = call is not None and not call.future.done()
+            if self.name:
+                cache_lookup(self.name, hit=coalesced)
+            if coalesced:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                return call
+            cancel_event = threading.Event()
+            call = _Call(start(cancel_event), cancel_event)
+            call.waiters = 1
+            self._calls[key] = call
+            self._stats["started"] += 1
+        call.future.add_done_callback(lambda _f, key=key, call=call: self._forget(key, call))
+        return call
+
+    def _forget(self, key: Hashable, call: _Call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def _leave(self, key: Hashable, call: _Call):
+        with self._lock:
+            call.waiters -= 1
+            self._stats["abandoned_waiters"] += 1
+            if call.waiters > 0 or call.future.done():
+                return
+            self._stats["cancelled"] += 1
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        logger.info("Last waiter left; cancelling shared job %s", key)
+        call.cancel_event.set()
+        call.future.cancel()
+
+    def _done(self, call: _Call):
+        with self._lock:
+            call.waiters -= 1
+
+    def run(self, key: Hashable, start: Starter, timeout: Optional[float] = None) -> Any:
+        """Blocking wait; a timeout counts as this waiter leaving."""
+        call = self._join(key, start)
+        try:
+            result = call.future.result(timeout=timeout)
+        except BaseException:
+            if not call.future.done():
+                self._leave(key, call)
+            else:
+                self._done(call)
+            raise
+        self._done(call)
+        return result
+
+    async def run_async(self, key: Hashable, start: Starter) -> Any:
+        """Await the shared result; cancelling this coroutine only detaches this waiter."""
+        call = self._join(key, start)
+        shared = asyncio.wrap_future(call.future)
+        try:
+            # shield: a cancelled waiter must not cancel the shared future for the others
+            result = await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._leave(key, call)
+            raise
+        except BaseException:
+            self._done(call)
+            raise
+        self._done(call)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
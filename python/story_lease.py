@@ -0,0 +1,223 @@
+"""
+Story Lease Manager
+Lease-based claiming of stories so several generator instances can share one stories collection
+Each claim, renewal and commit runs inside a Firestore transaction (or an in-memory stand-in)
+"""
+import os
+import socket
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LEASE_OWNER_FIELD = "imageLeaseOwner"
+LEASE_EXPIRES_FIELD = "imageLeaseExpiresAt"
+
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_SECONDS = float(os.environ.get("STORY_LEASE_SECONDS", "300"))
+
+# A transaction body receives the current document dict (None if missing) and
+# returns the fields to update, or None to leave the document untouched.
+TransactionBody = Callable[[Optional[Dict]], Optional[Dict]]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value) -> Optional[datetime]:
+    """Normalize a stored lease expiry (datetime or Firestore timestamp) to an aware UTC datetime"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if hasattr(value, "timestamp"):
+        return datetime.fromtimestamp(value.timestamp(), tz=timezone.utc)
+    return None
+
+
+def has_valid_image(story_data: Dict) -> bool:
+    image_url = story_data.get("aiGeneratedImageUrl")
+    return isinstance(image_url, str) and (image_url.startswith("http://") or image_url.startswith("https://"))
+
+
+def lease_is_active(story_data: Dict, now: Optional[datetime] = None) -> bool:
+    """True if the story carries an unexpired lease (held by anyone)"""
+    expires_at = _as_utc(story_data.get(LEASE_EXPIRES_FIELD))
+    return bool(story_data.get(LEASE_OWNER_FIELD)) and expires_at is not None and expires_at > (now or _utcnow())
+
+
+class FirestoreLeaseStore:
+    """Runs lease transactions against the Firestore stories collection"""
+
+    def __init__(self, db, collection: str = "stories"):
+        from google.cloud import firestore
+        self._firestore = firestore
+        self.db = db
+        self.collection = collection
+
+    def run_transaction(self, doc_id: str, body: TransactionBody) -> Optional[Dict]:
+        doc_ref = self.db.collection(self.collection).document(doc_id)
+
+        @self._firestore.transactional
+        def _apply(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            updates = body(snapshot.to_dict() if snapshot.exists else None)
+            if updates:
+                transaction.update(doc_ref, updates)
+            return updates
+
+        return _apply(self.db.transaction())
+
+
+class InMemoryLeaseStore:
+    """Transactional in-memory stand-in for the stories collection (for local runs and tests)"""
+
+    def __init__(self, documents: Optional[Dict[str, Dict]] = None):
+        self.documents: Dict[str, Dict] = {doc_id: dict(data) for doc_id, data in (documents or {}).items()}
+        self._lock = threading.Lock()
+
+    def run_transaction(self, doc_id: str, body: TransactionBody) -> Optional[Dict]:
+        with self._lock:
+            current = self.documents.get(doc_id)
+            updates = body(dict(current) if current is not None else None)
+            if updates:
+                if current is None:
+                    raise KeyError(f"No document to update: {doc_id}")
+                current.update(updates)
+            return updates
+
+
+class StoryLease:
+    """A claimed story; renews itself in the background until released"""
+
+    def __init__(self, manager: "StoryLeaseManager", doc_id: str, expires_at: datetime):
+        self.manager = manager
+        self.doc_id = doc_id
+        self.expires_at = expires_at
+        self.lost = False
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def start_heartbeat(self):
+        if self._heartbeat is not None:
+            return
+        self._heartbeat = threading.Thread(
+            target=self._run_heartbeat, name=f"lease-{self.doc_id}", daemon=True
+        )
+        self._heartbeat.start()
+
+    def _run_heartbeat(self):
+        interval = max(self.manager.lease_seconds / 3.0, 0.05)
+        while not self._stop.wait(interval):
+            if not self.manager.renew(self):
+                logger.warning(f"[Lease] Lost lease on {self.doc_id}; another worker may reclaim it")
+                self.lost = True
+                return
+
+    def stop_heartbeat(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=5)
+
+    def commit(self, updates: Dict) -> bool:
+        """Write the final story updates and drop the lease, only if we still own it"""
+        self.stop_heartbeat()
+        return self.manager.commit(self, updates)
+
+    def release(self):
+        self.stop_heartbeat()
+        self.manager.release(self)
+
+    def __enter__(self):
+        self.start_heartbeat()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class StoryLeaseManager:
+    """Claims, renews and releases per-story leases so each story is generated by one worker"""
+
+    def __init__(self, store, owner_id: str = WORKER_ID, lease_seconds: float = LEASE_SECONDS,
+                 clock: Callable[[], datetime] = _utcnow):
+        self.store = store
+        self.owner_id = owner_id
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    def _expiry(self) -> datetime:
+        return self.clock() + timedelta(seconds=self.lease_seconds)
+
+    def try_claim(self, doc_id: str, refresh: bool = False) -> Optional[StoryLease]:
+        """Take the lease on a story if it is unclaimed, expired or already ours (refresh: even if it has an image)"""
+        expires_at = self._expiry()
+
+        def _claim(data):
+            if data is None or (has_valid_image(data) and not refresh):
+                return None
+            owner = data.get(LEASE_OWNER_FIELD)
+            if owner and owner != self.owner_id and lease_is_active(data, self.clock()):
+                return None
+            if owner and owner != self.owner_id:
+                logger.info(f"[Lease] Reclaiming expired lease on {doc_id} from {owner}")
+            return {LEASE_OWNER_FIELD: self.owner_id, LEASE_EXPIRES_FIELD: expires_at}
+
+        try:
+            claimed = self.store.run_transaction(doc_id, _claim)
+        except Exception as exc:
+            logger.warning(f"[Lease] Claim transaction failed for {doc_id}: {exc}")
+            return None
+        if not claimed:
+            return None
+        logger.info(f"[Lease] {self.owner_id} claimed {doc_id} until {expires_at.isoformat()}")
+        return StoryLease(self, doc_id, expires_at)
+
+    def renew(self, lease: StoryLease) -> bool:
+        expires_at = self._expiry()
+
+        def _renew(data):
+            if data is None or data.get(LEASE_OWNER_FIELD) != self.owner_id:
+                return None
+            return {LEASE_EXPIRES_FIELD: expires_at}
+
+        try:
+            renewed = self.store.run_transaction(lease.doc_id, _renew)
+        except Exception as exc:
+            logger.warning(f"[Lease] Renew transaction failed for {lease.doc_id}: {exc}")
+            return True  # transient; the next heartbeat retries before expiry
+        if renewed:
+            lease.expires_at = expires_at
+        return bool(renewed)
+
+    def commit(self, lease: StoryLease, updates: Dict) -> bool:
+        def _commit(data):
+            if data is None or data.get(LEASE_OWNER_FIELD) != self.owner_id:
+                return None
+            return {**updates, LEASE_OWNER_FIELD: None, LEASE_EXPIRES_FIELD: None}
+
+        committed = bool(self.store.run_transaction(lease.doc_id, _commit))
+        if not committed:
+            lease.lost = True
+            logger.warning(f"[Lease] Discarding result for {lease.doc_id}: lease no longer held by {self.owner_id}")
+        return committed
+
+    def release(self, lease: StoryLease):
+        def _release(data):
+            if data is None or data.get(LEASE_OWNER_FIELD) != self.owner_id:
+                return None
+            return {LEASE_OWNER_FIELD: None, LEASE_EXPIRES_FIELD: None}
+
+        try:
+            self.store.run_transaction(lease.doc_id, _release)
+        except Exception as exc:
+            logger.warning(f"[Lease] Release failed for {lease.doc_id}: {exc}")
+
+    def order_candidates(self, doc_ids: Iterable[str]) -> List[str]:
+        """Order candidates per worker so concurrent workers start on different stories"""
+        return sorted(doc_ids, key=lambda doc_id: hashlib.sha1(f"{self.owner_id}:{doc_id}".encode()).hexdigest())
@@ -0,0 +1,124 @@
+"""
+Story Image Refresh
+Cheap re-render for stories whose concept changed after they got an image: the previous image (local cache,
+else Cloud Storage) seeds an img2img pass with the original seed, so only strength x num_steps denoising steps
+run and the layout carries over. Stories record a fingerprint of the concept they were rendered from; the
+monitor compares it against the current concept to find edits. Concept edits (the updateStoryConcept function)
+keep the image URL and stamp conceptUpdatedAt, which the monitor's refresh query watches
+
+Usage:
+    if story_needs_refresh(story, concept_fingerprint(title, key_metrics_text)):
+        init = image_cache.load(doc_id, story["aiGeneratedImageUrl"], storage_client)
+        image = render_refresh(pipe, prompt, negative_prompt, init, seed=story["aiGeneratedImageSeed"])
+"""
+import os
+import hashlib
+import logging
+from io import BytesIO
+from typing import Callable, Optional
+from urllib.parse import unquote, urlparse
+
+from PIL import Image
+
+from hires_generation import img2img_pipeline
+from story_lease import has_valid_image
+
+logger = logging.getLogger(__name__)
+
+REFRESH_STRENGTH = float(os.environ.get("REFRESH_STRENGTH", "0.45"))  # Share of denoising steps re-run (0-1); lower keeps more of the old image
+REFRESH_STEPS = int(os.environ.get("REFRESH_STEPS", "30"))  # Schedule length; about strength x steps actually execute
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_cache"))
+
+CONCEPT_HASH_FIELD = "aiGeneratedImageConceptHash"
+SEED_FIELD = "aiGeneratedImageSeed"
+CONCEPT_EDITED_FIELD = "conceptUpdatedAt"  # set only by concept edits, so our own completion writes don't match
+REFRESHABLE_GENERATORS = ("stable-diffusion-local", "stable-diffusion-img2img")  # renders with a known seed
+
+
+def concept_fingerprint(title: str, key_metrics_text: str) -> str:
+    return hashlib.sha1(f"{title}\n{key_metrics_text}".encode("utf-8")).hexdigest()[:16]
+
+
+def story_needs_refresh(story_data: dict, fingerprint: str) -> bool:
+    """True if a seeded local render exists but was made from a concept other than `fingerprint` (the current one)"""
+    if not has_valid_image(story_data) or story_data.get(SEED_FIELD) is None:
+        return False
+    if story_data.get("imageGeneratedBy") not in REFRESHABLE_GENERATORS:
+        return False
+    rendered_from = story_data.get(CONCEPT_HASH_FIELD)
+    if not rendered_from:
+        return False  # rendered before fingerprints were recorded; nothing to compare against
+    return fingerprint != rendered_from
+
+
+class ImageCache:
+    """PNG bytes of each story's latest image on local disk, keyed by story id"""
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.directory, f"{doc_id}.png")
+
+    def put(self, doc_id: str, png_bytes: bytes):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(doc_id) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(png_bytes)
+            os.replace(tmp_path, self._path(doc_id))
+        except OSError as e:
+            logger.warning(f"[Refresh] Could not cache image for {doc_id}: {e}")
+
+    def load(self, doc_id: str, image_url: str, storage_client=None) -> Optional[Image.Image]:
+        """The story's current image: local cache first, then the Storage object behind its public URL"""
+        data = None
+        try:
+            with open(self._path(doc_id), "rb") as f:
+                data = f.read()
+        except OSError:
+            pass
+        if data is None and storage_client is not None:
+            bucket_name, blob_name = _parse_storage_url(image_url)
+            if bucket_name:
+                try:
+                    data = storage_client.bucket(bucket_name).blob(blob_name).download_as_bytes()
+                    self.put(doc_id, data)
+                except Exception as e:
+                    logger.warning(f"[Refresh] Could not download {image_url}: {e}")
+        if data is None:
+            return None
+        return Image.open(BytesIO(data)).convert("RGB")
+
+
+def _parse_storage_url(image_url: str) -> tuple:
+    """(bucket, object) for https://storage.googleapis.com/<bucket>/<object> URLs written by upload_to_storage"""
+    parsed = urlparse(image_url or "")
+    if parsed.netloc != "storage.googleapis.com":
+        return None, None
+    bucket_name, _, blob_name = parsed.path.lstrip("/").partition("/")
+    return (bucket_name, unquote(blob_name)) if blob_name else (None, None)
+
+
+def render_refresh(pipe, prompt: str, negative_prompt: Optional[str], init_image: Image.Image, seed: int,
+                   strength: float = REFRESH_STRENGTH, num_steps: int = REFRESH_STEPS, guidance_scale: float = 7.5,
+                   step_callback: Optional[Callable] = None) -> Image.Image:
+    """img2img from the previous image with its original seed; runs about strength x num_steps steps"""
+    import torch
+
+    # SD works in multiples of 8; keep the previous image's size otherwise
+    width, height = (init_image.width // 8) * 8, (init_image.height // 8) * 8
+    if (width, height) != init_image.size:
+        init_image = init_image.resize((width, height), Image.LANCZOS)
+    logger.info(f"[Refresh] img2img {width}x{height}, strength {strength}, ~{int(num_steps * strength)} of {num_steps} steps, seed {seed}")
+    with torch.no_grad():
+        return img2img_pipeline(pipe)(
+            prompt,
+            image=init_image,
+            negative_prompt=negative_prompt,
+            strength=strength,
+            num_inference_steps=num_steps,
+            guidance_scale=guidance_scale,
+            generator=torch.Generator(device="cpu").manual_seed(int(seed)),
+            callback_on_step_end=step_callback,
+        ).images[0]
@@ -0,0 +1,35 @@
+import threading
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image
+
+from services import candidate_scoring
+
+
+def test_concurrent_callers_get_one_scorer(monkeypatch):
+    monkeypatch.setattr(candidate_scoring, "_scorer", None)
+    start = threading.Barrier(8)
+    scorers = []
+
+    def fetch():
+        start.wait()
+        scorers.append(candidate_scoring.get_scorer())
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(scorer) for scorer in scorers}) == 1
+
+
+def test_contrast_fallback_prefers_the_detailed_image(monkeypatch):
+    scorer = candidate_scoring.CandidateScorer()
+    scorer._backend = "contrast"
+    monkeypatch.setattr(candidate_scoring, "_scorer", scorer)
+    blank = Image.new("RGB", (8, 8), "gray")
+    checker = Image.new("RGB", (8, 8), "black")
+    checker.paste("white", (0, 0, 4, 8))
+    assert candidate_scoring.rank_candidates("a chart", [blank, checker])[0][0] == 1
@@ -0,0 +1,74 @@
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embedding_store import EmbeddingStore, quantize  # noqa: E402
+
+
+def random_vectors(count, dim=64, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_int8_round_trip_keeps_cosine_similarity(tmp_path):
+    vectors = random_vectors(20)
+    store = EmbeddingStore("kb", directory=str(tmp_path), dtype="int8")
+    store.write([(f"doc{i}", v, {"i": i}) for i, v in enumerate(vectors)])
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for i in range(len(vectors)):
+        assert np.dot(store.vector(i), unit[i]) > 0.995  # int8: ~0.5% error per component
+    assert store.matrix.dtype == np.int8 and store.scales.dtype == np.float32
+    assert store.top_k(vectors[7], 1)[0][0] == 7
+    assert store.metadata[7] == {"i": 7}
+
+
+def test_float16_scores_match_float32(tmp_path):
+    vectors = random_vectors(10)
+    store = EmbeddingStore("styles", directory=str(tmp_path), dtype="float16")
+    store.write([(f"doc{i}", v, None) for i, v in enumerate(vectors)])
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.testing.assert_allclose(store.scores(vectors[3]), unit @ unit[3], atol=2e-3)
+
+
+def test_quantize_rejects_unknown_dtype():
+    with pytest.raises(ValueError):
+        quantize(random_vectors(2), "bfloat16")
+
+
+def test_rewrite_removes_the_previous_version(tmp_path):
+    store = EmbeddingStore("kb", directory=str(tmp_path), dtype="int8")
+    store.write([("a", random_vectors(1)[0], None)])
+    first = sorted(os.listdir(tmp_path))
+    store.write([("b", random_vectors(1, seed=1)[0], None)])
+    files = sorted(f for f in os.listdir(tmp_path) if f.endswith(".npy"))
+    assert len(files) == 2 and not set(files) & set(first)
+    assert store.ids == ["b"]
+
+
+def test_stale_removal_keeps_newer_and_referenced_versions(tmp_path):
+    store = EmbeddingStore("kb", directory=str(tmp_path), dtype="float16")
+    store.write([("a", random_vectors(1)[0], None)])
+    # A concurrent writer's files, saved but not yet published in the table
+    newer = f"kb.{time.time_ns() + 10**9}.vectors.npy"
+    np.save(os.path.join(tmp_path, newer), np.zeros((1, 4), dtype=np.float16))
+    older = f"kb.{time.time_ns() - 10**9}.vectors.npy"
+    np.save(os.path.join(tmp_path, older), np.zeros((1, 4), dtype=np.float16))
+
+    store.write([("b", random_vectors(1, seed=1)[0], None)])
+    files = set(os.listdir(tmp_path))
+    assert newer in files
+    assert older not in files
+
+
+def test_other_process_sees_a_new_version_on_refresh(tmp_path):
+    writer = EmbeddingStore("kb", directory=str(tmp_path))
+    writer.write([("a", random_vectors(1)[0], None)])
+    reader = EmbeddingStore("kb", directory=str(tmp_path))
+    assert reader.ids == ["a"]
+    time.sleep(0.01)  # table mtime must change
+    writer.write([("a", random_vectors(1)[0], None), ("b", random_vectors(1, seed=1)[0], None)])
+    assert reader.refresh()
+    assert reader.ids == ["a", "b"] and reader.row("b") == 1
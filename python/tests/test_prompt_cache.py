@@ -0,0 +1,59 @@
+from prompt_cache import PromptCache, PromptEntry, concept_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+ENTRY = PromptEntry("prompt", "negative", ["style-1"])
+
+
+def test_key_ignores_case_and_whitespace():
+    assert concept_key("Cutting  Flaring ", "CO2: -5%") == concept_key("cutting flaring", "co2:   -5%")
+    assert concept_key("Cutting flaring", "CO2: -5%") != concept_key("Cutting flaring", "CO2: -6%")
+
+
+def test_hit_for_the_same_version():
+    cache = PromptCache(max_entries=4, ttl=60, clock=FakeClock())
+    cache.put("Title", "metrics", 3, ENTRY)
+    assert cache.get("title", "metrics", 3) == ENTRY
+    assert cache.stats["hits"] == 1
+
+
+def test_new_retriever_version_invalidates_older_entries():
+    cache = PromptCache(max_entries=4, ttl=60, clock=FakeClock())
+    cache.put("Title", "metrics", 3, ENTRY)
+    assert cache.get("Title", "metrics", 4) is None
+    assert cache.stats["stale"] == 1
+    assert len(cache) == 0  # dropped, so the rebuilt entry replaces it
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = PromptCache(max_entries=4, ttl=60, clock=clock)
+    cache.put("Title", "metrics", 1, ENTRY)
+    clock.now = 59.9
+    assert cache.get("Title", "metrics", 1) == ENTRY
+    clock.now = 60.0
+    assert cache.get("Title", "metrics", 1) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PromptCache(max_entries=2, ttl=60, clock=FakeClock())
+    cache.put("a", "", 1, ENTRY)
+    cache.put("b", "", 1, ENTRY)
+    cache.get("a", "", 1)
+    cache.put("c", "", 1, ENTRY)
+    assert cache.get("b", "", 1) is None
+    assert cache.get("a", "", 1) == ENTRY and cache.get("c", "", 1) == ENTRY
+    assert cache.stats["evictions"] == 1
+
+
+def test_size_zero_disables_the_cache():
+    cache = PromptCache(max_entries=0)
+    assert cache.put("a", "", 1, ENTRY) == ENTRY
+    assert cache.get("a", "", 1) is None and len(cache) == 0
@@ -0,0 +1,148 @@
+from email.utils import formatdate
+
+import pytest
+
+from services.rate_limit import AdaptiveLimiter, RateLimited, TokenBucket, call_with_limit, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code: int = 200, retry_after: str = None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+
+
+def limiter(clock, **kwargs):
+    options = {"rate_per_minute": 6000, "burst": 100, "max_concurrency": 4, "target_latency": 10.0}
+    options.update(kwargs)
+    return AdaptiveLimiter("test", clock=clock, **options)
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(formatdate(1030.0, usegmt=True), now=1000.0) == pytest.approx(30.0)
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_token_bucket_refills_at_its_rate_and_caps_at_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+    assert bucket.wait_time() == 0.0 and bucket.wait_time() == 0.0
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock.advance(10)
+    assert [bucket.wait_time() for _ in range(3)] == [0.0, 0.0, pytest.approx(0.5)]
+
+
+def test_token_bucket_rejects_a_non_positive_rate():
+    with pytest.raises(ValueError, match="must be positive"):
+        TokenBucket(rate=0, capacity=2)
+    with pytest.raises(ValueError):
+        AdaptiveLimiter("test", rate_per_minute=-1)
+
+
+def test_throttled_response_pauses_the_bucket_for_retry_after():
+    clock = FakeClock()
+    limit = limiter(clock)
+    with limit.request() as call:
+        call.observe(Response(429, retry_after="7"))
+    assert call.was_throttled and call.retry_after == 7.0
+    assert limit.bucket.wait_time() == pytest.approx(7.0)
+    clock.advance(7.5)
+    assert limit.bucket.wait_time() == 0.0
+
+
+def test_throttling_shrinks_the_window_multiplicatively():
+    clock = FakeClock()
+    limit = limiter(clock, max_concurrency=8)
+    limit.limit = 8.0
+    with limit.request() as call:
+        call.throttled(0)
+    assert limit.limit == pytest.approx(8.0 * 0.7)
+    assert limit.stats()["throttled"] == 1
+
+
+def test_one_burst_of_throttled_in_flight_calls_counts_as_one_decrease():
+    clock = FakeClock()
+    limit = limiter(clock, max_concurrency=8)
+    limit.limit = 8.0
+    calls = [limit.request() for _ in range(3)]
+    handles = [c.__enter__() for c in calls]  # three requests admitted before any response
+    clock.advance(1)
+    for c, handle in zip(calls, handles):
+        handle.throttled(0)
+        c.__exit__(None, None, None)
+    assert limit.limit == pytest.approx(8.0 * 0.7)
+
+
+def test_slow_responses_shrink_the_window():
+    clock = FakeClock()
+    limit = limiter(clock, target_latency=10.0)
+    limit.limit = 4.0
+    with limit.request():
+        clock.advance(11)
+    assert limit.limit == pytest.approx(4.0 * 0.7)
+    assert limit.stats()["slow"] == 1
+
+
+def test_window_grows_additively_while_it_is_in_use():
+    clock = FakeClock()
+    limit = limiter(clock, max_concurrency=4)
+    assert limit.limit == 2.0
+    for _ in range(20):
+        first, second = limit.request(), limit.request()
+        first.__enter__(), second.__enter__()
+        first.__exit__(None, None, None)
+        second.__exit__(None, None, None)
+    assert 2.0 < limit.limit <= 4.0
+
+
+def test_growth_slows_near_the_last_throttled_size():
+    clock = FakeClock()
+    limit = limiter(clock, max_concurrency=8)
+    limit.limit = 4.0
+    with limit.request() as call:
+        call.throttled(0)
+    clock.advance(1)
+    limit.limit = 3.5  # just under the size that was throttled
+    before = limit.limit
+    first, second, third = limit.request(), limit.request(), limit.request()
+    for c in (first, second, third):
+        c.__enter__()
+    third.__exit__(None, None, None)
+    assert limit.limit - before == pytest.approx(1.0 / before / 4.0)
+    first.__exit__(None, None, None)
+    second.__exit__(None, None, None)
+
+
+def test_local_wait_timeout_raises_rate_limited():
+    clock = FakeClock()
+    limit = limiter(clock, max_concurrency=1, burst=1)
+    limit.limit = 1.0
+    holder = limit.request()
+    holder.__enter__()
+    with pytest.raises(RateLimited):
+        with limit.request(timeout=0):
+            pass
+    holder.__exit__(None, None, None)
+    assert limit.stats()["timeouts"] == 1
+
+
+def test_call_with_limit_retries_throttled_calls_then_gives_up():
+    limit = AdaptiveLimiter("test", rate_per_minute=60000, burst=10, max_concurrency=2)
+    responses = iter([Response(429, retry_after="0"), Response(200)])
+    assert call_with_limit(limit, lambda: next(responses)).status_code == 200
+
+    with pytest.raises(RateLimited, match="still throttled after 2 attempts"):
+        call_with_limit(limit, lambda: Response(503, retry_after="0"), attempts=2)
@@ -0,0 +1,26 @@
+import pytest
+
+from services import samplers
+
+
+class Pipe:
+    scheduler = "model-default"
+
+
+def test_apply_sampler_keeps_the_model_scheduler_when_nothing_is_configured(monkeypatch):
+    monkeypatch.setattr(samplers, "DEFAULT_SAMPLER", None)
+    pipe = Pipe()
+    samplers.apply_sampler(pipe)
+    assert pipe.scheduler == "model-default"
+
+
+def test_draft_preset_uses_lcm_only_on_lcm_models(monkeypatch):
+    monkeypatch.setattr(samplers, "LCM_MODEL_IDS", {"org/sd15-lcm-lora-fused"})
+    assert samplers.resolve_preset("draft", "CompVis/stable-diffusion-v1-4")["sampler"] == "dpmpp_2m_karras"
+    assert samplers.resolve_preset("draft", "org/sd15-lcm-lora-fused")["sampler"] == "lcm"
+    assert samplers.resolve_preset("draft", "SimianLuo/LCM_Dreamshaper_v7")["num_steps"] == 4
+
+
+def test_unknown_preset_is_rejected():
+    with pytest.raises(ValueError):
+        samplers.resolve_preset("ultra")
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from services import scheduler as scheduler_module
+from services.scheduler import GenerationScheduler, Priority
+
+
+@pytest.fixture
+def scheduler():
+    return GenerationScheduler(lambda model: f"pipe:{model}")
+
+
+def hold(scheduler):
+    """Occupy the scheduler until the returned event is set, so later jobs queue up behind it"""
+    release, started = threading.Event(), threading.Event()
+
+    def _blocker(pipe, step_callback):
+        started.set()
+        release.wait(5)
+
+    scheduler.submit(_blocker, Priority.BACKGROUND)
+    assert started.wait(5)
+    return release
+
+
+def recorder(order, name):
+    def _job(pipe, step_callback):
+        order.append(name)
+        return name
+    return _job
+
+
+def test_interactive_jobs_run_before_queued_background_jobs(scheduler):
+    order = []
+    release = hold(scheduler)
+    background = scheduler.submit(recorder(order, "background"), Priority.BACKGROUND)
+    interactive = scheduler.submit(recorder(order, "interactive"), Priority.INTERACTIVE)
+    release.set()
+    assert background.result(5) == "background" and interactive.result(5) == "interactive"
+    assert order == ["interactive", "background"]
+
+
+def test_aged_background_job_overtakes_a_fresh_interactive_job(scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "AGING_SECONDS", 0.05)
+    order = []
+    release = hold(scheduler)
+    background = scheduler.submit(recorder(order, "background"), Priority.BACKGROUND)
+    threading.Event().wait(0.2)  # four priority levels of aging
+    interactive = scheduler.submit(recorder(order, "interactive"), Priority.INTERACTIVE)
+    release.set()
+    background.result(5)
+    interactive.result(5)
+    assert order == ["background", "interactive"]
+
+
+def stepped_job(events, steps=10, interactive_submitted=None):
+    """Background job that walks `steps` step callbacks; signals after its first step"""
+    def _job(pipe, step_callback):
+        events.append("background:start")
+        for step in range(steps):
+            step_callback(pipe, step, None, {})
+            if step == 0 and interactive_submitted is not None and not interactive_submitted.is_set():
+                interactive_submitted.wait(5)
+        events.append("background:done")
+        return "background"
+    return _job
+
+
+def test_background_job_is_preempted_at_a_step_boundary_and_resumed(scheduler):
+    events = []
+    submitted = threading.Event()
+    background = scheduler.submit(stepped_job(events, interactive_submitted=submitted), Priority.BACKGROUND, steps=10)
+    while not events:
+        threading.Event().wait(0.01)
+    interactive = scheduler.submit(recorder(events, "interactive"), Priority.INTERACTIVE)
+    submitted.set()
+
+    assert interactive.result(5) == "interactive"
+    assert background.result(5) == "background"
+    assert events == ["background:start", "interactive", "background:start", "background:done"]
+    assert scheduler.stats()["background"]["preempted"] == 1
+
+
+def test_background_job_past_the_progress_limit_is_not_preempted(scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "PREEMPT_MAX_PROGRESS", 0.05)
+    events = []
+    submitted = threading.Event()
+    background = scheduler.submit(stepped_job(events, interactive_submitted=submitted), Priority.BACKGROUND, steps=10)
+    while not events:
+        threading.Event().wait(0.01)
+    interactive = scheduler.submit(recorder(events, "interactive"), Priority.INTERACTIVE)
+    submitted.set()
+
+    background.result(5)
+    interactive.result(5)
+    assert events == ["background:start", "background:done", "interactive"]
+    assert scheduler.stats()["background"]["preempted"] == 0
+
+
+def test_failed_job_reports_its_exception(scheduler):
+    def _boom(pipe, step_callback):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        scheduler.run(_boom, timeout=5)
+    assert scheduler.stats()["interactive"]["failed"] == 1
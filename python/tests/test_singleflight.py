@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+class ManualStarter:
+    """Starter whose shared job finishes only when the test says so"""
+
+    def __init__(self):
+        self.calls = 0
+        self.future = None
+        self.cancel_event = None
+
+    def __call__(self, cancel_event: threading.Event) -> Future:
+        self.calls += 1
+        self.cancel_event = cancel_event
+        self.future = Future()
+        return self.future
+
+
+def test_concurrent_callers_share_one_job():
+    flight, start = SingleFlight(), ManualStarter()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.run("key", start, timeout=5))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["coalesced"] < 3:
+        threading.Event().wait(0.01)
+    start.future.set_result("image")
+    for thread in threads:
+        thread.join()
+    assert results == ["image"] * 4
+    assert start.calls == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_job_is_cancelled_only_when_the_last_waiter_leaves():
+    flight, start = SingleFlight(), ManualStarter()
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.run_async("key", start))
+        second = asyncio.ensure_future(flight.run_async("key", start))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert not start.cancel_event.is_set()  # the second waiter still wants it
+
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+
+    asyncio.run(scenario())
+    assert start.calls == 1
+    assert start.cancel_event.is_set()
+    assert start.future.cancelled()
+    assert flight.stats()["cancelled"] == 1
+
+
+def test_waiter_timeout_leaves_the_job_running_for_others():
+    flight, start = SingleFlight(), ManualStarter()
+    holder = threading.Thread(target=lambda: flight.run("key", start, timeout=5))
+    holder.start()
+    while start.future is None:
+        threading.Event().wait(0.01)
+    with pytest.raises(FutureTimeoutError):
+        flight.run("key", start, timeout=0.01)
+    assert not start.cancel_event.is_set()
+    start.future.set_result("image")
+    holder.join()
+
+
+def test_a_finished_key_starts_a_new_job():
+    flight, start = SingleFlight(), ManualStarter()
+    holder = threading.Thread(target=lambda: flight.run("key", start, timeout=5))
+    holder.start()
+    while start.future is None:
+        threading.Event().wait(0.01)
+    start.future.set_result("first")
+    holder.join()
+
+    follow_up = threading.Thread(target=lambda: flight.run("key", start, timeout=5))
+    follow_up.start()
+    while start.calls < 2:
+        threading.Event().wait(0.01)
+    start.future.set_result("second")
+    follow_up.join()
+    assert start.calls == 2
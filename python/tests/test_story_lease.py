@@ -0,0 +1,144 @@
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+
+from story_lease import (
+    LEASE_EXPIRES_FIELD, LEASE_OWNER_FIELD, InMemoryLeaseStore, StoryLease, StoryLeaseManager, lease_is_active,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+
+
+def pending_store(*doc_ids):
+    return InMemoryLeaseStore({doc_id: {"aiInfographicConcept": {"title": doc_id}, "aiGeneratedImageUrl": "pending"}
+                               for doc_id in doc_ids})
+
+
+def managers(store, clock, *owners, lease_seconds=60):
+    return [StoryLeaseManager(store, owner_id=owner, lease_seconds=lease_seconds, clock=clock) for owner in owners]
+
+
+def test_two_managers_racing_for_one_story_only_one_wins():
+    store, clock = pending_store("story-1"), FakeClock()
+    racers = managers(store, clock, *(f"worker-{i}" for i in range(8)))
+    start = threading.Barrier(len(racers))
+    leases = []
+
+    def claim(manager):
+        start.wait()
+        leases.append(manager.try_claim("story-1"))
+
+    threads = [threading.Thread(target=claim, args=(manager,)) for manager in racers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    won = [lease for lease in leases if lease is not None]
+    assert len(won) == 1
+    assert store.documents["story-1"][LEASE_OWNER_FIELD] == won[0].manager.owner_id
+
+
+def test_active_lease_blocks_others_and_own_reclaim_is_allowed():
+    store, clock = pending_store("story-1"), FakeClock()
+    a, b = managers(store, clock, "a", "b")
+    assert a.try_claim("story-1") is not None
+    assert b.try_claim("story-1") is None
+    assert a.try_claim("story-1") is not None
+
+
+def test_expired_lease_is_taken_over():
+    store, clock = pending_store("story-1"), FakeClock()
+    a, b = managers(store, clock, "a", "b", lease_seconds=60)
+    a.try_claim("story-1")
+    clock.advance(59)
+    assert b.try_claim("story-1") is None
+    clock.advance(2)
+    assert not lease_is_active(store.documents["story-1"], clock())
+    assert b.try_claim("story-1") is not None
+    assert store.documents["story-1"][LEASE_OWNER_FIELD] == "b"
+
+
+def test_renewal_extends_expiry_and_is_rejected_for_a_non_owner():
+    store, clock = pending_store("story-1"), FakeClock()
+    a, b = managers(store, clock, "a", "b", lease_seconds=60)
+    lease = a.try_claim("story-1")
+    clock.advance(30)
+    assert a.renew(lease)
+    assert store.documents["story-1"][LEASE_EXPIRES_FIELD] == clock() + timedelta(seconds=60)
+
+    expires_at = store.documents["story-1"][LEASE_EXPIRES_FIELD]
+    assert not b.renew(StoryLease(b, "story-1", expires_at))
+    assert store.documents["story-1"][LEASE_OWNER_FIELD] == "a"
+    assert store.documents["story-1"][LEASE_EXPIRES_FIELD] == expires_at
+
+
+def test_commit_after_the_lease_is_lost_is_discarded():
+    store, clock = pending_store("story-1"), FakeClock()
+    a, b = managers(store, clock, "a", "b", lease_seconds=60)
+    lease = a.try_claim("story-1")
+    clock.advance(61)
+    assert b.try_claim("story-1") is not None
+
+    assert not a.renew(lease)
+    assert not lease.commit({"aiGeneratedImageUrl": "https://example.com/a.png"})
+    assert lease.lost
+    assert store.documents["story-1"]["aiGeneratedImageUrl"] == "pending"
+    assert store.documents["story-1"][LEASE_OWNER_FIELD] == "b"
+
+
+def test_commit_by_owner_writes_updates_and_clears_the_lease():
+    store, clock = pending_store("story-1"), FakeClock()
+    (a,) = managers(store, clock, "a")
+    lease = a.try_claim("story-1")
+    assert lease.commit({"aiGeneratedImageUrl": "https://example.com/a.png"})
+    document = store.documents["story-1"]
+    assert document["aiGeneratedImageUrl"] == "https://example.com/a.png"
+    assert document[LEASE_OWNER_FIELD] is None and document[LEASE_EXPIRES_FIELD] is None
+    # Done: nobody claims it again unless it is a refresh
+    assert a.try_claim("story-1") is None
+    assert a.try_claim("story-1", refresh=True) is not None
+
+
+def test_release_lets_another_worker_claim_immediately():
+    store, clock = pending_store("story-1"), FakeClock()
+    a, b = managers(store, clock, "a", "b")
+    with a.try_claim("story-1"):
+        assert b.try_claim("story-1") is None
+    assert b.try_claim("story-1") is not None
+
+
+def test_workers_split_a_backlog_without_duplicates():
+    doc_ids = [f"story-{i}" for i in range(40)]
+    store, clock = pending_store(*doc_ids), FakeClock()
+    workers = managers(store, clock, "a", "b", "c")
+    claimed = {worker.owner_id: [] for worker in workers}
+    start = threading.Barrier(len(workers))
+
+    def work(manager):
+        start.wait()
+        for doc_id in manager.order_candidates(doc_ids):
+            lease = manager.try_claim(doc_id)
+            if lease is not None:
+                time.sleep(0.002)  # "generate"
+                assert lease.commit({"aiGeneratedImageUrl": f"https://example.com/{doc_id}.png"})
+                claimed[manager.owner_id].append(doc_id)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_claimed = [doc_id for ids in claimed.values() for doc_id in ids]
+    assert sorted(all_claimed) == sorted(doc_ids)
+    assert all(claimed.values())  # per-worker ordering spreads the work
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("PIL")
+
+from story_refresh import CONCEPT_HASH_FIELD, SEED_FIELD, concept_fingerprint, story_needs_refresh  # noqa: E402
+
+IMAGE_URL = "https://storage.googleapis.com/bucket/images/story-1.png"
+
+
+def rendered_story(title="Cutting flaring", metrics="Flaring: -20%"):
+    """A story as the monitor leaves it after a local render"""
+    return {
+        "aiInfographicConcept": {"title": title, "keyMetrics": [{"label": "Flaring", "value": "-20%"}]},
+        "aiGeneratedImageUrl": IMAGE_URL,
+        "imageGenerationStatus": "completed",
+        "imageGeneratedBy": "stable-diffusion-local",
+        SEED_FIELD: 1234,
+        CONCEPT_HASH_FIELD: concept_fingerprint(title, metrics),
+    }
+
+
+def test_edited_concept_with_valid_url_needs_refresh():
+    story = rendered_story()
+    # What updateStoryConcept writes: new concept, image URL and status untouched
+    story["aiInfographicConcept"] = {"title": "Cutting flaring", "keyMetrics": [{"label": "Flaring", "value": "-35%"}]}
+    assert story_needs_refresh(story, concept_fingerprint("Cutting flaring", "Flaring: -35%"))
+
+
+def test_unchanged_concept_does_not_refresh():
+    assert not story_needs_refresh(rendered_story(), concept_fingerprint("Cutting flaring", "Flaring: -20%"))
+
+
+def test_placeholder_url_is_a_new_render_not_a_refresh():
+    story = rendered_story()
+    story["aiGeneratedImageUrl"] = "Pending local generation"
+    assert not story_needs_refresh(story, concept_fingerprint("Cutting flaring", "Flaring: -35%"))
+
+
+def test_render_without_seed_or_from_api_is_not_refreshable():
+    unseeded = rendered_story()
+    del unseeded[SEED_FIELD]
+    from_api = {**rendered_story(), "imageGeneratedBy": "gemini"}
+    fingerprint = concept_fingerprint("Cutting flaring", "Flaring: -35%")
+    assert not story_needs_refresh(unseeded, fingerprint)
+    assert not story_needs_refresh(from_api, fingerprint)
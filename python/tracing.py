@@ -0,0 +1,176 @@
+"""
+Story Tracing
+Lightweight spans for the image pipeline, exported as OTLP/JSON lines (the OpenTelemetry file-exporter format)
+to a rotating local file. Each finished trace is one line: an ExportTraceServiceRequest with all of its spans,
+so the file can be replayed into Jaeger/Tempo with the collector's `otlpjsonfile` receiver or opened in any
+OTLP-aware viewer
+
+Usage:
+    with start_span("process_story", **{"story.id": doc_id}):
+        with start_span("rag.retrieve"):
+            ...
+        trace_id = current_trace_id()   # written onto the story as imageTraceId
+"""
+import os
+import json
+import time
+import socket
+import logging
+import secrets
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+USE_TRACING = os.environ.get("USE_TRACING", "true").lower() in ("1", "true", "yes")  # Export per-story spans
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "story_traces.jsonl"))
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))  # Rotate the trace file at this size
+TRACE_BACKUP_COUNT = int(os.environ.get("TRACE_BACKUP_COUNT", "5"))  # Rotated files kept
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "vera-local-image-generator")
+
+logger = logging.getLogger(__name__)
+
+# OTLP enums
+SPAN_KIND_INTERNAL = 1
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_export_logger: Optional[logging.Logger] = None
+
+
+def _otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # OTLP/JSON encodes int64 as a string
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """One timed operation; children share its trace id and buffer into the root until it ends"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict] = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict] = []
+        self.status_code = STATUS_OK
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.root = parent.root if parent else self
+        self._finished: List["Span"] = [] if parent is None else None  # only the root collects
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"name": name, "time": time.time_ns(), "attributes": attributes})
+
+    def record_error(self, error: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+        self.add_event("exception", **{"exception.type": type(error).__name__, "exception.message": str(error)[:500]})
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "events": [
+                {"timeUnixNano": str(e["time"]), "name": e["name"],
+                 "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in e["attributes"].items()]}
+                for e in self.events
+            ],
+            "status": {"code": self.status_code, **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+
+def _get_export_logger() -> logging.Logger:
+    global _export_logger
+    if _export_logger is None:
+        os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+        export_logger = logging.getLogger("story_trace_export")
+        export_logger.propagate = False
+        export_logger.setLevel(logging.INFO)
+        handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        export_logger.addHandler(handler)
+        _export_logger = export_logger
+    return _export_logger
+
+
+def _export(spans: List[Span]):
+    request = {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                {"key": "host.name", "value": {"stringValue": socket.gethostname()}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "vera.tracing"}, "spans": [span.to_otlp() for span in spans]}],
+        }]
+    }
+    try:
+        _get_export_logger().info(json.dumps(request, separators=(",", ":")))
+    except Exception as e:
+        logger.warning(f"[Tracing] Failed to export trace {spans[0].trace_id}: {e}")
+
+
+@contextmanager
+def start_span(name: str, **attributes):
+    """Time the block as a child of the current span (or as a new trace); errors mark the span and re-raise"""
+    if not USE_TRACING:
+        yield _NOOP_SPAN
+        return
+    span = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(token)
+        span.root._finished.append(span)
+        if span.parent is None:
+            _export(span._finished)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()